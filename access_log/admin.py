@@ -1,8 +1,16 @@
-# from django.contrib import admin
-# from .models import AccessLog
+from django.contrib import admin
+from sealevel.paginator import EstimatedCountPaginator
+from .models import AuditEvent
 
-# @admin.register(AccessLog)
-# class AccessLogAdmin(admin.ModelAdmin):
-#     list_display = ('id', 'user', 'file', 'action', 'timestamp')
-#     search_fields = ('user__email', 'file__file')
-#     list_filter = ('action', 'timestamp')
\ No newline at end of file
+
+@admin.register(AuditEvent)
+class AuditEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'file', 'status', 'attempts', 'signature', 'created_at')
+    list_filter = ('status',)
+    date_hierarchy = 'created_at'
+    search_fields = ('=signature',)
+    list_select_related = ('file',)
+    raw_id_fields = ('file',)
+    ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
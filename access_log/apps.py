@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AccessLogConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "access_log"
+
+    def ready(self):
+        from monitoring.metrics import PROMETHEUS_AVAILABLE, register_scrape_collector
+        if PROMETHEUS_AVAILABLE:
+            from .metrics import AuditQueueCollector
+            register_scrape_collector(AuditQueueCollector())
@@ -0,0 +1,27 @@
+"""
+Recording accesses in the audit trail.
+
+Every access is written as an AuditEvent keyed by the file's owner,
+whether or not the chain is in use: the patient's timeline and the live
+access log read nothing else. Sending the memo to the chain is a separate
+step (solana_utils.submit_event) for events recorded as queued; with the
+chain off they are recorded as local and stay that way.
+"""
+
+import time
+
+from .memo import encode_memo
+from .models import AuditEvent
+
+
+def record_access(user, action, file, target=None, digest=None, queued=True):
+    """
+    Write the AuditEvent for ``action`` (one of memo.ACTION_CODES) by
+    ``user`` on ``file``, queued for the chain or, with ``queued=False``,
+    kept local.
+    """
+    # Ids only, never emails or file names
+    memo = encode_memo(action, user.id, file.id, time.time(), target.id if target else None, digest)
+    return AuditEvent.objects.create(
+        file=file, owner_id=file.owner_id, memo=memo, status='queued' if queued else 'local',
+    )
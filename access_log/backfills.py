@@ -0,0 +1,20 @@
+from backfills.runner import Backfill, register
+
+
+@register
+class AuditEventOwnerBackfill(Backfill):
+    """Owner for audit events recorded before the patient timeline existed."""
+    name = 'audit-event-owner'
+    model = 'access_log.AuditEvent'
+    fields = ['owner']
+
+    def get_queryset(self):
+        # Events whose file is gone can't be attributed and stay off the timeline
+        return super().get_queryset().filter(owner__isnull=True, file__isnull=False).select_related('file').only(
+            'pk', 'owner', 'file__owner',
+        )
+
+    def process(self, objects):
+        for event in objects:
+            event.owner_id = event.file.owner_id
+        return objects
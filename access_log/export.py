@@ -0,0 +1,283 @@
+"""
+Streaming audit export across many files, for compliance requests.
+
+Each file's history is read from the chain page by page, newest first, by
+its own task, with one semaphore capping RPC calls in flight across all of
+them. Tasks hand memos to the merger through one-item queues and the
+merger always emits the newest head. Pages are sized so that all files'
+pages together hold at most EXPORT_MEMO_BUDGET memos, so memory stays
+fixed however long the histories are and grows with the number of files
+only by a head memo (and a File row) each. The export runs on its own
+event loop thread and reaches the (WSGI) response through one more
+bounded queue.
+"""
+
+import asyncio
+import csv
+import heapq
+import json
+import logging
+import os
+import queue
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+
+from users.models import User
+from .memo import MemoDecodeError, decode_memo
+from .models import AuditEvent
+from .solana_utils import (
+    SOLANA_AVAILABLE, ChainMemo, describe_action, fetch_legacy_memos, fetch_signature_page,
+    file_reference_keypair, rpc_session,
+)
+
+logger = logging.getLogger('solana')
+
+# RPC calls in flight for one export, across all of its files
+EXPORT_CONCURRENCY = 8
+EXPORT_PAGE_SIZE = 250
+# Memos fetched ahead of the merge, across all of an export's files
+EXPORT_MEMO_BUDGET = 5000
+# Memos queued per source between its task and the merge
+EXPORT_QUEUE_SIZE = 1
+# Rows buffered between the export thread and the response
+EXPORT_BUFFER_ROWS = 1000
+LOCAL_EVENTS_BATCH = 500
+
+FIELDS = ['timestamp', 'file_id', 'file_name', 'user', 'action', 'signature', 'status']
+ExportRow = namedtuple('ExportRow', FIELDS)
+
+_DONE = object()
+
+
+class ExportFailed(Exception):
+    pass
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+async def _chain_memos(rpc, semaphore, file, start, end, out, page_size):
+    """Feed ``file``'s on-chain memos within [start, end) to ``out``, newest first."""
+    address = file_reference_keypair(file.id).pubkey()
+    before = None
+    while True:
+        async with semaphore:
+            memos, before = await fetch_signature_page(rpc, address, before=before, limit=page_size)
+        for memo in memos:
+            if memo.block_time is not None and memo.block_time >= end:
+                continue
+            if memo.block_time is not None and memo.block_time < start:
+                # Everything older, legacy memos included, is out of range
+                return
+            await out.put((memo.block_time or end, file, memo))
+        if before is None:
+            break
+
+    if file.transaction_ids:
+        async with semaphore:
+            legacy = await fetch_legacy_memos(rpc, file.transaction_ids)
+        legacy.sort(key=lambda memo: memo.block_time or 0, reverse=True)
+        for memo in legacy:
+            if start <= (memo.block_time or 0) < end:
+                await out.put((memo.block_time, file, memo))
+
+
+async def _local_memos(files, by_id, start, end, out):
+    """
+    Feed audit events on the ``files`` queryset that are not (yet) readable
+    from the chain to ``out``, newest first.
+    """
+    start_dt = datetime.fromtimestamp(start, tz=timezone.utc)
+    end_dt = datetime.fromtimestamp(end, tz=timezone.utc)
+    events = AuditEvent.objects.filter(
+        file_id__in=files.values('id'), created_at__gte=start_dt, created_at__lt=end_dt,
+        status__in=('local', 'queued', 'pending', 'failed'),
+    ).order_by('-created_at', '-id')
+
+    @sync_to_async
+    def batch(cursor):
+        page = events
+        if cursor:
+            page = page.filter(Q(created_at__lt=cursor[0]) | Q(created_at=cursor[0], id__lt=cursor[1]))
+        return list(page[:LOCAL_EVENTS_BATCH])
+
+    cursor = None
+    while True:
+        page = await batch(cursor)
+        for event in page:
+            memo = ChainMemo(event.signature, None, event.memo, event.status)
+            await out.put((event.created_at.timestamp(), by_id[event.file_id], memo))
+        if len(page) < LOCAL_EVENTS_BATCH:
+            return
+        cursor = (page[-1].created_at, page[-1].id)
+
+
+async def _feed(source, out):
+    try:
+        await source
+    except Exception as e:
+        await out.put(_Failure(e))
+    await out.put(_DONE)
+
+
+async def merged_memos(files, start, end):
+    """
+    ``(file, ChainMemo)`` for every memo on the ``files`` queryset between
+    the unix times ``start`` and ``end``, newest first. Raises ExportFailed
+    if any history can't be read.
+    """
+    semaphore = asyncio.Semaphore(EXPORT_CONCURRENCY)
+    files = files.only('id', 'uploaded_file', 'transaction_ids').order_by('id')
+    # Pending events may already be on chain; only these need de-duplicating
+    pending = set(await sync_to_async(list)(
+        AuditEvent.objects.filter(file__in=files.values('id'), status='pending').exclude(signature='')
+        .values_list('signature', flat=True)
+    ))
+    emitted = set()
+    file_count = await files.acount()
+    page_size = max(1, min(EXPORT_PAGE_SIZE, EXPORT_MEMO_BUDGET // max(file_count, 1)))
+
+    async with rpc_session() as rpc:
+        by_id = {}
+        queues, tasks = [], []
+
+        def start_source(source):
+            out = asyncio.Queue(maxsize=EXPORT_QUEUE_SIZE)
+            queues.append(out)
+            tasks.append(asyncio.ensure_future(_feed(source(out), out)))
+
+        if SOLANA_AVAILABLE:
+            async for file in files.aiterator():
+                by_id[file.id] = file
+                start_source(lambda out, file=file: _chain_memos(rpc, semaphore, file, start, end, out, page_size))
+        else:
+            by_id = {file.id: file async for file in files.aiterator()}
+        start_source(lambda out: _local_memos(files, by_id, start, end, out))
+
+        async def advance(index):
+            item = await queues[index].get()
+            if isinstance(item, _Failure):
+                raise ExportFailed(f"could not read audit history: {item.error!r}") from item.error
+            if item is not _DONE:
+                key, file, memo = item
+                heapq.heappush(heads, (-key, index, file, memo))
+
+        try:
+            heads = []
+            for index in range(len(queues)):
+                await advance(index)
+            while heads:
+                _, index, file, memo = heapq.heappop(heads)
+                if memo.signature in pending:
+                    if memo.signature in emitted:
+                        await advance(index)
+                        continue
+                    emitted.add(memo.signature)
+                yield file, memo
+                await advance(index)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def export_rows(files, start, end):
+    """Decoded ExportRows for merged_memos(), newest first."""
+    users = {}
+    async for file, chain_memo in merged_memos(files, start, end):
+        try:
+            records = decode_memo(chain_memo.memo, file.uploaded_file.name)
+        except MemoDecodeError as e:
+            logger.warning("Undecodable memo on file %s: %s", file.id, e)
+            continue
+        missing = {id for record in records for id in (record.user_id, record.target_id) if id and id not in users}
+        if missing:
+            # Deleted users stay unknown rather than being looked up again
+            users.update(dict.fromkeys(missing))
+            users.update(await sync_to_async(User.objects.in_bulk)(missing))
+        for record in records:
+            user = users.get(record.user_id)
+            unix_time = record.timestamp or chain_memo.block_time
+            yield ExportRow(
+                timestamp=datetime.fromtimestamp(unix_time, tz=timezone.utc).isoformat() if unix_time else '',
+                file_id=file.id,
+                file_name=os.path.basename(file.uploaded_file.name),
+                user=user.email if user else record.user_email or 'unknown user',
+                action=describe_action(record, users),
+                signature=chain_memo.signature,
+                status=chain_memo.status,
+            )
+
+
+def stream_rows(files, start, end):
+    """
+    Iterate export_rows() from synchronous code. The export runs on its
+    own event loop thread, at most EXPORT_BUFFER_ROWS ahead of the reader,
+    and stops if the reader goes away.
+    """
+    buffer = queue.Queue(maxsize=EXPORT_BUFFER_ROWS)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    async def produce():
+        async for row in export_rows(files, start, end):
+            # Blocking here pauses the whole loop, which is the backpressure we want
+            if not put(row):
+                return
+
+    def run():
+        try:
+            asyncio.run(produce())
+        except Exception as e:
+            put(_Failure(e))
+        put(_DONE)
+
+    thread = threading.Thread(target=run, name='audit-export', daemon=True)
+    thread.start()
+    try:
+        while (item := buffer.get()) is not _DONE:
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    try:
+        for row in rows:
+            yield writer.writerow(row)
+    except ExportFailed as e:
+        # The response has already started, so the file itself must say so
+        logger.warning("Audit export cut short: %s", e)
+        yield writer.writerow(['EXPORT INCOMPLETE', '', '', '', str(e), '', ''])
+
+
+def render_jsonl(rows):
+    try:
+        for row in rows:
+            yield json.dumps(row._asdict()) + '\n'
+    except ExportFailed as e:
+        logger.warning("Audit export cut short: %s", e)
+        yield json.dumps({'error': 'export incomplete', 'detail': str(e)}) + '\n'
@@ -0,0 +1,238 @@
+"""
+Live access-log updates, streamed to the access log page as Server-Sent
+Events.
+
+Every access is written to an AuditEvent before it reaches the chain, and
+every later status change (pending, confirmed, finalized, failed) bumps
+its updated_at, so a file's log only needs following in the database:
+no chain reads at all. Each process runs one poll per file being watched,
+however many viewers it has, and fans the changes out to their queues.
+Changes are keyed by (updated_at, id); the key is the SSE event id, so a
+reconnecting client sends it back as Last-Event-ID and catches up with a
+single query of its own before joining the shared feed.
+
+updated_at is stamped before its transaction commits, so a change can
+become visible behind a key already sent. Every read therefore starts
+OVERLAP behind its cursor and drops the keys it has already delivered. A
+reconnecting client may be sent a change from that window again; the page
+matches changes to entries by event, so that is harmless.
+"""
+
+import asyncio
+import json
+import logging
+import weakref
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+
+from users.models import User
+from .memo import MemoDecodeError, decode_memo
+from .models import AuditEvent
+from .solana_utils import describe_action
+
+logger = logging.getLogger('solana')
+
+# Changes read per query, by the feed and by catch-up
+PAGE_SIZE = 200
+# Changes a slow viewer may fall behind by before it is dropped (it
+# reconnects and catches up from its Last-Event-ID)
+SUBSCRIBER_QUEUE_SIZE = 500
+# Sent when nothing has happened, so proxies keep the connection open
+HEARTBEAT_SECONDS = 15
+# How far behind its cursor each read starts, for changes that committed
+# after later ones were already read
+OVERLAP = timedelta(seconds=5)
+
+Change = namedtuple('Change', 'key event_id signature status entries')
+
+
+EPOCH = datetime.fromtimestamp(0, tz=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def format_key(key):
+    updated_at, event_id = key
+    return f'{(updated_at - EPOCH) // MICROSECOND}-{event_id}'
+
+
+def parse_key(value):
+    """The (updated_at, id) key of an event id sent back by a client, or None."""
+    try:
+        micros, event_id = value.split('-')
+        return EPOCH + int(micros) * MICROSECOND, int(event_id)
+    except (AttributeError, ValueError, OverflowError, OSError):
+        return None
+
+
+@sync_to_async
+def latest_key(file_id):
+    last = AuditEvent.objects.filter(file_id=file_id).order_by('-updated_at', '-id').values_list('updated_at', 'id').first()
+    return tuple(last) if last else (EPOCH, 0)
+
+
+@sync_to_async
+def changes_after(file, key):
+    """Up to PAGE_SIZE of ``file``'s events created or updated after ``key``, oldest first."""
+    updated_at, event_id = key
+    events = list(
+        AuditEvent.objects.filter(file_id=file.id)
+        .filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=event_id))
+        .order_by('updated_at', 'id')[:PAGE_SIZE]
+    )
+    decoded = []
+    for event in events:
+        try:
+            decoded.append((event, decode_memo(event.memo, file.uploaded_file.name)))
+        except MemoDecodeError as e:
+            logger.warning("Undecodable memo on file %s: %s", file.id, e)
+            decoded.append((event, []))
+
+    user_ids = {id for _, records in decoded for record in records for id in (record.user_id, record.target_id) if id}
+    users = User.objects.in_bulk(user_ids) if user_ids else {}
+    result = []
+    for event, records in decoded:
+        entries = []
+        for record in records:
+            user = users.get(record.user_id)
+            unix_time = record.timestamp or event.created_at.timestamp()
+            entries.append({
+                'timestamp': datetime.fromtimestamp(unix_time, tz=timezone.utc).isoformat(),
+                'user': user.email if user else record.user_email or 'unknown user',
+                'action': describe_action(record, users),
+            })
+        result.append(Change((event.updated_at, event.id), event.id, event.signature, event.status, entries))
+    return result
+
+
+class _Cursor:
+    """The newest key a reader has delivered, and the keys it delivered within OVERLAP of it."""
+
+    def __init__(self, key):
+        self.key = key
+        # The reader's own starting key was delivered before it got it
+        self.seen = {key}
+
+    def accept(self, change):
+        """True the first time ``change`` is offered."""
+        if change.key in self.seen:
+            return False
+        self.seen.add(change.key)
+        if change.key > self.key:
+            self.key = change.key
+            floor = self.key[0] - OVERLAP
+            self.seen = {key for key in self.seen if key[0] >= floor}
+        return True
+
+
+async def _read(file, cursor):
+    """Changes to ``file``'s events that ``cursor`` hasn't had yet, oldest first."""
+    since = (cursor.key[0] - OVERLAP, 0)
+    while True:
+        page = await changes_after(file, since)
+        for change in page:
+            if cursor.accept(change):
+                yield change
+        if len(page) < PAGE_SIZE:
+            return
+        since = page[-1].key
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = False
+
+
+class _Feed:
+    """One poll of a file's audit events, shared by everyone watching it in this process."""
+
+    def __init__(self, file, key):
+        self.file = file
+        self.cursor = _Cursor(key)
+        self.subscribers = set()
+        self.task = asyncio.ensure_future(self.run())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(settings.ACCESS_LOG_LIVE_POLL_INTERVAL)
+            try:
+                async for change in _read(self.file, self.cursor):
+                    self.publish(change)
+            except Exception:
+                logger.exception("Live access log poll failed for file %s", self.file.id)
+
+    def publish(self, change):
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(change)
+            except asyncio.QueueFull:
+                subscriber.dropped = True
+                self.subscribers.discard(subscriber)
+
+
+# Feeds per event loop (one under ASGI), then per file id
+_feeds = weakref.WeakKeyDictionary()
+
+
+def _join(file, key):
+    feeds = _feeds.setdefault(asyncio.get_running_loop(), {})
+    feed = feeds.get(file.id)
+    if feed is None:
+        feed = feeds[file.id] = _Feed(file, key)
+    subscriber = _Subscriber()
+    feed.subscribers.add(subscriber)
+    return feed, subscriber
+
+
+def _leave(feed, subscriber):
+    feed.subscribers.discard(subscriber)
+    if not feed.subscribers:
+        feed.task.cancel()
+        feeds = _feeds.get(asyncio.get_running_loop(), {})
+        if feeds.get(feed.file.id) is feed:
+            del feeds[feed.file.id]
+
+
+async def catch_up(file, key):
+    """Every change to ``file``'s events after ``key`` (or within OVERLAP of it), from the database."""
+    async for change in _read(file, _Cursor(key)):
+        yield change
+
+
+async def follow(file, key):
+    """
+    Changes to ``file``'s events after ``key``, as they happen; None
+    every HEARTBEAT_SECONDS when there are none. Ends if the reader falls
+    too far behind.
+    """
+    feed, subscriber = _join(file, key)
+    cursor = _Cursor(key)
+    try:
+        # Anything the shared feed already passed is read here; the queue
+        # holds everything from the moment we joined, so nothing falls between
+        async for change in _read(file, cursor):
+            yield change
+        while not (subscriber.dropped and subscriber.queue.empty()):
+            try:
+                change = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if cursor.accept(change):
+                yield change
+    finally:
+        _leave(feed, subscriber)
+
+
+def sse_message(change):
+    """``change`` as a Server-Sent Event, or a keepalive comment for None."""
+    if change is None:
+        return ': keepalive\n\n'
+    data = json.dumps({
+        'event': change.event_id, 'signature': change.signature, 'status': change.status, 'entries': change.entries,
+    })
+    return f'id: {format_key(change.key)}\nevent: access\ndata: {data}\n\n'
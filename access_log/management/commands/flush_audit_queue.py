@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from access_log.solana_utils import SOLANA_AVAILABLE, flush_audit_queue
+
+
+class Command(BaseCommand):
+    help = "Send access-log events queued while the Solana RPC was unavailable."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=500, help="Maximum events to send per pass.")
+        parser.add_argument('--loop', action='store_true', help="Keep running, flushing every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=30, help="Seconds between passes with --loop.")
+
+    def handle(self, *args, **options):
+        if not SOLANA_AVAILABLE:
+            self.stderr.write("Solana packages are not installed; nothing can be sent.")
+            return
+
+        while True:
+            sent = flush_audit_queue(limit=options['limit'])
+            self.stdout.write(f"Sent {sent} queued audit event(s).")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from access_log.solana_utils import SOLANA_AVAILABLE, track_confirmations
+
+
+class Command(BaseCommand):
+    help = "Poll signature statuses of sent audit events, finalizing them or resending those that expired."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=5000, help="Maximum events to check per pass.")
+        parser.add_argument('--loop', action='store_true', help="Keep running, polling every --interval seconds.")
+        parser.add_argument('--interval', type=float, default=2, help="Seconds between passes with --loop.")
+
+    def handle(self, *args, **options):
+        if not SOLANA_AVAILABLE:
+            self.stderr.write("Solana packages are not installed; nothing can be tracked.")
+            return
+
+        while True:
+            moved = track_confirmations(limit=options['limit'])
+            summary = ', '.join(f"{count} {status}" for status, count in sorted(moved.items())) or 'no changes'
+            self.stdout.write(f"Audit confirmations: {summary}.")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,195 @@
+"""
+Compact on-chain encoding for access-log memos.
+
+A memo is ``"sl:" + base64url(payload)`` where the payload is a version
+byte followed by one or more records. Each record is:
+
+    action      1 byte  (low 6 bits: action code, 0x80: has target,
+                         0x40: has digest)
+    user id     varint  (database id, never an email)
+    file id     varint
+    timestamp   varint  (unix seconds)
+    target id   varint  (only when the action has 0x80 set)
+    digest      32 bytes (SHA-256 of the file, only when 0x40 is set)
+
+Records are self-delimiting, so several events can share one memo. The
+memo program requires UTF-8, hence the base64 armour. Memos written
+before this format ("<email> <action> <file name>") are still decoded.
+"""
+
+import base64
+import binascii
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+MEMO_PREFIX = 'sl:'
+MEMO_VERSION = 1
+
+ACTION_CODES = {
+    'uploaded': 1,
+    'downloaded': 2,
+    'shared': 3,
+    'revoked': 4,
+    # The upload pipeline anchoring the file's SHA-256 (see verify_files)
+    'hashed': 5,
+    # Signed share links (files.share_links); the user is the sharer
+    'link_created': 6,
+    'link_downloaded': 7,
+    'link_revoked': 8,
+}
+ACTION_NAMES = {code: name for name, code in ACTION_CODES.items()}
+TARGET_FLAG = 0x80
+DIGEST_FLAG = 0x40
+DIGEST_SIZE = 32
+
+# getSignaturesForAddress reports memos as "[<byte length>] <text>", joined
+# with "; " when a transaction has several
+RPC_MEMO_HEADER = re.compile(rb'\[(\d+)\] ')
+
+
+class MemoDecodeError(ValueError):
+    pass
+
+
+@dataclass
+class AccessRecord:
+    action: str
+    user_id: Optional[int]
+    file_id: Optional[int]
+    timestamp: Optional[int]
+    target_id: Optional[int] = None
+    # Only set for legacy text memos, which carry an email instead of an id
+    user_email: Optional[str] = None
+    legacy_action: Optional[str] = None
+    digest: Optional[bytes] = None
+
+
+def _write_varint(out, value):
+    if value < 0:
+        raise ValueError("varints must be non-negative")
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        if pos >= len(data):
+            raise MemoDecodeError("truncated varint")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+        if shift > 63:
+            raise MemoDecodeError("varint too long")
+
+
+def encode_records(records):
+    payload = bytearray([MEMO_VERSION])
+    for record in records:
+        code = ACTION_CODES[record.action]
+        if record.target_id is not None:
+            code |= TARGET_FLAG
+        if record.digest is not None:
+            code |= DIGEST_FLAG
+        payload.append(code)
+        _write_varint(payload, record.user_id)
+        _write_varint(payload, record.file_id)
+        _write_varint(payload, record.timestamp)
+        if record.target_id is not None:
+            _write_varint(payload, record.target_id)
+        if record.digest is not None:
+            if len(record.digest) != DIGEST_SIZE:
+                raise ValueError("digests must be 32-byte SHA-256 values")
+            payload += record.digest
+    return MEMO_PREFIX + base64.urlsafe_b64encode(bytes(payload)).rstrip(b'=').decode('ascii')
+
+
+def encode_memo(action, user_id, file_id, timestamp, target_id=None, digest=None):
+    return encode_records([AccessRecord(action, user_id, file_id, int(timestamp), target_id, digest=digest)])
+
+
+def decode_records(memo):
+    encoded = memo[len(MEMO_PREFIX):]
+    try:
+        payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+    except (binascii.Error, ValueError) as e:
+        raise MemoDecodeError(f"bad base64: {e}")
+    if not payload or payload[0] != MEMO_VERSION:
+        raise MemoDecodeError(f"unsupported memo version {payload[:1].hex() or 'none'}")
+
+    records = []
+    pos = 1
+    while pos < len(payload):
+        code = payload[pos]
+        pos += 1
+        action = ACTION_NAMES.get(code & ~(TARGET_FLAG | DIGEST_FLAG))
+        if action is None:
+            raise MemoDecodeError(f"unknown action code {code & ~(TARGET_FLAG | DIGEST_FLAG)}")
+        user_id, pos = _read_varint(payload, pos)
+        file_id, pos = _read_varint(payload, pos)
+        timestamp, pos = _read_varint(payload, pos)
+        target_id = None
+        if code & TARGET_FLAG:
+            target_id, pos = _read_varint(payload, pos)
+        digest = None
+        if code & DIGEST_FLAG:
+            if pos + DIGEST_SIZE > len(payload):
+                raise MemoDecodeError("truncated digest")
+            digest, pos = payload[pos:pos + DIGEST_SIZE], pos + DIGEST_SIZE
+        records.append(AccessRecord(action, user_id, file_id, timestamp, target_id, digest=digest))
+    return records
+
+
+def decode_legacy(memo, file_name=None):
+    """Parse a pre-binary "<email> <action> <file name>" memo."""
+    memo = memo.strip()
+    if file_name:
+        # Legacy memos predate the sharded layout and name the file as it
+        # was stored then, directly under user_files/
+        for name in (file_name, 'user_files/' + file_name.rsplit('/', 1)[-1]):
+            if memo.endswith(' ' + name):
+                memo = memo[:-len(name) - 1]
+                break
+    email, _, action = memo.partition(' ')
+    if not file_name:
+        # Without the file name the last word is the best guess for it
+        action = action.rsplit(' ', 1)[0] if ' ' in action else action
+    name = action.split(' ', 1)[0]
+    return AccessRecord(
+        action=name if name in ACTION_CODES else action,
+        user_id=None,
+        file_id=None,
+        timestamp=None,
+        user_email=email,
+        legacy_action=action,
+    )
+
+
+def decode_memo(memo, file_name=None):
+    """Decode either memo format into a list of AccessRecords."""
+    if memo.startswith(MEMO_PREFIX):
+        return decode_records(memo)
+    return [decode_legacy(memo, file_name)]
+
+
+def split_rpc_memo_field(field):
+    """Split the ``memo`` field of a getSignaturesForAddress result."""
+    data = field.encode('utf-8')
+    memos = []
+    pos = 0
+    while pos < len(data):
+        header = RPC_MEMO_HEADER.match(data, pos)
+        if header is None:
+            memos.append(data[pos:].decode('utf-8', 'replace'))
+            break
+        start = header.end()
+        end = start + int(header.group(1))
+        memos.append(data[start:end].decode('utf-8', 'replace'))
+        pos = end + len(b'; ')
+    return memos
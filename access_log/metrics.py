@@ -0,0 +1,23 @@
+from django.db.models import Count
+
+from monitoring.metrics import PROMETHEUS_AVAILABLE
+
+if PROMETHEUS_AVAILABLE:
+    from prometheus_client.core import GaugeMetricFamily
+
+
+class AuditQueueCollector:
+    """Reports queued audit events by status at scrape time."""
+
+    def collect(self):
+        from .models import AuditEvent
+
+        gauge = GaugeMetricFamily(
+            'sealevel_audit_queue_depth',
+            'Audit events in the local queue, by status.',
+            labels=['status'],
+        )
+        counts = dict(AuditEvent.objects.values_list('status').annotate(Count('id')).order_by())
+        for status, _ in AuditEvent.STATUS_CHOICES:
+            gauge.add_metric([status], counts.get(status, 0))
+        yield gauge
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('files', '0010_file_uploaded_by'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('memo', models.TextField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('submitted', 'Submitted')], db_index=True, default='queued', max_length=10)),
+                ('signature', models.CharField(blank=True, max_length=88)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audit_events', to='files.file')),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
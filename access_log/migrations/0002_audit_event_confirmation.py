@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:15
+
+from django.db import migrations, models
+
+
+def mark_submitted_confirmed(apps, schema_editor):
+    # Events sent before the tracker existed were confirmed synchronously
+    AuditEvent = apps.get_model('access_log', 'AuditEvent')
+    AuditEvent.objects.filter(status='submitted').update(status='confirmed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_log', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditevent',
+            name='last_valid_block_height',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='auditevent',
+            name='signature',
+            field=models.CharField(blank=True, db_index=True, max_length=88),
+        ),
+        migrations.AlterField(
+            model_name='auditevent',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('pending', 'Pending'), ('confirmed', 'Confirmed'), ('finalized', 'Finalized'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10),
+        ),
+        migrations.RunPython(mark_submitted_confirmed, migrations.RunPython.noop),
+    ]
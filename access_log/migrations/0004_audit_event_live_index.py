@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_log', '0003_admin_indexes'),
+        ('files', '0020_sharelink'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditevent',
+            index=models.Index(fields=['file', 'updated_at', 'id'], name='audit_event_file_updated'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('access_log', '0005_audit_event_owner'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditevent',
+            name='status',
+            field=models.CharField(choices=[('local', 'Local only'), ('queued', 'Queued'), ('pending', 'Pending'), ('confirmed', 'Confirmed'), ('finalized', 'Finalized'), ('failed', 'Failed')], db_index=True, default='queued', max_length=10),
+        ),
+    ]
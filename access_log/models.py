@@ -1,12 +1,50 @@
-# from django.db import models
-# from django.conf import settings  # Use settings to get AUTH_USER_MODEL
-# from files.models import File  # Import the File model from the files app
-
-# class AccessLog(models.Model):
-#     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-#     file = models.ForeignKey(File, on_delete=models.CASCADE)
-#     action = models.CharField(max_length=255)
-#     timestamp = models.DateTimeField(auto_now_add=True)
-
-#     def __str__(self):
-#         return f"{self.user} - {self.file} - {self.action} - {self.timestamp}"
\ No newline at end of file
+from django.conf import settings
+from django.db import models
+from files.models import File
+
+
+class AuditEvent(models.Model):
+    """
+    An access-log memo and where it is on its way to the chain: queued
+    locally (RPC unavailable, see flush_audit_queue), sent and pending, or
+    confirmed/finalized as reported by track_audit_confirmations. Accesses
+    recorded while the chain is off are local and are never sent.
+    """
+    STATUS_CHOICES = [
+        ('local', 'Local only'),
+        ('queued', 'Queued'),
+        ('pending', 'Pending'),
+        ('confirmed', 'Confirmed'),
+        ('finalized', 'Finalized'),
+        ('failed', 'Failed'),
+    ]
+    # Statuses the confirmation tracker still has to poll
+    UNSETTLED_STATUSES = ('pending', 'confirmed')
+
+    # The memo itself carries the file id, so history survives file deletion
+    file = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True, related_name='audit_events')
+    # Whose record was accessed, for the patient's timeline across their files
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+    )
+    memo = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', db_index=True)
+    signature = models.CharField(max_length=88, blank=True, db_index=True)
+    # The transaction can no longer land once the chain passes this height
+    last_valid_block_height = models.BigIntegerField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Keyset for the live access log (access_log.live)
+            models.Index(fields=['file', 'updated_at', 'id'], name='audit_event_file_updated'),
+            # Keyset for the patient's access timeline (access_log.timeline)
+            models.Index(fields=['owner', 'created_at', 'id'], name='audit_event_owner_timeline'),
+        ]
+
+    def __str__(self):
+        return f"Audit event {self.pk} ({self.status})"
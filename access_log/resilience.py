@@ -0,0 +1,162 @@
+import asyncio
+import functools
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from monitoring.metrics import RPC_BREAKER_STATE, RPC_RETRIES, observe_rpc
+
+logger = logging.getLogger('solana')
+
+
+class RpcUnavailable(Exception):
+    """Raised when an RPC call is refused by the breaker or ran out of retries."""
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker. After ``failure_threshold`` consecutive
+    failures it opens and refuses calls for ``reset_timeout`` seconds, then
+    lets a single probe through (half-open) to decide whether to close.
+    """
+
+    CLOSED = 'closed'
+    HALF_OPEN = 'half_open'
+    OPEN = 'open'
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def is_open(self):
+        """True while calls are being refused outright (open and not yet due a probe)."""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                logger.info("Circuit %s closed", self.name)
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning("Circuit %s opened after %d failures", self.name, self.failures)
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    def record_cancelled(self):
+        """The call was abandoned, not failed: just free the probe slot."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _set_state(self, state):
+        self.state = state
+        self._publish()
+
+    def _publish(self):
+        RPC_BREAKER_STATE.labels(self.name).set(self.STATE_VALUES[self.state])
+
+
+rpc_breaker = CircuitBreaker(
+    'solana_rpc',
+    failure_threshold=settings.SOLANA_BREAKER_THRESHOLD,
+    reset_timeout=settings.SOLANA_BREAKER_RESET,
+)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff: uniform in [0, base * 2**attempt], capped."""
+    return random.uniform(0, min(settings.SOLANA_RPC_BACKOFF_CAP, settings.SOLANA_RPC_BACKOFF_BASE * 2 ** attempt))
+
+
+async def call_rpc(method, call, idempotent=True, breaker=None, session=None):
+    """
+    Await ``call()`` under a per-call timeout and an overall deadline of
+    SOLANA_RPC_DEADLINE seconds. Idempotent calls are retried with jittered
+    backoff while the deadline allows. Raises RpcUnavailable when the breaker
+    is open or every attempt failed.
+
+    With a ``session`` (see routing.RpcSession) ``call`` takes a client, and
+    each attempt goes to the best endpoint this call hasn't tried yet, under
+    that endpoint's own breaker.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SOLANA_RPC_DEADLINE
+    attempts = 1 + (settings.SOLANA_RPC_RETRIES if idempotent else 0)
+    last_error = None
+    tried = []
+
+    for attempt in range(attempts):
+        timeout = min(settings.SOLANA_RPC_TIMEOUT, deadline - loop.time())
+        if timeout <= 0:
+            break
+        endpoint = None
+        if session is None:
+            attempt_breaker, invoke = breaker or rpc_breaker, call
+        else:
+            endpoint = session.choose(tried)
+            if endpoint is None:
+                raise RpcUnavailable(f"No healthy Solana RPC endpoint, {method} not attempted")
+            tried.append(endpoint)
+            attempt_breaker, invoke = endpoint.breaker, functools.partial(call, session.client(endpoint))
+        if not attempt_breaker.allow():
+            if endpoint is None:
+                raise RpcUnavailable(f"Solana RPC circuit is open, {method} not attempted")
+            last_error = RpcUnavailable(f"Circuit for {endpoint.name} is open")
+            continue
+        start = loop.time()
+        try:
+            with observe_rpc(method):
+                result = await asyncio.wait_for(invoke(), timeout)
+        except Exception as e:
+            attempt_breaker.record_failure()
+            if endpoint is not None:
+                endpoint.record(loop.time() - start, e)
+            last_error = e
+            logger.warning("%s attempt %d failed: %r", method, attempt + 1, e)
+            if attempt + 1 < attempts:
+                delay = backoff_delay(attempt)
+                if loop.time() + delay >= deadline:
+                    break
+                RPC_RETRIES.labels(method).inc()
+                await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Cancelled: don't leave a half-open probe outstanding
+            attempt_breaker.record_cancelled()
+            raise
+        attempt_breaker.record_success()
+        if endpoint is not None:
+            endpoint.record(loop.time() - start)
+        return result
+
+    raise RpcUnavailable(f"{method} failed: {last_error!r}") from last_error
@@ -0,0 +1,200 @@
+"""
+Routing Solana RPC calls across several endpoints.
+
+SOLANA_RPC_ENDPOINT may list several providers. Each endpoint keeps an
+EWMA of its latency and error rate and has its own circuit breaker; reads
+go to the endpoint with the lowest expected time per successful call, and
+retries fail over to the next one. An endpoint answering 429 is ejected
+for its Retry-After (or SOLANA_RPC_EJECT_SECONDS). Writes of pre-signed
+transactions can be broadcast to several endpoints at once.
+"""
+
+import asyncio
+import copy
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from monitoring.metrics import RPC_ENDPOINT_EJECTIONS, RPC_ENDPOINT_LATENCY
+from .resilience import CircuitBreaker, RpcUnavailable, call_rpc
+
+logger = logging.getLogger('solana')
+
+# Weight of the newest sample in the latency and error-rate averages
+EWMA_ALPHA = 0.2
+# Floor on the success rate used for scoring, so a flapping endpoint is
+# heavily penalised rather than scored as infinitely slow
+MIN_SUCCESS_RATE = 0.05
+
+
+def _http_response(error):
+    """
+    The HTTP response behind ``error``, if any. solana-py raises its own
+    SolanaRpcException from the httpx error, so the cause chain is walked.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        response = getattr(error, 'response', None)
+        if response is not None:
+            return response
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def rate_limit_delay(error):
+    """Seconds to eject an endpoint for if ``error`` is (or wraps) an HTTP 429, else None."""
+    response = _http_response(error)
+    if getattr(response, 'status_code', None) != 429:
+        return None
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return settings.SOLANA_RPC_EJECT_SECONDS
+
+
+class Endpoint:
+    def __init__(self, url):
+        self.url = url
+        self.name = urlsplit(url).hostname or url
+        self.latency = None
+        self.error_rate = 0.0
+        self.ejected_until = 0.0
+        self.breaker = CircuitBreaker(
+            f'solana_rpc:{self.name}',
+            failure_threshold=settings.SOLANA_BREAKER_THRESHOLD,
+            reset_timeout=settings.SOLANA_BREAKER_RESET,
+        )
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'<Endpoint {self.name}>'
+
+    def available(self, now=None):
+        now = time.monotonic() if now is None else now
+        return now >= self.ejected_until and not self.breaker.is_open()
+
+    def score(self):
+        """Expected seconds per successful call; untried endpoints score 0 so they get tried."""
+        return (self.latency or 0.0) / max(MIN_SUCCESS_RATE, 1.0 - self.error_rate)
+
+    def record(self, elapsed, error=None):
+        with self._lock:
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += EWMA_ALPHA * (elapsed - self.latency)
+            self.error_rate += EWMA_ALPHA * ((error is not None) - self.error_rate)
+        RPC_ENDPOINT_LATENCY.labels(self.name).set(self.latency)
+
+        delay = rate_limit_delay(error) if error is not None else None
+        if delay is not None:
+            self.eject(delay)
+
+    def eject(self, seconds):
+        logger.warning("Ejecting Solana RPC endpoint %s for %.0fs (rate limited)", self.name, seconds)
+        self.ejected_until = time.monotonic() + seconds
+        RPC_ENDPOINT_EJECTIONS.labels(self.name).inc()
+
+
+class EndpointSelector:
+    """Per-process health bookkeeping for a fixed list of endpoint URLs."""
+
+    def __init__(self, urls):
+        if not urls:
+            raise ValueError("At least one Solana RPC endpoint is required")
+        self.urls = list(urls)
+        self.endpoints = [Endpoint(url) for url in self.urls]
+
+    def ranked(self, exclude=()):
+        """Available endpoints, best first."""
+        now = time.monotonic()
+        healthy = [endpoint for endpoint in self.endpoints if endpoint not in exclude and endpoint.available(now)]
+        return sorted(healthy, key=Endpoint.score)
+
+    def choose(self, exclude=()):
+        ranked = self.ranked(exclude)
+        return ranked[0] if ranked else None
+
+
+_selector = None
+_selector_lock = threading.Lock()
+
+
+def get_selector():
+    """The process-wide selector for SOLANA_RPC_ENDPOINTS, rebuilt if the setting changes."""
+    global _selector
+    with _selector_lock:
+        if _selector is None or _selector.urls != settings.SOLANA_RPC_ENDPOINTS:
+            _selector = EndpointSelector(settings.SOLANA_RPC_ENDPOINTS)
+        return _selector
+
+
+class RpcSession:
+    """
+    Routes calls for the length of an ``async with`` block. Clients are
+    created per endpoint on first use and closed on exit; ``call`` functions
+    take the client to use, e.g. ``lambda client: client.get_block_height()``.
+    """
+
+    def __init__(self, selector, client_factory):
+        self.selector = selector
+        self.client_factory = client_factory
+        self.only = None
+        self._clients = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+    def client(self, endpoint):
+        if endpoint.url not in self._clients:
+            self._clients[endpoint.url] = self.client_factory(endpoint.url)
+        return self._clients[endpoint.url]
+
+    def choose(self, tried):
+        """Endpoint for the next attempt: the best one not tried yet, else the best one."""
+        if self.only is not None:
+            return self.only
+        return self.selector.choose(exclude=tried) or self.selector.choose()
+
+    def pinned(self, endpoint):
+        """A view of this session (sharing its clients) that only uses ``endpoint``."""
+        pinned = copy.copy(self)
+        pinned.only = endpoint
+        return pinned
+
+    async def call(self, method, call, idempotent=True):
+        return await call_rpc(method, call, idempotent=idempotent, session=self)
+
+    async def broadcast(self, method, call, fanout=None):
+        """
+        Send to the best endpoint with the usual retries and, at the same
+        time, once to each of the next ``fanout - 1``. Only for calls that
+        are safe to repeat, such as sending a pre-signed transaction.
+        Returns the first successful result.
+        """
+        fanout = fanout or settings.SOLANA_RPC_WRITE_FANOUT
+        extras = self.selector.ranked()[1:fanout]
+        tasks = [asyncio.ensure_future(self.call(method, call))] + [
+            asyncio.ensure_future(call_rpc(method, call, idempotent=False, session=self.pinned(endpoint)))
+            for endpoint in extras
+        ]
+        error = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    return await next_done
+                except RpcUnavailable as e:
+                    error = error or e
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
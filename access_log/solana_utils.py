@@ -1,18 +1,33 @@
 import base64
-from datetime import datetime
+from datetime import datetime, timezone
+import hashlib
 import json
+import logging
 import os
-import pytz
-from django.utils import timezone
+import time
+from zoneinfo import ZoneInfo
 import asyncio
+from collections import namedtuple
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F
 from files.models import File
+from .memo import (
+    MEMO_PREFIX, MemoDecodeError, decode_memo, decode_records, encode_records, split_rpc_memo_field,
+)
+from .audit import record_access
+from .models import AuditEvent
+from .resilience import RpcUnavailable
+from .routing import RpcSession, get_selector
+from monitoring.metrics import AUDIT_BACKLOG
 from users.models import User
 
+logger = logging.getLogger('solana')
+
 # Conditional Solana imports
 try:
     from solana.transaction import Transaction
-    from solders.instruction import Instruction
+    from solders.instruction import AccountMeta, Instruction
     from solders.pubkey import Pubkey
     from solders.keypair import Keypair
     from solders.signature import Signature
@@ -24,97 +39,456 @@ except ImportError:
 
 #Initialize Solana client
 MEMO_PROGRAM_ID = "MemoSq4gqABAXKb96qnH8TysNcWxMyWCqXgDLGmfcHr"
-SOLANA_RPC_URL = "https://api.devnet.solana.com"
 
+# getSignaturesForAddress returns at most this many signatures per call
+SIGNATURES_PAGE_LIMIT = 1000
+LEGACY_FETCH_CONCURRENCY = 8
 
-async def log_access(user: User, action: str, file: File):
-    if not SOLANA_AVAILABLE:
-        print(f"Solana not available - would log: {user.email} {action} {file.uploaded_file}")
-        return
-    
+# A memo as found on chain (or in the local queue) with its signature and
+# confirmation status, before decoding
+ChainMemo = namedtuple('ChainMemo', 'signature block_time memo status')
+
+
+def rpc_session():
+    """An RpcSession over SOLANA_RPC_ENDPOINTS, to be used with ``async with``."""
+    return RpcSession(get_selector(), lambda url: AsyncClient(url, timeout=settings.SOLANA_RPC_TIMEOUT))
+
+
+def chain_enabled():
+    return settings.SOLANA_ENABLED and SOLANA_AVAILABLE
+
+
+async def log_access(user: User, action: str, file: File, target: User = None, digest: bytes = None):
+    """
+    Record ``action`` (one of memo.ACTION_CODES) by ``user`` on ``file``.
+    ``target`` is the other user for shares and revocations; ``digest`` the
+    file's SHA-256 for 'hashed'.
+
+    The AuditEvent is always written (audit.record_access); only when the
+    chain is in use is it then sent, by submit_event.
+    """
+    send = chain_enabled()
+    event = await sync_to_async(record_access)(user, action, file, target, digest, queued=send)
+    if send:
+        await submit_event(event)
+    return event
+
+
+async def submit_event(event):
+    """
+    Send a queued AuditEvent's memo to the chain and mark it pending;
+    track_audit_confirmations follows it from there. Never raises for
+    chain trouble and never takes longer than SOLANA_AUDIT_DEADLINE; if the
+    memo can't be sent in time the event stays queued for flush_audit_queue.
+    """
+    AUDIT_BACKLOG.inc()
+    try:
+        signature, last_valid_block_height = await asyncio.wait_for(
+            send_memo(event.file_id, event.memo), settings.SOLANA_AUDIT_DEADLINE,
+        )
+    except Exception as e:
+        logger.warning("Queueing access log for file %s: %r", event.file_id, e)
+        await sync_to_async(AuditEvent.objects.filter(pk=event.pk).update)(
+            attempts=F('attempts') + 1, last_error=repr(e), updated_at=_now(),
+        )
+    else:
+        await sync_to_async(AuditEvent.objects.filter(pk=event.pk).update)(
+            status='pending', signature=signature, last_valid_block_height=last_valid_block_height,
+            attempts=F('attempts') + 1, updated_at=_now(),
+        )
+    finally:
+        AUDIT_BACKLOG.dec()
+
+
+async def send_memo(file_id, memo):
+    """
+    Send ``memo`` to the chain under ``file_id``'s reference address without
+    waiting for confirmation. Returns the signature and the block height
+    after which the transaction can no longer land.
+    """
     # Servers solana keypair
     service_keypair = load_service_keypair()
 
-    # Prepare the access log message
-    access_log_message = f"{user.email} {action} {file.uploaded_file}"
-
-    # Create a transaction with a memo instruction
+    # Create a transaction with a memo instruction. The file's reference key
+    # rides along as a read-only signer (memo v2 requires every account to
+    # sign), which indexes the transaction under that address on chain.
+    reference_keypair = file_reference_keypair(file_id, service_keypair)
     memo_instruction = Instruction(
         program_id=Pubkey.from_string(MEMO_PROGRAM_ID),
-        data=access_log_message.encode('utf-8'),
-        accounts=[]
+        data=memo.encode('utf-8'),
+        accounts=[AccountMeta(reference_keypair.pubkey(), is_signer=True, is_writable=False)]
     )
 
-    async with AsyncClient(SOLANA_RPC_URL) as client:
+    async with rpc_session() as rpc:
+        blockhash = await rpc.call('getLatestBlockhash', lambda client: client.get_latest_blockhash(Confirmed))
 
-        txn = Transaction().add(memo_instruction)
-        txn.fee_payer = service_keypair.pubkey()
+        # Sign once up front so resending after a timeout can only ever
+        # land the same transaction, which makes the send safe to retry
+        txn = Transaction(recent_blockhash=blockhash.value.blockhash, fee_payer=service_keypair.pubkey())
+        txn.add(memo_instruction)
+        txn.sign(service_keypair, reference_keypair)
+        raw_transaction = txn.serialize()
 
-        response = await client.send_transaction(txn, service_keypair)
-        await client.confirm_transaction(response.value, commitment=Confirmed)
+        # Landing is faster when several providers forward the transaction
+        response = await rpc.broadcast('sendTransaction', lambda client: client.send_raw_transaction(raw_transaction))
         transaction_id = response.value
 
-        print(f"Transaction ID: {transaction_id}")
-        print(f"Response: {response.value}")
-    
-    transaction_id_str = str(transaction_id)
+        logger.info("Transaction ID: %s", transaction_id)
+    return str(transaction_id), blockhash.value.last_valid_block_height
 
-    file.transaction_ids.append(transaction_id_str)
-    await sync_to_async(file.save)()
 
+# Queued events for the same file are sent together, several records per
+# memo, keeping well inside the 1232-byte transaction limit
+MAX_RECORDS_PER_MEMO = 32
+# getSignatureStatuses accepts at most this many signatures per call
+STATUS_BATCH_SIZE = 256
+# Sends per event before it is left as failed for someone to look at
+MAX_SEND_ATTEMPTS = 5
 
-import json
 
-async def retrieve_access_logs(file):
-    if not SOLANA_AVAILABLE:
-        print(f"Solana not available - would retrieve logs for: {file.uploaded_file}")
-        return []
-    
-    pacific_tz = pytz.timezone('America/Los_Angeles')
+def _now():
+    # QuerySet.update() skips auto_now; the live access log follows updated_at
+    return datetime.now(timezone.utc)
+
+
+def _send_events(events):
+    """
+    Send a group of AuditEvents for one file as a single memo and mark them
+    pending. Raises whatever send_memo raised, after recording the attempt.
+    """
+    from asgiref.sync import async_to_sync
+
+    records = [record for event in events for record in decode_records(event.memo)]
+    event_ids = [event.pk for event in events]
+    try:
+        signature, last_valid_block_height = async_to_sync(send_memo)(records[0].file_id, encode_records(records))
+    except Exception as e:
+        AuditEvent.objects.filter(pk__in=event_ids).update(
+            status='queued', attempts=F('attempts') + 1, last_error=repr(e), updated_at=_now(),
+        )
+        raise
+    AuditEvent.objects.filter(pk__in=event_ids).update(
+        status='pending', signature=signature, last_valid_block_height=last_valid_block_height,
+        attempts=F('attempts') + 1, updated_at=_now(),
+    )
+
+
+def _batch_by_file(events):
+    """Group events per file into batches of at most MAX_RECORDS_PER_MEMO records."""
+    batches = {}
+    for event in events:
+        try:
+            records = decode_records(event.memo)
+        except MemoDecodeError as e:
+            logger.error("Giving up on undecodable memo %s: %s", event.pk, e)
+            AuditEvent.objects.filter(pk=event.pk).update(status='failed', last_error=str(e), updated_at=_now())
+            continue
+        file_batches = batches.setdefault(records[0].file_id, [[[], 0]])
+        if file_batches[-1][1] + len(records) > MAX_RECORDS_PER_MEMO:
+            file_batches.append([[], 0])
+        file_batches[-1][0].append(event)
+        file_batches[-1][1] += len(records)
+    return [batch for file_batches in batches.values() for batch, _ in file_batches]
+
+
+def flush_audit_queue(limit=500):
+    """
+    Send queued AuditEvents to the chain, oldest first. Stops at the first
+    RPC failure, since the breaker will refuse the rest anyway. Returns the
+    number of events sent.
+    """
+    sent = 0
+    for batch in _batch_by_file(AuditEvent.objects.filter(status='queued').order_by('id')[:limit]):
+        try:
+            _send_events(batch)
+        except Exception as e:
+            logger.warning("Audit queue flush stopped: %r", e)
+            break
+        sent += len(batch)
+    return sent
+
+
+async def fetch_signature_outcomes(signatures):
+    """
+    Poll getSignatureStatuses in batches of STATUS_BATCH_SIZE. Returns the
+    current block height and a dict of signature -> 'processed',
+    'confirmed', 'finalized', 'failed' or None (not seen by the cluster).
+    """
+    outcomes = {}
+    async with rpc_session() as rpc:
+        block_height = (await rpc.call('getBlockHeight', lambda client: client.get_block_height(Confirmed))).value
+        for start in range(0, len(signatures), STATUS_BATCH_SIZE):
+            batch = signatures[start:start + STATUS_BATCH_SIZE]
+            response = await rpc.call('getSignatureStatuses', lambda client: client.get_signature_statuses(
+                [Signature.from_string(signature) for signature in batch],
+                search_transaction_history=True,
+            ))
+            for signature, status in zip(batch, response.value):
+                if status is None:
+                    outcomes[signature] = None
+                elif status.err is not None:
+                    outcomes[signature] = 'failed'
+                else:
+                    outcomes[signature] = str(status.confirmation_status).rsplit('.', 1)[-1].lower()
+    return block_height, outcomes
+
+
+def track_confirmations(limit=5000):
+    """
+    Advance pending and confirmed AuditEvents to confirmed/finalized, and
+    resend those whose transaction failed or expired without landing.
+    Returns a dict of status -> number of events moved there.
+    """
+    from asgiref.sync import async_to_sync
+
+    events = list(
+        AuditEvent.objects.filter(status__in=AuditEvent.UNSETTLED_STATUSES)
+        .exclude(signature='').order_by('id')[:limit]
+    )
+    if not events:
+        return {}
+
+    by_signature = {}
+    for event in events:
+        by_signature.setdefault(event.signature, []).append(event)
+    block_height, outcomes = async_to_sync(fetch_signature_outcomes)(list(by_signature))
+
+    moved = {}
+    to_resend = []
+    for signature, group in by_signature.items():
+        outcome = outcomes.get(signature)
+        expired = outcome is None and group[0].last_valid_block_height is not None \
+            and block_height > group[0].last_valid_block_height
+        if outcome in ('confirmed', 'finalized') and outcome != group[0].status:
+            AuditEvent.objects.filter(signature=signature).update(status=outcome, updated_at=_now())
+            moved[outcome] = moved.get(outcome, 0) + len(group)
+        elif outcome == 'failed' or expired:
+            to_resend.extend(group)
+
+    retryable = [event for event in to_resend if event.attempts < MAX_SEND_ATTEMPTS]
+    exhausted = [event.pk for event in to_resend if event.attempts >= MAX_SEND_ATTEMPTS]
+    if exhausted:
+        AuditEvent.objects.filter(pk__in=exhausted).update(
+            status='failed', last_error='Transaction did not land', updated_at=_now(),
+        )
+        moved['failed'] = len(exhausted)
+    for batch in _batch_by_file(retryable):
+        try:
+            _send_events(batch)
+        except Exception as e:
+            logger.warning("Resending audit events failed, left queued: %r", e)
+            moved['queued'] = moved.get('queued', 0) + len(batch)
+        else:
+            moved['pending'] = moved.get('pending', 0) + len(batch)
+    return moved
+
+
+def file_reference_keypair(file_id, service_keypair=None):
+    """
+    Deterministic per-file keypair derived from the service key. Its public
+    key is the address a file's audit history is listed under.
+    """
+    service_keypair = service_keypair or load_service_keypair()
+    seed = hashlib.sha256(b'sealevel-file-reference:' + bytes(service_keypair)[:32] + str(file_id).encode()).digest()
+    return Keypair.from_seed(seed)
+
+
+LINK_ACTIONS = {
+    'link_created': "created a share link",
+    'link_downloaded': "downloaded through their share link",
+    'link_revoked': "revoked a share link",
+}
+
+
+def describe_action(record, users):
+    """Human-readable action for the access log page."""
+    if record.legacy_action is not None:
+        return record.legacy_action
+    target = users.get(record.target_id)
+    target_email = target.email if target else 'unknown user'
+    if record.action == 'shared':
+        return f"shared with {target_email}"
+    if record.action == 'revoked':
+        return f"revoked access for {target_email}"
+    if record.action in LINK_ACTIONS:
+        return LINK_ACTIONS[record.action]
+    if record.action == 'hashed':
+        return f"recorded checksum {record.digest.hex()[:12]}" if record.digest else "recorded checksum"
+    return record.action
+
+
+def _local_time(unix_time):
+    return datetime.fromtimestamp(unix_time, tz=timezone.utc).astimezone(ZoneInfo('America/Los_Angeles'))
+
+
+async def build_access_log_entries(memos, file):
+    """
+    Turn ChainMemos into rows for the access log page, resolving every user
+    id they mention with a single query.
+    """
+    records = []
+    for chain_memo in memos:
+        try:
+            for record in decode_memo(chain_memo.memo, file.uploaded_file.name):
+                records.append((chain_memo, record))
+        except MemoDecodeError as e:
+            logger.warning("Undecodable memo on file %s: %s", file.id, e)
+
+    user_ids = {record.user_id for _, record in records} | {record.target_id for _, record in records}
+    user_ids.discard(None)
+    users = await sync_to_async(User.objects.in_bulk)(user_ids) if user_ids else {}
+
     access_logs = []
-    async with AsyncClient(SOLANA_RPC_URL) as client:
-        for tx_id in file.transaction_ids:
-            signature = Signature.from_string(tx_id)
+    for chain_memo, record in records:
+        unix_time = record.timestamp or chain_memo.block_time or time.time()
+        access_logs.append({
+            'timestamp': _local_time(unix_time),
+            'user': users.get(record.user_id) or record.user_email or 'unknown user',
+            'action': describe_action(record, users),
+            'signature': chain_memo.signature,
+            'status': chain_memo.status,
+        })
+    access_logs.sort(key=lambda x: x['timestamp'], reverse=True)
+    return access_logs
+
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
 
-            response = await client.get_transaction(
-                signature,               # Use the converted signature
+
+def parse_signature(value):
+    """
+    The transaction Signature in a page cursor sent by a client. Raises
+    ValueError for anything else, so bad input is rejected before it gets
+    near an RPC call, where errors count against the endpoint.
+    """
+    if not isinstance(value, str) or not 64 <= len(value) <= 88 or not set(value) <= set(BASE58_ALPHABET):
+        raise ValueError(f"Not a transaction signature: {value!r}")
+    number = 0
+    for char in value:
+        number = number * 58 + BASE58_ALPHABET.index(char)
+    leading_zeros = len(value) - len(value.lstrip('1'))
+    if leading_zeros + (number.bit_length() + 7) // 8 != 64:
+        raise ValueError(f"Not a transaction signature: {value!r}")
+    return Signature.from_string(value) if SOLANA_AVAILABLE else value
+
+
+async def fetch_signature_page(rpc, address, before=None, until=None, limit=SIGNATURES_PAGE_LIMIT):
+    """
+    One getSignaturesForAddress call, newest first. ``before`` and
+    ``until`` are Signatures (see parse_signature for client input).
+    Returns ChainMemos for the successful transactions and the Signature
+    to pass as ``before`` for the next older page, or None when this page
+    reached the start of the history.
+    """
+    response = await rpc.call('getSignaturesForAddress', lambda client: client.get_signatures_for_address(
+        address,
+        before=before,
+        until=until,
+        limit=min(limit, SIGNATURES_PAGE_LIMIT),
+        commitment=Confirmed,
+    ))
+    statuses = response.value
+    entries = []
+    for status in statuses:
+        if status.err is not None or not status.memo:
+            continue
+        confirmation = str(status.confirmation_status).rsplit('.', 1)[-1].lower()
+        for memo in split_rpc_memo_field(status.memo):
+            entries.append(ChainMemo(str(status.signature), status.block_time, memo, confirmation))
+
+    if len(statuses) < min(limit, SIGNATURES_PAGE_LIMIT):
+        return entries, None
+    return entries, statuses[-1].signature
+
+
+async def fetch_legacy_memos(rpc, transaction_ids):
+    """
+    Memos for transactions written before reference keys existed, which
+    are only reachable through the ids saved on the File row.
+    """
+    semaphore = asyncio.Semaphore(LEGACY_FETCH_CONCURRENCY)
+
+    async def fetch(tx_id):
+        async with semaphore:
+            response = await rpc.call('getTransaction', lambda client: client.get_transaction(
+                Signature.from_string(tx_id),
                 encoding='jsonParsed',
                 commitment='confirmed'
-            )
-            tx_detail = response.value
+            ))
+        try:
+            tx_json = json.loads(response.value.to_json())
+            for instruction in tx_json['transaction']['message']['instructions']:
+                # Check if this is a memo program instruction
+                if instruction['programId'] == MEMO_PROGRAM_ID:
+                    return ChainMemo(tx_id, tx_json['blockTime'], instruction['parsed'], 'confirmed')
+        except Exception as e:
+            logger.warning("Error processing transaction for tx_id %s: %s", tx_id, e)
+        return None
 
+    results = await asyncio.gather(*(fetch(tx_id) for tx_id in transaction_ids))
+    return [result for result in results if result is not None]
+
+
+async def anchored_digest(rpc, file):
+    """
+    The SHA-256 (hex) most recently anchored on chain for ``file`` by a
+    'hashed' record, or None if there is none.
+    """
+    address = file_reference_keypair(file.id).pubkey()
+    before = None
+    while True:
+        memos, before = await fetch_signature_page(rpc, address, before=before)
+        for chain_memo in memos:
+            if not chain_memo.memo.startswith(MEMO_PREFIX):
+                continue
             try:
-                # Convert tx_detail to JSON
-                tx_json = json.loads(tx_detail.to_json())
-
-                # Extract block time
-                block_time = tx_json['blockTime']
-                timestamp = datetime.fromtimestamp(block_time) if block_time else datetime.now()
-                timestamp = timezone.make_aware(timestamp).astimezone(pacific_tz)
-
-                # Extract instructions
-                instructions = tx_json['transaction']['message']['instructions']
-
-                for instruction in instructions:
-                    # Check if this is a memo program instruction
-                    if instruction['programId'] == MEMO_PROGRAM_ID:
-                        # Extract memo from parsed data
-                        memo = instruction['parsed']
-                        memo_parts = memo.split()
-                        user = memo_parts[0]
-                        action = memo_parts[1]
-                        access_logs.append({
-                            'timestamp': timestamp,
-                            'user':user,
-                            'action': action
-                        })
-                        break
-            except Exception as e:
-                print(f"Error processing transaction for tx_id {tx_id}: {e}")
-    
-    access_logs.sort(key=lambda x: x['timestamp'], reverse=True)
-    return access_logs
-    
+                records = decode_records(chain_memo.memo)
+            except MemoDecodeError:
+                continue
+            for record in records:
+                if record.action == 'hashed' and record.file_id == file.id and record.digest:
+                    return record.digest.hex()
+        if before is None:
+            return None
+
+
+@sync_to_async
+def unsettled_memos(file, seen_signatures):
+    events = AuditEvent.objects.filter(file=file).exclude(status__in=('confirmed', 'finalized'))
+    return [
+        ChainMemo(event.signature, None, event.memo, event.status)
+        for event in events
+        if not event.signature or event.signature not in seen_signatures
+    ]
+
+
+async def retrieve_access_logs(file, before=None, limit=100):
+    """
+    One page of a file's access history, newest first, read from the chain
+    by the file's reference address. Returns ``(entries, next_cursor)``;
+    pass ``next_cursor`` back as ``before`` for the next page, it is None
+    on the last one. ``before`` must come from parse_signature or an
+    earlier page. Raises RpcUnavailable when the chain can't be read.
+    """
+    if not SOLANA_AVAILABLE:
+        logger.info("Solana not available - would retrieve logs for: %s", file.uploaded_file)
+        return [], None
+
+    address = file_reference_keypair(file.id).pubkey()
+    async with rpc_session() as rpc:
+        memos, next_cursor = await fetch_signature_page(rpc, address, before=before, limit=limit)
+
+        if before is None:
+            # Events not visible on chain yet are shown at the top with their
+            # local status (queued, pending, failed)
+            memos.extend(await unsettled_memos(file, {memo.signature for memo in memos}))
+
+        if next_cursor is None and file.transaction_ids:
+            # Chain history is exhausted; older entries predate reference keys
+            memos.extend(await fetch_legacy_memos(rpc, file.transaction_ids))
+
+    return await build_access_log_entries(memos, file), next_cursor
+
 
 
 def load_service_keypair():
@@ -1,12 +0,0 @@
-from solana_utils import log_access
-
-# Test data
-user_id = "user123"
-file_id = "file456"
-action = "read"
-
-# Call the log_access function
-response = log_access(user_id, file_id, action)
-
-# Print the response
-print(response)
\ No newline at end of file
@@ -1,3 +1,531 @@
-from django.test import TestCase
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from backfills.runner import get_backfills, run_backfill
+from files.models import File
+from sealevel.perf import DATA_SIZES, QueryBudgetMixin, TemporaryMediaMixin
+from users.models import User
+from .models import AuditEvent
+from .resilience import CircuitBreaker, RpcUnavailable, call_rpc
+from .routing import EndpointSelector, RpcSession
+from .memo import AccessRecord, MemoDecodeError, decode_memo, encode_memo, encode_records, split_rpc_memo_field
+from .export import ExportRow, export_rows
+from . import live
+from .timeline import timeline_page
+from .solana_utils import (
+    BASE58_ALPHABET, ChainMemo, build_access_log_entries, fetch_signature_page, log_access, parse_signature,
+    track_confirmations,
+)
+
+
+@override_settings(SOLANA_ENABLED=True)
+class RequestPathRpcTests(TemporaryMediaMixin, TestCase):
+    """Read-only pages must never open a connection to the Solana RPC."""
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.file = File.objects.create(owner=self.patient, uploaded_by=self.patient,
+                                        uploaded_file=ContentFile(b'data', name='doc.txt'))
+        self.client.force_login(self.patient)
+
+    def test_read_pages_make_no_rpc_calls(self):
+        with mock.patch('access_log.solana_utils.SOLANA_AVAILABLE', True), \
+                mock.patch('access_log.solana_utils.AsyncClient', create=True) as client:
+            for name, args in [('home', []), ('file-list', []), ('file-share', [self.file.pk])]:
+                with self.subTest(page=name):
+                    response = self.client.get(reverse(name, args=args))
+                    self.assertEqual(response.status_code, 200)
+        client.assert_not_called()
+
+
+class MemoEncodingTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        memo = encode_memo('shared', 42, 1234, 1_700_000_000, target_id=7)
+        [record] = decode_memo(memo)
+        self.assertEqual(
+            (record.action, record.user_id, record.file_id, record.timestamp, record.target_id),
+            ('shared', 42, 1234, 1_700_000_000, 7),
+        )
+
+    def test_digest_round_trip(self):
+        digest = bytes(range(32))
+        memo = encode_records([
+            AccessRecord('hashed', 1, 2, 1_700_000_000, digest=digest),
+            AccessRecord('shared', 1, 2, 1_700_000_001, target_id=3),
+        ])
+        hashed, shared = decode_memo(memo)
+        self.assertEqual((hashed.action, hashed.digest), ('hashed', digest))
+        self.assertEqual((shared.target_id, shared.digest), (3, None))
+
+    def test_several_records_share_one_memo(self):
+        records = [AccessRecord('downloaded', user_id, 9, 1_700_000_000 + user_id) for user_id in range(20)]
+        decoded = decode_memo(encode_records(records))
+        self.assertEqual([record.user_id for record in decoded], list(range(20)))
+
+    def test_smaller_than_legacy_text(self):
+        legacy = "someone.with.a.long.name@example-clinic.org downloaded user_files/blood_panel_2024.pdf"
+        self.assertLess(len(encode_memo('downloaded', 123456, 654321, 1_700_000_000)), len(legacy) // 3)
+
+    def test_legacy_memo_keeps_multi_word_action(self):
+        [record] = decode_memo("a@b.com shared with c@d.com user_files/x y.pdf", 'user_files/x y.pdf')
+        self.assertEqual(record.user_email, 'a@b.com')
+        self.assertEqual(record.action, 'shared')
+        self.assertEqual(record.legacy_action, 'shared with c@d.com')
+
+    def test_legacy_memo_matches_pre_sharding_name(self):
+        [record] = decode_memo("a@b.com downloaded user_files/x y.pdf", 'user_files/ab/cd/x y.pdf')
+        self.assertEqual(record.legacy_action, 'downloaded')
+
+    def test_split_rpc_memo_field(self):
+        first = encode_memo('uploaded', 1, 2, 1_700_000_000)
+        second = "a@b.com shared with c@d.com; really x.pdf"
+        field = f"[{len(first)}] {first}; [{len(second)}] {second}"
+        self.assertEqual(split_rpc_memo_field(field), [first, second])
+
+    def test_rejects_unknown_version(self):
+        with self.assertRaises(MemoDecodeError):
+            decode_memo('sl:Ag')
+
+
+class AccessLogEntryTests(TestCase):
+
+    def test_entries_resolve_users_without_emails_on_chain(self):
+        owner = User.objects.create_user('owner@example.com', None)
+        doctor = User.objects.create_user('doctor@example.com', None, role='provider')
+        file = File.objects.create(owner=owner, uploaded_by=owner, uploaded_file='user_files/doc.txt')
+        memos = [
+            ChainMemo('sig1', None, encode_memo('uploaded', owner.id, file.id, 1_700_000_000), 'finalized'),
+            ChainMemo('sig2', None, encode_memo('shared', owner.id, file.id, 1_700_000_100, target_id=doctor.id), 'pending'),
+        ]
+        self.assertNotIn('example.com', ''.join(memo.memo for memo in memos))
+
+        with self.assertNumQueries(1):
+            entries = async_to_sync(build_access_log_entries)(memos, file)
+        self.assertEqual([entry['action'] for entry in entries], ['shared with doctor@example.com', 'uploaded'])
+        self.assertEqual(entries[0]['user'], owner)
+        self.assertEqual([entry['status'] for entry in entries], ['pending', 'finalized'])
+
+
+@override_settings(SOLANA_RPC_TIMEOUT=0.05, SOLANA_RPC_DEADLINE=0.5, SOLANA_RPC_RETRIES=2,
+                   SOLANA_RPC_BACKOFF_BASE=0.001, SOLANA_RPC_BACKOFF_CAP=0.001)
+class ResilienceTests(SimpleTestCase):
+
+    def test_idempotent_calls_are_retried(self):
+        breaker = CircuitBreaker('test', failure_threshold=10, reset_timeout=60)
+        call = mock.AsyncMock(side_effect=[ConnectionError, ConnectionError, 'ok'])
+        self.assertEqual(async_to_sync(call_rpc)('getTransaction', call, breaker=breaker), 'ok')
+        self.assertEqual(call.await_count, 3)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_non_idempotent_calls_are_not_retried(self):
+        breaker = CircuitBreaker('test', failure_threshold=10, reset_timeout=60)
+        call = mock.AsyncMock(side_effect=ConnectionError)
+        with self.assertRaises(RpcUnavailable):
+            async_to_sync(call_rpc)('sendTransaction', call, idempotent=False, breaker=breaker)
+        self.assertEqual(call.await_count, 1)
+
+    def test_hung_call_times_out(self):
+        async def hang():
+            await asyncio.sleep(10)
+
+        breaker = CircuitBreaker('test', failure_threshold=10, reset_timeout=60)
+        with self.assertRaises(RpcUnavailable):
+            async_to_sync(call_rpc)('confirmTransaction', hang, breaker=breaker)
+
+    def test_breaker_opens_and_fails_fast(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60)
+        call = mock.AsyncMock(side_effect=ConnectionError)
+        with self.assertRaises(RpcUnavailable):
+            async_to_sync(call_rpc)('getTransaction', call, breaker=breaker)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        call.reset_mock()
+        with self.assertRaises(RpcUnavailable):
+            async_to_sync(call_rpc)('getTransaction', call, breaker=breaker)
+        call.assert_not_awaited()
+
+    def test_half_open_probe_closes_breaker(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+def base58(data):
+    number = int.from_bytes(data, 'big')
+    encoded = ''
+    while number:
+        number, digit = divmod(number, 58)
+        encoded = BASE58_ALPHABET[digit] + encoded
+    return '1' * (len(data) - len(data.lstrip(b'\0'))) + encoded
+
+
+class SignaturePageTests(SimpleTestCase):
+
+    def test_parse_signature_accepts_only_signatures(self):
+        for data in (bytes(range(64)), b'\xff' * 64, b'\0\0' + b'\x07' * 62):
+            with self.subTest(data=data):
+                self.assertEqual(parse_signature(base58(data)), base58(data))
+        for junk in ('', 'junk', '0' * 88, base58(b'\xff' * 65), base58(b'\x01' * 32), None):
+            with self.subTest(junk=junk), self.assertRaises(ValueError):
+                parse_signature(junk)
+
+    def fetch(self, statuses, before=None, limit=3):
+        client = mock.Mock()
+        client.get_signatures_for_address.return_value = mock.Mock(value=statuses)
+
+        class Rpc:
+            async def call(self, method, invoke):
+                return invoke(client)
+
+        with mock.patch('access_log.solana_utils.Confirmed', 'confirmed', create=True):
+            result = async_to_sync(fetch_signature_page)(Rpc(), 'address', before=before, limit=limit)
+        return result, client.get_signatures_for_address.call_args
+
+    def status(self, signature, memo='[5] hello', err=None):
+        return mock.Mock(signature=signature, memo=memo, err=err, block_time=100,
+                         confirmation_status='TransactionConfirmationStatus.Finalized')
+
+    def test_full_page_returns_last_signature_as_cursor(self):
+        statuses = [self.status('s1'), self.status('s2', memo=None), self.status('s3', err='failed')]
+        (memos, cursor), call = self.fetch(statuses, before='s0')
+        self.assertEqual(call.kwargs['before'], 's0')
+        self.assertEqual(call.kwargs['limit'], 3)
+        # Failed and memo-less transactions are skipped but still page
+        self.assertEqual(memos, [ChainMemo('s1', 100, 'hello', 'finalized')])
+        self.assertEqual(cursor, 's3')
+
+    def test_short_page_is_the_last(self):
+        (memos, cursor), _ = self.fetch([self.status('s1', memo='[1] a; [1] b')])
+        self.assertEqual([memo.memo for memo in memos], ['a', 'b'])
+        self.assertIsNone(cursor)
+
+
+class RateLimited(Exception):
+    response = mock.Mock(status_code=429, headers={'Retry-After': '60'})
+
+
+@override_settings(SOLANA_RPC_TIMEOUT=0.05, SOLANA_RPC_DEADLINE=0.5, SOLANA_RPC_RETRIES=2,
+                   SOLANA_RPC_BACKOFF_BASE=0.001, SOLANA_RPC_BACKOFF_CAP=0.001, SOLANA_RPC_WRITE_FANOUT=2)
+class RoutingTests(SimpleTestCase):
+
+    def session(self, *urls):
+        return RpcSession(EndpointSelector(urls), lambda url: mock.Mock(url=url, close=mock.AsyncMock()))
+
+    def test_reads_go_to_the_fastest_endpoint(self):
+        session = self.session('https://slow.example', 'https://fast.example')
+        slow, fast = session.selector.endpoints
+        slow.record(0.5)
+        fast.record(0.05)
+        call = mock.AsyncMock(return_value='ok')
+        async_to_sync(session.call)('getTransaction', call)
+        call.assert_awaited_once_with(session.client(fast))
+
+    def test_rate_limited_endpoint_is_ejected_and_call_fails_over(self):
+        session = self.session('https://a.example', 'https://b.example')
+        first, second = session.selector.endpoints
+
+        async def call(client):
+            if client.url == first.url:
+                raise RateLimited()
+            return client.url
+
+        self.assertEqual(async_to_sync(session.call)('getTransaction', call), second.url)
+        self.assertFalse(first.available())
+        self.assertEqual(session.selector.ranked(), [second])
+
+    def test_rate_limit_wrapped_by_the_client_library_is_recognised(self):
+        session = self.session('https://a.example', 'https://b.example')
+        first, second = session.selector.endpoints
+
+        class SolanaRpcException(Exception):
+            pass
+
+        async def call(client):
+            if client.url == first.url:
+                # As solana-py raises it: its own exception, from the httpx one
+                try:
+                    raise RateLimited()
+                except RateLimited as e:
+                    raise SolanaRpcException('HTTP status error') from e
+            return client.url
+
+        self.assertEqual(async_to_sync(session.call)('getTransaction', call), second.url)
+        self.assertFalse(first.available())
+
+    def test_broadcast_returns_first_success(self):
+        session = self.session('https://a.example', 'https://b.example')
+
+        async def call(client):
+            if client.url == 'https://a.example':
+                await asyncio.sleep(10)
+            return client.url
+
+        result = async_to_sync(session.broadcast)('sendTransaction', call)
+        self.assertEqual(result, 'https://b.example')
+
+
+class AuditQueueTests(TestCase):
+
+    def test_failed_write_is_queued_not_raised(self):
+        user = User.objects.create_user('patient@example.com', None)
+        file = File.objects.create(owner=user, uploaded_by=user, uploaded_file='user_files/doc.txt')
+        with override_settings(SOLANA_ENABLED=True), mock.patch('access_log.solana_utils.SOLANA_AVAILABLE', True), \
+                mock.patch('access_log.solana_utils.send_memo', side_effect=RpcUnavailable('down')):
+            async_to_sync(log_access)(user, 'downloaded', file)
+
+        event = AuditEvent.objects.get()
+        self.assertEqual((event.file, event.owner, event.status), (file, user, 'queued'))
+        [record] = decode_memo(event.memo)
+        self.assertEqual((record.action, record.user_id, record.file_id), ('downloaded', user.id, file.id))
+
+    def test_access_is_recorded_with_the_chain_off(self):
+        patient = User.objects.create_user('patient@example.com', None)
+        provider = User.objects.create_user('provider@example.com', None, role='provider')
+        file = File.objects.create(owner=patient, uploaded_by=provider, uploaded_file='user_files/doc.txt')
+        with mock.patch('access_log.solana_utils.send_memo') as send_memo:
+            async_to_sync(log_access)(provider, 'downloaded', file)
+        send_memo.assert_not_called()
+        self.assertEqual(AuditEvent.objects.get().status, 'local')
+
+        entries, _ = timeline_page(patient)
+        self.assertEqual([(entry['user'], entry['action'], entry['status']) for entry in entries],
+                         [(provider, 'downloaded', 'local')])
+
+    def test_tracker_finalizes_and_resends_expired(self):
+        user = User.objects.create_user('patient@example.com', None)
+        file = File.objects.create(owner=user, uploaded_by=user, uploaded_file='user_files/doc.txt')
+        landed = AuditEvent.objects.create(file=file, memo=encode_memo('uploaded', user.id, file.id, 1), status='pending',
+                                           signature='landed', last_valid_block_height=100)
+        expired = AuditEvent.objects.create(file=file, memo=encode_memo('downloaded', user.id, file.id, 2), status='pending',
+                                            signature='dropped', last_valid_block_height=100)
+        outcomes = mock.AsyncMock(return_value=(150, {'landed': 'finalized', 'dropped': None}))
+        with mock.patch('access_log.solana_utils.fetch_signature_outcomes', outcomes), \
+                mock.patch('access_log.solana_utils.send_memo', return_value=('resent', 300)) as send_memo:
+            moved = track_confirmations()
+
+        self.assertEqual(moved, {'finalized': 1, 'pending': 1})
+        landed.refresh_from_db()
+        expired.refresh_from_db()
+        self.assertEqual(landed.status, 'finalized')
+        self.assertEqual((expired.status, expired.signature, expired.attempts), ('pending', 'resent', 1))
+        send_memo.assert_called_once()
+
+
+class AuditExportTests(TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.files = [
+            File.objects.create(owner=self.patient, uploaded_by=self.patient, uploaded_file=f'user_files/{name}.txt')
+            for name in ('a', 'b')
+        ]
+
+    def chain(self, histories):
+        """Patch the chain so each file's history (newest first) is served at most two memos per page."""
+        calls = []
+
+        async def fetch_page(rpc, address, before=None, limit=None):
+            calls.append((address, before, limit))
+            history = histories[address]
+            offset = int(before or 0)
+            size = min(limit, 2)
+            page = [ChainMemo(f'{address}-{i}', block_time, encode_memo('downloaded', self.patient.id, address, block_time), 'finalized')
+                    for i, block_time in enumerate(history[offset:offset + size], start=offset)]
+            return page, (str(offset + size) if offset + size < len(history) else None)
+
+        keypair = mock.Mock()
+        keypair.side_effect = lambda file_id: mock.Mock(pubkey=lambda: file_id)
+        patches = [
+            mock.patch('access_log.export.SOLANA_AVAILABLE', True),
+            mock.patch('access_log.export.fetch_signature_page', fetch_page),
+            mock.patch('access_log.export.file_reference_keypair', keypair),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return calls
+
+    def export(self, start, end):
+        async def collect():
+            files = File.objects.filter(pk__in=[file.pk for file in self.files])
+            return [row async for row in export_rows(files, start, end)]
+        return async_to_sync(collect)()
+
+    def test_merges_files_newest_first_within_range(self):
+        a, b = self.files
+        calls = self.chain({a.id: [900, 500, 300, 100, 50, 10], b.id: [800, 700, 400, 200]})
+        AuditEvent.objects.create(file=a, memo=encode_memo('shared', self.patient.id, a.id, 950), status='queued')
+
+        rows = self.export(start=250, end=850)
+
+        self.assertEqual([datetime.fromisoformat(row.timestamp).timestamp() for row in rows], [800, 700, 500, 400, 300])
+        self.assertEqual([row.file_id for row in rows], [b.id, b.id, a.id, b.id, a.id])
+        # Paging stops at the first memo older than the range
+        self.assertEqual(len(calls), 4)
+
+    def test_pending_event_already_on_chain_is_listed_once(self):
+        a, _ = self.files
+        self.chain({a.id: [500], self.files[1].id: []})
+        AuditEvent.objects.create(file=a, memo=encode_memo('downloaded', self.patient.id, a.id, 500),
+                                  status='pending', signature=f'{a.id}-0')
+        self.assertEqual([row.signature for row in self.export(0, 10**10)], [f'{a.id}-0'])
+
+    def test_pages_share_one_budget_across_files(self):
+        a, b = self.files
+        calls = self.chain({a.id: [500, 400, 300], b.id: [450, 350]})
+        with mock.patch('access_log.export.EXPORT_MEMO_BUDGET', 2):
+            rows = self.export(0, 10**10)
+        self.assertEqual([datetime.fromisoformat(row.timestamp).timestamp() for row in rows], [500, 450, 400, 350, 300])
+        # Two files share two memos of read-ahead: one memo per page each
+        self.assertEqual({limit for _, _, limit in calls}, {1})
+
+    def test_view_streams_csv_of_own_files_only(self):
+        other = User.objects.create_user('other@example.com', None)
+        File.objects.create(owner=other, uploaded_by=other, uploaded_file='user_files/c.txt')
+        exported = []
+
+        async def fake_rows(files, start, end):
+            # Evaluated back on the test's connection, which holds the rows
+            exported.append(files)
+            yield ExportRow('2024-01-01T00:00:00+00:00', self.files[0].id, 'a.txt', 'patient@example.com', 'downloaded', 'sig', 'finalized')
+
+        self.client.force_login(self.patient)
+        with mock.patch('access_log.export.export_rows', fake_rows):
+            response = self.client.get(reverse('audit-export'), {'start': '2024-01-01', 'end': '2024-01-31'})
+            body = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(sorted(file.id for file in exported[0]), sorted(file.id for file in self.files))
+        self.assertEqual(body.splitlines()[0], 'timestamp,file_id,file_name,user,action,signature,status')
+        self.assertIn('downloaded,sig,finalized', body)
+        self.assertEqual(self.client.get(reverse('audit-export'), {'user': 'other@example.com'}).status_code, 403)
+
+
+@override_settings(ACCESS_LOG_LIVE_POLL_INTERVAL=0.01)
+class LiveAccessLogTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.file = File.objects.create(owner=self.patient, uploaded_by=self.patient,
+                                        uploaded_file=ContentFile(b'data', name='doc.txt'))
+
+    def record(self, action='downloaded'):
+        return AuditEvent.objects.create(file=self.file, memo=encode_memo(action, self.patient.id, self.file.id, 1700000000))
+
+    def test_viewers_share_one_feed_and_see_status_changes(self):
+        async def watch():
+            key = await live.latest_key(self.file.id)
+            viewers = [live.follow(self.file, key) for _ in range(3)]
+            first = [asyncio.ensure_future(anext(viewer)) for viewer in viewers]
+            await asyncio.sleep(0.05)
+            self.assertEqual(len(live._feeds[asyncio.get_running_loop()]), 1)
+
+            event = await sync_to_async(self.record)()
+            recorded = await asyncio.wait_for(asyncio.gather(*first), 2)
+            await sync_to_async(AuditEvent.objects.filter(pk=event.pk).update)(status='confirmed', updated_at=timezone.now())
+            confirmed = await asyncio.wait_for(asyncio.gather(*(anext(viewer) for viewer in viewers)), 2)
+            for viewer in viewers:
+                await viewer.aclose()
+            self.assertEqual(live._feeds[asyncio.get_running_loop()], {})
+            return recorded, confirmed
+
+        recorded, confirmed = async_to_sync(watch)()
+        self.assertEqual({(change.event_id, change.status) for change in recorded}, {(AuditEvent.objects.get().pk, 'queued')})
+        self.assertEqual({change.status for change in confirmed}, {'confirmed'})
+        self.assertEqual(recorded[0].entries[0]['user'], 'patient@example.com')
+
+    def test_late_commit_behind_the_cursor_is_sent_once(self):
+        async def watch():
+            viewer = live.follow(self.file, await live.latest_key(self.file.id))
+            first = asyncio.ensure_future(anext(viewer))
+            await asyncio.sleep(0.05)
+            on_time = await sync_to_async(self.record)()
+            sent = [await asyncio.wait_for(first, 2)]
+            # Stamped before the change already sent, but committed after it
+            late = await sync_to_async(self.record)()
+            await sync_to_async(AuditEvent.objects.filter(pk=late.pk).update)(
+                updated_at=on_time.updated_at - timedelta(seconds=1),
+            )
+            sent.append(await asyncio.wait_for(anext(viewer), 2))
+            # Later polls re-read both; neither is sent again
+            with mock.patch.object(live, 'HEARTBEAT_SECONDS', 0.1):
+                sent.append(await asyncio.wait_for(anext(viewer), 2))
+            await viewer.aclose()
+            return on_time, late, sent
+
+        on_time, late, sent = async_to_sync(watch)()
+        self.assertEqual([change and change.event_id for change in sent], [on_time.pk, late.pk, None])
+
+    def test_stream_resumes_from_last_event_id(self):
+        seen = self.record('uploaded')
+        self.record('downloaded')
+        self.client.force_login(self.patient)
+        response = self.client.get(
+            reverse('file-access-log-stream', args=[self.file.pk]),
+            headers={'Last-Event-ID': live.format_key((seen.updated_at, seen.pk))},
+        )
+        body = response.content.decode()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('"action": "downloaded"', body)
+        self.assertNotIn('"action": "uploaded"', body)
+        # Outside ASGI the browser is told to reconnect rather than held open
+        self.assertIn('retry: ', body)
+
+        self.client.force_login(User.objects.create_user('stranger@example.com', None))
+        self.assertEqual(self.client.get(reverse('file-access-log-stream', args=[self.file.pk])).status_code, 403)
+
+
+class AccessTimelineTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.provider = User.objects.create_user('provider@example.com', None, role='provider')
+
+    def record(self, file, user, action='downloaded'):
+        return AuditEvent.objects.create(
+            file=file, owner_id=file.owner_id, memo=encode_memo(action, user.id, file.id, 1700000000),
+        )
+
+    def make_file(self, owner, name='doc.txt'):
+        return File.objects.create(owner=owner, uploaded_by=owner, uploaded_file=f'user_files/{name}')
+
+    def test_pages_span_files_newest_first(self):
+        files = [self.make_file(self.patient, f'doc{index}.txt') for index in range(3)]
+        events = [self.record(files[index % 3], self.provider) for index in range(5)]
+        self.record(self.make_file(self.provider), self.provider)
+
+        first, cursor = timeline_page(self.patient, limit=3)
+        rest, last_cursor = timeline_page(self.patient, before=cursor, limit=3)
+        self.assertIsNone(last_cursor)
+        self.assertEqual(
+            [entry['file'] for entry in first + rest], [event.file for event in reversed(events)],
+        )
+        self.assertEqual(first[0]['user'], self.provider)
+
+    def test_page_cost_does_not_grow_with_history(self):
+        self.client.force_login(self.patient)
+        for size in DATA_SIZES:
+            with self.subTest(size=size):
+                for index in range(size):
+                    self.record(self.make_file(self.patient, f'doc{size}-{index}.txt'), self.provider)
+                # Session, user, the events page and the users it mentions
+                with self.assertQueryBudget(4, f'access-timeline with {size} more files'):
+                    response = self.client.get(reverse('access-timeline'))
+                self.assertEqual(response.status_code, 200)
+
+    def test_backfill_sets_owner_from_file(self):
+        file = self.make_file(self.patient)
+        event = AuditEvent.objects.create(file=file, memo=encode_memo('downloaded', self.provider.id, file.id, 1700000000))
+        run_backfill(get_backfills()['audit-event-owner']())
+        event.refresh_from_db()
+        self.assertEqual(event.owner, self.patient)
@@ -0,0 +1,57 @@
+"""
+A patient's access timeline: every recorded access to any file they own,
+newest first.
+
+It reads AuditEvents by their owner rather than the chain, so a page is
+one index range scan on (owner, created_at, id) plus one query for the
+users it mentions, however many files and events the patient has. Pages
+are keyed by the last (created_at, id) shown, in the same format as the
+live access log's event ids.
+"""
+
+from django.db.models import Q
+
+from users.models import User
+from .live import format_key, parse_key
+from .memo import MemoDecodeError, decode_records
+from .models import AuditEvent
+from .solana_utils import _local_time, describe_action
+
+PAGE_SIZE = 50
+
+
+def timeline_page(owner, before=None, limit=PAGE_SIZE):
+    """
+    One page of accesses to ``owner``'s files. Returns ``(entries,
+    next_cursor)``; pass ``next_cursor`` back as ``before`` for the next
+    page, it is None on the last one.
+    """
+    events = AuditEvent.objects.filter(owner=owner).select_related('file').order_by('-created_at', '-id')
+    key = parse_key(before)
+    if key:
+        created_at, event_id = key
+        events = events.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=event_id))
+    page = list(events[:limit + 1])
+    next_cursor = format_key((page[limit - 1].created_at, page[limit - 1].id)) if len(page) > limit else None
+    page = page[:limit]
+
+    decoded = []
+    for event in page:
+        try:
+            decoded.append((event, decode_records(event.memo)))
+        except MemoDecodeError:
+            continue
+    user_ids = {id for _, records in decoded for record in records for id in (record.user_id, record.target_id) if id}
+    users = User.objects.in_bulk(user_ids) if user_ids else {}
+
+    entries = []
+    for event, records in decoded:
+        for record in records:
+            entries.append({
+                'timestamp': _local_time(record.timestamp or event.created_at.timestamp()),
+                'file': event.file,
+                'user': users.get(record.user_id) or record.user_email or 'unknown user',
+                'action': describe_action(record, users),
+                'status': event.status,
+            })
+    return entries, next_cursor
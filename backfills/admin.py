@@ -0,0 +1,9 @@
+from django.contrib import admin
+
+from .models import BackfillCheckpoint
+
+
+@admin.register(BackfillCheckpoint)
+class BackfillCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_pk', 'rows_processed', 'rows_updated', 'updated_at', 'completed_at')
+    readonly_fields = ('started_at', 'updated_at')
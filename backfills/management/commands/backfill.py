@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from backfills.models import BackfillCheckpoint
+from backfills.runner import Throttle, get_backfills, run_backfill
+
+
+class Command(BaseCommand):
+    help = "Run a registered data backfill in small resumable batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', help="Backfill to run; omit to list them.")
+        parser.add_argument('--batch-size', type=int, help="Rows per batch (default: the backfill's own).")
+        parser.add_argument('--max-rate', type=float, default=0, help="Rows per second, 0 for no limit.")
+        parser.add_argument('--max-lag', type=float, default=5,
+                            help="Pause while a replica is more than this many seconds behind.")
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches.")
+        parser.add_argument('--reset', action='store_true', help="Ignore the checkpoint and start from the beginning.")
+
+    def handle(self, *args, **options):
+        backfills = get_backfills()
+        if not options['name']:
+            checkpoints = {checkpoint.name: checkpoint for checkpoint in BackfillCheckpoint.objects.all()}
+            for name in sorted(backfills):
+                checkpoint = checkpoints.get(name)
+                if checkpoint is None:
+                    state = "not started"
+                elif checkpoint.completed_at:
+                    state = f"completed {checkpoint.completed_at:%Y-%m-%d %H:%M}"
+                else:
+                    state = f"at pk {checkpoint.last_pk}, {checkpoint.rows_processed} rows"
+                self.stdout.write(f"{name}: {state}")
+            return
+
+        if options['name'] not in backfills:
+            raise CommandError(f"Unknown backfill {options['name']!r}; run without a name to list them.")
+
+        checkpoint = run_backfill(
+            backfills[options['name']](),
+            batch_size=options['batch_size'],
+            throttle=Throttle(max_rate=options['max_rate'], max_lag=options['max_lag']),
+            reset=options['reset'],
+            max_batches=options['max_batches'],
+            progress=lambda checkpoint: self.stdout.write(
+                f"pk {checkpoint.last_pk}: {checkpoint.rows_processed} processed, {checkpoint.rows_updated} updated"
+            ),
+        )
+        state = "complete" if checkpoint.completed_at else "paused"
+        self.stdout.write(f"Backfill {checkpoint.name} {state}: {checkpoint.rows_updated} rows updated.")
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:06
+
+from django.db import migrations, models
+
+
+def copy_checkpoints(apps, schema_editor):
+    # Checkpoints used to live in the files app; keep runs resumable
+    Old = apps.get_model('files', 'BackfillCheckpoint')
+    New = apps.get_model('backfills', 'BackfillCheckpoint')
+    for old in Old.objects.all():
+        new = New.objects.create(
+            name=old.name, last_pk=old.last_pk, rows_processed=old.rows_processed,
+            rows_updated=old.rows_updated, completed_at=old.completed_at,
+        )
+        # update() skips auto_now, which stamped the times on create
+        New.objects.filter(pk=new.pk).update(started_at=old.started_at, updated_at=old.updated_at)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('files', '0015_backfillcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackfillCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('last_pk', models.BigIntegerField(blank=True, null=True)),
+                ('rows_processed', models.BigIntegerField(default=0)),
+                ('rows_updated', models.BigIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(copy_checkpoints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import models
+
+
+class BackfillCheckpoint(models.Model):
+    """Progress of a data backfill (backfills.runner), so it can resume."""
+    name = models.CharField(max_length=100, unique=True)
+    # Backfills walk integer primary keys in order
+    last_pk = models.BigIntegerField(null=True, blank=True)
+    rows_processed = models.BigIntegerField(default=0)
+    rows_updated = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Backfill {self.name} at pk {self.last_pk}"
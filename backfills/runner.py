@@ -0,0 +1,152 @@
+"""
+Framework for long data backfills, run by ``manage.py backfill`` rather
+than inside a schema migration.
+
+A backfill walks its queryset in primary-key order a batch at a time.
+Reading a batch and process() (which may hash files or call out) happen
+outside any transaction; only the bulk_update of ``fields`` and the
+checkpoint are written in one short transaction, so no locks are held
+while the slow part runs. The checkpoint records the last pk finished, so
+an interrupted run resumes where it stopped. Between batches it throttles
+to a row rate and waits while any read replica (REPLICA_DATABASES) lags
+too far behind.
+
+Backfills live in ``<app>/backfills.py``::
+
+    @register
+    class FillThing(Backfill):
+        name = 'fill-thing'
+        model = 'files.File'
+        fields = ['thing']
+
+        def get_queryset(self):
+            return super().get_queryset().filter(thing='')
+
+        def process(self, objects):
+            for obj in objects:
+                obj.thing = compute(obj)
+            return objects
+"""
+
+import logging
+import time
+
+from django.apps import apps
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from sealevel.db_router import pin_to_primary, replica_lags
+from .models import BackfillCheckpoint
+
+logger = logging.getLogger(__name__)
+
+BACKFILLS = {}
+
+
+class Backfill:
+    name = None
+    # "app_label.ModelName"
+    model = None
+    # Fields process() may change; passed to bulk_update
+    fields = []
+    batch_size = 500
+
+    def get_model(self):
+        return apps.get_model(self.model)
+
+    def get_queryset(self):
+        return self.get_model()._default_manager.all()
+
+    def process(self, objects):
+        """
+        Change ``objects`` in place and return the ones to save. Runs
+        outside the batch's transaction.
+        """
+        raise NotImplementedError
+
+
+def register(backfill_class):
+    BACKFILLS[backfill_class.name] = backfill_class
+    return backfill_class
+
+
+def get_backfills():
+    autodiscover_modules('backfills')
+    return BACKFILLS
+
+
+def replication_lag():
+    """Worst replay lag in seconds across replicas, 0 with none configured."""
+    return max(replica_lags().values(), default=0.0)
+
+
+class Throttle:
+    """Keeps a run under ``max_rate`` rows per second and ``max_lag`` seconds of replica lag."""
+
+    def __init__(self, max_rate=None, max_lag=None, lag_check=replication_lag, sleep=time.sleep):
+        self.max_rate = max_rate
+        self.max_lag = max_lag
+        self.lag_check = lag_check
+        self.sleep = sleep
+        self.start = time.monotonic()
+        self.rows = 0
+
+    def wait(self, rows):
+        self.rows += rows
+        if self.max_rate:
+            ahead = self.rows / self.max_rate - (time.monotonic() - self.start)
+            if ahead > 0:
+                self.sleep(ahead)
+        if self.max_lag is not None:
+            while (lag := self.lag_check()) > self.max_lag:
+                logger.info("Replica lag %.1fs is over %.1fs, pausing backfill", lag, self.max_lag)
+                self.sleep(min(lag - self.max_lag, 10) + 0.5)
+
+
+def run_backfill(backfill, batch_size=None, throttle=None, reset=False, max_batches=None, progress=None):
+    """
+    Run ``backfill`` (an instance) from its checkpoint to the end, or for
+    ``max_batches`` batches. ``progress`` is called with the checkpoint
+    after each batch. Returns the checkpoint.
+    """
+    batch_size = batch_size or backfill.batch_size
+    throttle = throttle or Throttle()
+    checkpoint, _ = BackfillCheckpoint.objects.get_or_create(name=backfill.name)
+    if reset:
+        checkpoint.last_pk = None
+        checkpoint.rows_processed = checkpoint.rows_updated = 0
+        checkpoint.completed_at = None
+        checkpoint.save()
+
+    # Batches are read outside a transaction; a lagging replica would hand
+    # back rows that were already done
+    pin_to_primary()
+    model = backfill.get_model()
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        queryset = backfill.get_queryset().order_by('pk')
+        if checkpoint.last_pk is not None:
+            queryset = queryset.filter(pk__gt=checkpoint.last_pk)
+
+        objects = list(queryset[:batch_size])
+        if not objects:
+            checkpoint.completed_at = timezone.now()
+            checkpoint.save(update_fields=['completed_at', 'updated_at'])
+            break
+        changed = backfill.process(objects)
+        with transaction.atomic():
+            # Only ``fields`` are written, so concurrent changes to the
+            # rest of a row since it was read are kept
+            if changed:
+                model._default_manager.bulk_update(changed, backfill.fields)
+            checkpoint.last_pk = objects[-1].pk
+            checkpoint.rows_processed += len(objects)
+            checkpoint.rows_updated += len(changed)
+            checkpoint.save(update_fields=['last_pk', 'rows_processed', 'rows_updated', 'updated_at'])
+
+        batches += 1
+        if progress:
+            progress(checkpoint)
+        throttle.wait(len(objects))
+    return checkpoint
@@ -0,0 +1,50 @@
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from users.models import User
+from .models import BackfillCheckpoint
+from .runner import Backfill, Throttle, run_backfill
+
+
+class EmailDomainBackfill(Backfill):
+    name = 'test-email-domain'
+    model = 'users.User'
+    fields = ['email']
+
+    def __init__(self):
+        self.depths = []
+
+    def get_queryset(self):
+        return super().get_queryset().filter(email__endswith='@old.example')
+
+    def process(self, objects):
+        self.depths.append(len(connection.atomic_blocks))
+        for user in objects:
+            user.email = user.email.replace('@old.example', '@new.example')
+        return objects
+
+
+class RunBackfillTests(TestCase):
+
+    def setUp(self):
+        for index in range(3):
+            User.objects.create_user(f'user{index}@old.example', None)
+
+    def test_processes_outside_the_batch_transaction(self):
+        backfill = EmailDomainBackfill()
+        checkpoint = run_backfill(backfill, batch_size=2)
+        # No transaction beyond the test case's own is open in process()
+        self.assertEqual(backfill.depths, [len(connection.atomic_blocks)] * 2)
+        self.assertEqual(checkpoint.rows_updated, 3)
+        self.assertFalse(User.objects.filter(email__endswith='@old.example').exists())
+        self.assertEqual(BackfillCheckpoint.objects.get(name=backfill.name).rows_processed, 3)
+
+
+class ThrottleTests(SimpleTestCase):
+
+    def test_waits_out_replica_lag(self):
+        lags = iter([12.0, 3.0])
+        sleeps = []
+        throttle = Throttle(max_lag=5, lag_check=lambda: next(lags), sleep=sleeps.append)
+        throttle.wait(10)
+        self.assertEqual(len(sleeps), 1)
@@ -1,18 +1,37 @@
 # files/admin.py
 
 from django.contrib import admin
-from .models import File, FileAccess
+from sealevel.paginator import EstimatedCountPaginator
+from .models import File, FileAccess, ShareLink
 
 @admin.register(File)
 class FileAdmin(admin.ModelAdmin):
-    list_display = ('id', 'owner', 'uploaded_file')
+    list_display = ('id', 'owner', 'uploaded_by', 'uploaded_file', 'uploaded_date')
+    list_select_related = ('owner', 'uploaded_by')
+    # Backed by trigram indexes on Postgres (see migration 0011)
     search_fields = ('owner__email', 'uploaded_file')
-    list_filter = ('uploaded_date',)
+    date_hierarchy = 'uploaded_date'
     ordering = ('-uploaded_date',)
+    raw_id_fields = ('owner', 'uploaded_by', 'shared_with')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(FileAccess)
 class FileAccessAdmin(admin.ModelAdmin):
     list_display = ('file', 'user', 'access_granted_at')
-    search_fields = ('file__file', 'user__email')
-    list_filter = ('access_granted_at',)
-    ordering = ('-access_granted_at',)
\ No newline at end of file
+    list_select_related = ('file', 'user')
+    search_fields = ('file__uploaded_file', 'user__email')
+    date_hierarchy = 'access_granted_at'
+    ordering = ('-access_granted_at',)
+    raw_id_fields = ('file', 'user')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(ShareLink)
+class ShareLinkAdmin(admin.ModelAdmin):
+    list_display = ('token_id', 'file', 'created_by', 'created_at', 'expires_at', 'revoked_at')
+    list_select_related = ('file', 'created_by')
+    search_fields = ('token_id', 'created_by__email')
+    ordering = ('-created_at',)
+    raw_id_fields = ('file', 'created_by')
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class FilesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "files"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from monitoring.metrics import PROMETHEUS_AVAILABLE, register_scrape_collector
+        if PROMETHEUS_AVAILABLE:
+            from .metrics import StorageTierCollector
+            register_scrape_collector(StorageTierCollector())
@@ -0,0 +1,124 @@
+import errno
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+
+from django.conf import settings
+
+from backfills.runner import Backfill, register
+from .encryption import blob_size
+from .models import File, sharded_upload_path
+from .tiering import ARCHIVE, ArchiveReader, archive_path
+
+logger = logging.getLogger(__name__)
+
+
+@register
+class FileContentHashBackfill(Backfill):
+    """SHA-256 for files uploaded before the pipeline recorded it."""
+    name = 'file-sha256'
+    model = 'files.File'
+    fields = ['sha256']
+    batch_size = 100
+
+    def get_queryset(self):
+        return super().get_queryset().filter(sha256='', tier='hot').only('pk', 'uploaded_file', 'sha256')
+
+    def process(self, objects):
+        changed = []
+        for file in objects:
+            digest = hashlib.sha256()
+            try:
+                with file.uploaded_file.open('rb') as handle:
+                    for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+                        digest.update(chunk)
+            except OSError:
+                continue
+            file.sha256 = digest.hexdigest()
+            changed.append(file)
+        return changed
+
+
+@register
+class FileMetadataBackfill(Backfill):
+    """Size, content type and name for files uploaded before they were recorded."""
+    name = 'file-metadata'
+    model = 'files.File'
+    fields = ['size', 'content_type', 'original_name']
+
+    def get_queryset(self):
+        return super().get_queryset().filter(size__isnull=True).only('pk', 'uploaded_file', 'tier')
+
+    def process(self, objects):
+        changed = []
+        for file in objects:
+            try:
+                if file.tier == ARCHIVE:
+                    with ArchiveReader(archive_path(file)) as reader:
+                        file.size = reader.size
+                else:
+                    file.size = blob_size(file.uploaded_file.path)
+            except OSError:
+                continue
+            # The name as uploaded is gone; the stored one is the closest
+            file.original_name = os.path.basename(file.uploaded_file.name)[:255]
+            file.content_type = mimetypes.guess_type(file.original_name)[0] or 'application/octet-stream'
+            changed.append(file)
+        return changed
+
+
+def _link(source, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+            raise
+        # No hard links here; a copy is slower but just as safe
+        shutil.copy2(source, target)
+        # The old copy's grace period in collect_garbage starts now
+        os.utime(source)
+
+
+@register
+class ShardFilesBackfill(Backfill):
+    """
+    Moves blobs from the old flat user_files/ directory into the sharded
+    layout (see sharded_upload_path). A blob is hard-linked under its new
+    name before its row changes. The old name is left for collect_garbage to
+    remove after its grace period, so downloads find the blob under
+    whichever name they read.
+    """
+    name = 'shard-files'
+    model = 'files.File'
+    fields = ['uploaded_file']
+    batch_size = 200
+
+    def get_queryset(self):
+        return super().get_queryset().filter(uploaded_file__regex=r'^user_files/[^/]+$').only(
+            'pk', 'uploaded_file', 'sha256', 'tier',
+        )
+
+    def process(self, objects):
+        storage = File._meta.get_field('uploaded_file').storage
+        changed = []
+        for file in objects:
+            old_name = file.uploaded_file.name
+            new_name = storage.get_available_name(
+                sharded_upload_path(file, os.path.basename(old_name)), max_length=255,
+            )
+            moves = [
+                (storage.path(old_name), storage.path(new_name)),
+                (os.path.join(settings.ARCHIVE_ROOT, old_name + '.gz'), os.path.join(settings.ARCHIVE_ROOT, new_name + '.gz')),
+            ]
+            moves = [(source, target) for source, target in moves if os.path.exists(source)]
+            if not moves:
+                logger.warning("File %s has no blob at %s; leaving it for verify_files", file.pk, old_name)
+                continue
+            for source, target in moves:
+                _link(source, target)
+            file.uploaded_file.name = new_name
+            changed.append(file)
+        return changed
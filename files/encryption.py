@@ -0,0 +1,238 @@
+"""
+Encryption at rest for stored blobs, in a format that keeps random access.
+
+A blob is a small header followed by fixed-size chunks, each sealed on its
+own with AES-256-GCM::
+
+    b'SLVENC' | version (1) | chunk size (4) | salt (16)
+    chunk 0: ciphertext (chunk size) | tag (16)
+    chunk 1: ...
+    last chunk: ciphertext (0..chunk size) | tag (16)
+
+Every chunk but the last is full, so chunk i starts at a fixed offset and
+the plaintext size follows from the blob's size: the header is all the
+index a reader needs, and reading any range decrypts only the chunks it
+covers. Each blob gets its own key, derived from STORAGE_ENCRYPTION_KEY and
+the salt, so chunk numbers are safe to use as nonces. The header, the
+chunk number and whether it is the last chunk are authenticated with each
+chunk, so chunks can't be swapped, reordered or cut off unnoticed.
+
+Blobs are recognised by their magic, so files stored before encryption was
+turned on still read as they are. This module must not import models: the
+integrity and preview worker processes open blobs through it.
+"""
+
+import base64
+import io
+import os
+import struct
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# cryptography is optional; without it blobs are stored in the clear and
+# encrypted ones can't be read
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    CRYPTOGRAPHY_AVAILABLE = True
+except ImportError:
+    CRYPTOGRAPHY_AVAILABLE = False
+
+MAGIC = b'SLVENC'
+VERSION = 1
+_HEADER = struct.Struct('>6sBI16s')
+HEADER_SIZE = _HEADER.size
+TAG_SIZE = 16
+# Small enough that a Range request decrypts little it doesn't send,
+# large enough that tags cost 0.02%
+CHUNK_SIZE = 64 * 1024
+
+
+class CorruptBlob(OSError):
+    """An encrypted blob that fails authentication or is cut short."""
+
+
+def master_key():
+    """The configured STORAGE_ENCRYPTION_KEY as bytes, or None when encryption is off."""
+    value = getattr(settings, 'STORAGE_ENCRYPTION_KEY', '')
+    if not value:
+        return None
+    if not CRYPTOGRAPHY_AVAILABLE:
+        raise ImproperlyConfigured("STORAGE_ENCRYPTION_KEY is set but the cryptography package is not installed.")
+    key = base64.urlsafe_b64decode(value)
+    if len(key) != 32:
+        raise ImproperlyConfigured("STORAGE_ENCRYPTION_KEY must be 32 bytes, urlsafe-base64 encoded.")
+    return key
+
+
+def _blob_cipher(key, salt):
+    blob_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=b'sealevel blob').derive(key)
+    return AESGCM(blob_key)
+
+
+def _nonce(index):
+    return struct.pack('>4xQ', index)
+
+
+def _aad(header, index, last):
+    return header + struct.pack('>Q?', index, last)
+
+
+class EncryptingWriter(io.RawIOBase):
+    """
+    Encrypts what is written to it into ``out``, a chunk at a time.
+    Closing it seals the last chunk; it does not close ``out``.
+    """
+
+    def __init__(self, out, key, chunk_size=CHUNK_SIZE):
+        self._out = out
+        self._chunk_size = chunk_size
+        salt = os.urandom(16)
+        self._header = _HEADER.pack(MAGIC, VERSION, chunk_size, salt)
+        self._cipher = _blob_cipher(key, salt)
+        self._buffer = bytearray()
+        self._index = 0
+        out.write(self._header)
+
+    def writable(self):
+        return True
+
+    def _seal(self, data, last):
+        self._out.write(self._cipher.encrypt(_nonce(self._index), bytes(data), _aad(self._header, self._index, last)))
+        self._index += 1
+
+    def write(self, data):
+        self._buffer += data
+        # Hold back a full chunk: only close() knows whether it is the last
+        while len(self._buffer) > self._chunk_size:
+            self._seal(self._buffer[:self._chunk_size], last=False)
+            del self._buffer[:self._chunk_size]
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._seal(self._buffer, last=True)
+            self._buffer = bytearray()
+        super().close()
+
+
+class DecryptingReader(io.RawIOBase):
+    """
+    Seekable plaintext view of an encrypted blob in ``raw`` (a binary file
+    positioned at its start). Reads decrypt only the chunks they touch.
+    """
+
+    def __init__(self, raw, key):
+        self._raw = raw
+        self._header = raw.read(HEADER_SIZE)
+        if len(self._header) < HEADER_SIZE:
+            raise CorruptBlob("encrypted blob header is truncated")
+        magic, version, self._chunk_size, salt = _HEADER.unpack(self._header)
+        if magic != MAGIC or version != VERSION:
+            raise CorruptBlob("not an encrypted blob, or an unknown version")
+        self._cipher = _blob_cipher(key, salt)
+        body = os.fstat(raw.fileno()).st_size - HEADER_SIZE
+        self._chunks = -(-body // (self._chunk_size + TAG_SIZE))
+        self.size = body - self._chunks * TAG_SIZE
+        if self._chunks == 0 or self.size < 0:
+            raise CorruptBlob("encrypted blob has no chunks")
+        self._position = 0
+        self._cached = (None, b'')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: self.size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def _chunk(self, index):
+        if self._cached[0] != index:
+            self._raw.seek(HEADER_SIZE + index * (self._chunk_size + TAG_SIZE))
+            sealed = self._raw.read(self._chunk_size + TAG_SIZE)
+            try:
+                plain = self._cipher.decrypt(_nonce(index), sealed, _aad(self._header, index, index == self._chunks - 1))
+            except InvalidTag:
+                raise CorruptBlob(f"chunk {index} failed authentication") from None
+            self._cached = (index, plain)
+        return self._cached[1]
+
+    def readinto(self, buffer):
+        # Fill the whole buffer, across chunks: parsers like Pillow's treat
+        # a short read as the end of the file
+        filled = 0
+        while filled < len(buffer) and self._position < self.size:
+            index, offset = divmod(self._position, self._chunk_size)
+            data = self._chunk(index)[offset:offset + len(buffer) - filled]
+            buffer[filled:filled + len(data)] = data
+            filled += len(data)
+            self._position += len(data)
+        return filled
+
+    def close(self):
+        self._raw.close()
+        super().close()
+
+
+def is_encrypted(raw):
+    """Whether the binary file ``raw`` holds an encrypted blob; leaves it at the start."""
+    magic = raw.read(len(MAGIC))
+    raw.seek(0)
+    return magic == MAGIC
+
+
+def open_blob(path, key=None):
+    """
+    A binary reader for the plaintext of the blob at ``path``, encrypted
+    or not. ``key`` defaults to master_key(); pass it to worker processes.
+    """
+    raw = open(path, 'rb')
+    try:
+        if not is_encrypted(raw):
+            return raw
+        key = key or master_key()
+        if key is None:
+            raise ImproperlyConfigured(f"{path} is encrypted but STORAGE_ENCRYPTION_KEY is not set.")
+        return DecryptingReader(raw, key)
+    except BaseException:
+        raw.close()
+        raise
+
+
+def blob_size(path):
+    """Plaintext size of the blob at ``path``, from its header and length alone."""
+    with open(path, 'rb') as raw:
+        header = raw.read(HEADER_SIZE)
+        stored = os.fstat(raw.fileno()).st_size
+    if len(header) < HEADER_SIZE or not header.startswith(MAGIC):
+        return stored
+    chunk_size = _HEADER.unpack(header)[2]
+    body = stored - HEADER_SIZE
+    return body - -(-body // (chunk_size + TAG_SIZE)) * TAG_SIZE
+
+
+@contextmanager
+def encrypting(out, key=None):
+    """
+    A writer that stores what is written to ``out`` encrypted, or ``out``
+    itself when encryption is off. Leaving the block seals the blob; ``out``
+    stays open either way.
+    """
+    key = key or master_key()
+    if key is None:
+        yield out
+        return
+    writer = EncryptingWriter(out, key)
+    yield writer
+    writer.close()
@@ -1,6 +1,7 @@
 # files/forms.py
 
 from django import forms
+from django.urls import reverse
 from .models import File
 from users.models import User
 
@@ -25,6 +26,8 @@ class FileUploadForm(forms.ModelForm):
             self.fields['owner_email'].widget.attrs.update({
                 'placeholder': 'Patient Email',
                 'class': 'form-control',
+                'autocomplete': 'off',
+                'data-autocomplete': reverse('user-autocomplete'),
             })
         else:
             # If the user is not a provider, remove the 'owner_email' field
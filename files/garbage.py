@@ -0,0 +1,168 @@
+"""
+Removal of stored bytes that no File refers to any more.
+
+Deleting a File (directly, or by cascade from its owner) removes its blobs
+once the transaction commits; see remove_blobs. collect_garbage sweeps up
+whatever that missed: blobs left by deletes from before it existed, by
+crashes, or by failed removals. It reads each storage root lazily, entry
+by entry, and checks the names against the File table a batch at a time,
+so neither side is ever loaded whole.
+Anything younger than the grace period is left alone, since an upload's
+bytes reach the disk before its row commits. ShardFilesBackfill leaves a
+blob's old name behind for the same grace, so downloads that read the row
+before it moved still find their bytes.
+"""
+
+import itertools
+import logging
+import os
+import shutil
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+
+from .models import File
+from .previews import preview_dir
+
+logger = logging.getLogger(__name__)
+
+GRACE_PERIOD = timedelta(hours=24)
+BATCH_SIZE = 1000
+UPLOAD_DIR = 'user_files'
+
+
+def remove_blobs(hot_path, archive_path, name, sha256):
+    """
+    Delete a deleted File's bytes from every tier, and its previews unless
+    another File has the same contents.
+    """
+    if File.objects.filter(uploaded_file=name).exists():
+        return
+    for path in (hot_path, archive_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # collect_garbage will get it next time
+            logger.warning("Could not remove %s: %s", path, e)
+    if sha256 and not File.objects.filter(sha256=sha256).exists():
+        shutil.rmtree(preview_dir(sha256), ignore_errors=True)
+
+
+def _entries(top):
+    """Files under ``top``, read lazily from each directory listing."""
+    try:
+        entries = os.scandir(top)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _entries(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def _blob_name(path, root, suffix=''):
+    name = os.path.relpath(path, root).replace(os.sep, '/')
+    return name[:len(name) - len(suffix)] if suffix else name
+
+
+def _changed_at(stat):
+    # A blob with another name is one a move linked elsewhere; linking
+    # stamped its ctime, so its grace runs from the move
+    return max(stat.st_mtime, stat.st_ctime) if stat.st_nlink > 1 else stat.st_mtime
+
+
+def _hot_candidates():
+    for entry in _entries(os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR)):
+        stat = entry.stat()
+        yield _blob_name(entry.path, settings.MEDIA_ROOT), entry.path, stat.st_size, _changed_at(stat)
+
+
+def _archive_candidates():
+    for entry in _entries(settings.ARCHIVE_ROOT):
+        stat = entry.stat()
+        if entry.name.endswith('.gz'):
+            yield _blob_name(entry.path, settings.ARCHIVE_ROOT, '.gz'), entry.path, stat.st_size, _changed_at(stat)
+        elif entry.name.endswith('.tmp'):
+            # Left by an archive or restore that never finished
+            yield None, entry.path, stat.st_size, stat.st_mtime
+
+
+def _preview_candidates():
+    try:
+        shards = os.scandir(settings.PREVIEW_ROOT)
+    except FileNotFoundError:
+        return
+    with shards:
+        for shard in shards:
+            if not shard.is_dir():
+                continue
+            with os.scandir(shard.path) as directories:
+                for directory in directories:
+                    if directory.is_dir():
+                        renditions = [entry.stat() for entry in os.scandir(directory.path)]
+                        size = sum(stat.st_size for stat in renditions)
+                        mtime = max((stat.st_mtime for stat in renditions), default=directory.stat().st_mtime)
+                        yield directory.name, directory.path, size, mtime
+
+
+def _live_names(names):
+    return set(File.objects.filter(uploaded_file__in=names).values_list('uploaded_file', flat=True))
+
+
+def _live_digests(digests):
+    return set(File.objects.filter(sha256__in=digests).values_list('sha256', flat=True))
+
+
+def unreferenced(grace=GRACE_PERIOD, batch_size=BATCH_SIZE, kinds=('hot', 'archive', 'preview')):
+    """
+    ``(kind, path, size)`` for each blob, archive or preview directory of
+    ``kinds`` that no File refers to and that is older than ``grace``.
+    """
+    cutoff = time.time() - grace.total_seconds()
+    sweeps = {
+        'hot': (_hot_candidates, _live_names),
+        'archive': (_archive_candidates, _live_names),
+        'preview': (_preview_candidates, _live_digests),
+    }
+    for kind in kinds:
+        candidates, live = sweeps[kind]
+        for batch in _batches(candidates(), batch_size):
+            referenced = live([key for key, *_ in batch if key is not None])
+            for key, path, size, mtime in batch:
+                if key not in referenced and mtime <= cutoff:
+                    yield kind, path, size
+
+
+def collect_garbage(grace=GRACE_PERIOD, dry_run=False, batch_size=BATCH_SIZE):
+    """
+    Delete unreferenced blobs, archives and previews older than ``grace``.
+    Returns a Counter of '<kind>' (items) and '<kind>_bytes' reclaimed.
+    """
+    removers = {'hot': os.remove, 'archive': os.remove, 'preview': shutil.rmtree}
+    reclaimed = Counter()
+    for kind, path, size in unreferenced(grace, batch_size):
+        logger.info("%s unreferenced %s blob %s (%d bytes)", "Would remove" if dry_run else "Removing", kind, path, size)
+        if not dry_run:
+            try:
+                removers[kind](path)
+            except FileNotFoundError:
+                continue
+        reclaimed[kind] += 1
+        reclaimed[f'{kind}_bytes'] += size
+    logger.info(
+        "Garbage collection %s %d bytes", "would reclaim" if dry_run else "reclaimed",
+        sum(count for kind, count in reclaimed.items() if kind.endswith('_bytes')),
+    )
+    return reclaimed
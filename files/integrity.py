@@ -0,0 +1,226 @@
+"""
+Integrity verification of stored file contents.
+
+verify_files re-hashes blobs on a low-priority process pool and compares
+them with the SHA-256 recorded at upload and, optionally, with the digest
+the upload pipeline anchored on chain. Plaintext hot files are read
+through mmap; encrypted ones are hashed decrypted and archived ones
+decompressed, so a blob that fails authentication counts as corrupt. Every run stats every blob (so
+missing files are always reported) but only re-hashes those never
+verified, changed since they were, or last verified more than
+``reverify_days`` ago.
+
+Worker processes import this module to unpickle hash_blob and never set
+Django up, so models are only imported inside functions.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import os
+import zlib
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .encryption import DecryptingReader, open_blob
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+# Files hashed between writes of verified_at (and chain lookups)
+BATCH_SIZE = 100
+CHAIN_CONCURRENCY = 8
+
+MISSING = 'missing'
+CORRUPT = 'corrupt'
+UNRECORDED = 'unrecorded'
+CHAIN_MISMATCH = 'chain-mismatch'
+ORPHANED = 'orphaned'
+
+Problem = namedtuple('Problem', 'kind file_id path detail')
+
+
+def hash_blob(path, compressed=False, key=None):
+    """
+    SHA-256 (hex) of the plaintext of the blob at ``path``, of its gzip
+    contents if ``compressed``. ``key`` is the storage encryption key.
+    """
+    digest = hashlib.sha256()
+    with open_blob(path, key) as source:
+        if compressed or isinstance(source, DecryptingReader):
+            stream = gzip.GzipFile(fileobj=source, mode='rb') if compressed else source
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+            return digest.hexdigest()
+
+        if os.fstat(source.fileno()).st_size:
+            with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                digest.update(mapped)
+        if hasattr(os, 'posix_fadvise'):
+            # Leave the page cache to the files requests are reading
+            os.posix_fadvise(source.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    return digest.hexdigest()
+
+
+def _lower_priority():
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+def blob_location(file):
+    """``(path, compressed)`` of where ``file``'s contents are stored."""
+    from .tiering import ARCHIVE, archive_path
+
+    if file.tier == ARCHIVE:
+        return archive_path(file), True
+    return file.uploaded_file.path, False
+
+
+def chain_digests(files):
+    """{file id: SHA-256 anchored on chain, or None} for ``files``."""
+    from asgiref.sync import async_to_sync
+    from access_log.solana_utils import anchored_digest, rpc_session
+
+    async def fetch():
+        semaphore = asyncio.Semaphore(CHAIN_CONCURRENCY)
+        async with rpc_session() as rpc:
+            async def one(file):
+                async with semaphore:
+                    return file.pk, await anchored_digest(rpc, file)
+            return dict(await asyncio.gather(*(one(file) for file in files)))
+
+    return async_to_sync(fetch)()
+
+
+def _candidates(full, reverify_days, counts, report):
+    """Files whose blobs need hashing, as (file, path, compressed, size)."""
+    from .models import File
+
+    cutoff = timezone.now() - timedelta(days=reverify_days)
+    files = File.objects.only('uploaded_file', 'sha256', 'tier', 'verified_at').order_by('pk')
+    for file in files.iterator():
+        path, compressed = blob_location(file)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            counts[MISSING] += 1
+            report(Problem(MISSING, file.pk, path, "no blob on disk"))
+            continue
+        if (full or file.verified_at is None or file.verified_at < cutoff
+                or stat.st_mtime > file.verified_at.timestamp()):
+            yield file, path, compressed, stat.st_size
+        else:
+            counts['skipped'] += 1
+
+
+def verify_files(processes=2, max_rate=None, full=False, reverify_days=30, chain=False, report=None, throttle=None):
+    """
+    Re-hash stored blobs and compare them with their recorded digests.
+    ``max_rate`` caps bytes read per second; ``processes=0`` hashes
+    inline. Each Problem is passed to ``report`` as it is found. Returns a
+    Counter of outcomes.
+    """
+    from backfills.runner import Throttle
+
+    from .encryption import master_key
+    from .models import File
+
+    report = report or (lambda problem: None)
+    throttle = throttle or Throttle(max_rate=max_rate)
+    counts = Counter()
+    # Workers never set Django up, so they are handed the key
+    key = master_key()
+    pool = None
+    if processes:
+        # Spawn rather than fork, as for previews
+        pool = ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context('spawn'), initializer=_lower_priority,
+        )
+    in_flight = deque()
+    batch = []
+
+    def flush():
+        intact = list(batch)
+        if chain and intact:
+            from access_log.resilience import RpcUnavailable
+            try:
+                anchored = chain_digests(intact)
+            except RpcUnavailable as e:
+                logger.warning("Could not read anchored digests: %s", e)
+                counts['chain-unavailable'] += len(intact)
+                intact = []
+            else:
+                for file in list(intact):
+                    if anchored[file.pk] is None:
+                        counts['unanchored'] += 1
+                    elif anchored[file.pk] != file.sha256:
+                        counts[CHAIN_MISMATCH] += 1
+                        report(Problem(CHAIN_MISMATCH, file.pk, '', f"recorded {file.sha256}, anchored {anchored[file.pk]}"))
+                        intact.remove(file)
+        File.objects.filter(pk__in=[file.pk for file in intact]).update(verified_at=timezone.now())
+        batch.clear()
+
+    def finish(file, path, result):
+        try:
+            digest = result()
+        except FileNotFoundError:
+            # Deleted or moved between the stat and the read
+            counts[MISSING] += 1
+            report(Problem(MISSING, file.pk, path, "blob disappeared during the run"))
+            return
+        except (OSError, EOFError, zlib.error) as e:
+            counts[CORRUPT] += 1
+            report(Problem(CORRUPT, file.pk, path, f"unreadable: {e}"))
+            return
+        if not file.sha256:
+            counts[UNRECORDED] += 1
+            report(Problem(UNRECORDED, file.pk, path, f"no digest recorded at upload; now {digest}"))
+            return
+        if digest != file.sha256:
+            counts[CORRUPT] += 1
+            report(Problem(CORRUPT, file.pk, path, f"expected {file.sha256}, found {digest}"))
+            return
+        counts['ok'] += 1
+        batch.append(file)
+        if len(batch) >= BATCH_SIZE:
+            flush()
+
+    try:
+        for file, path, compressed, size in _candidates(full, reverify_days, counts, report):
+            if pool:
+                in_flight.append((file, path, pool.submit(hash_blob, path, compressed, key).result))
+                while len(in_flight) >= processes * 2:
+                    finish(*in_flight.popleft())
+            else:
+                finish(file, path, lambda: hash_blob(path, compressed, key))
+            throttle.wait(size)
+        while in_flight:
+            finish(*in_flight.popleft())
+        flush()
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    return counts
+
+
+def find_orphans():
+    """
+    Problems for blobs in MEDIA_ROOT/user_files or ARCHIVE_ROOT that no File
+    refers to. Blobs still inside collect_garbage's grace period (uploads
+    not yet committed, old names left by a move) are not orphans yet.
+    """
+    from .garbage import unreferenced
+
+    for _, path, _ in unreferenced(kinds=('hot', 'archive')):
+        yield Problem(ORPHANED, None, path, "no File refers to this blob")
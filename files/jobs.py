@@ -0,0 +1,13 @@
+from jobs.registry import register
+
+from . import pipeline, tiering
+
+
+@register('files.process_upload', priority=10)
+def process_upload(file_id):
+    pipeline.process_upload(file_id)
+
+
+@register('files.restore_file', priority=50, max_attempts=3)
+def restore_file(file_id):
+    tiering.restore_file(file_id)
@@ -0,0 +1,82 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from files.encryption import CHUNK_SIZE, CRYPTOGRAPHY_AVAILABLE, encrypting, master_key, open_blob
+
+
+class Command(BaseCommand):
+    help = "Measure the throughput cost of encryption at rest against plaintext storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=64, help="Size of the test blob.")
+        parser.add_argument('--ranges', type=int, default=500, help="Random range reads to time.")
+        parser.add_argument('--range-kb', type=int, default=256, help="Size of each range read.")
+        parser.add_argument('--dir', default=None,
+                            help="Where to write the test blobs; defaults to a temporary directory. "
+                                 "Point it at the storage volume for realistic numbers.")
+
+    def handle(self, *args, **options):
+        if not CRYPTOGRAPHY_AVAILABLE:
+            raise CommandError("The cryptography package is not installed.")
+        # A throwaway key unless one is configured; nothing is kept
+        key = master_key() or os.urandom(32)
+        size = options['size_mb'] * 1024 ** 2
+        length = options['range_kb'] * 1024
+        if length > size:
+            raise CommandError("--range-kb must not exceed --size-mb.")
+        data = os.urandom(size)
+        offsets = [random.randrange(size - length + 1) for _ in range(options['ranges'])]
+        directory = tempfile.mkdtemp(dir=options['dir'])
+        try:
+            results = {}
+            for label, blob_key in (('plaintext', None), ('encrypted', key)):
+                path = os.path.join(directory, label)
+                results[label] = self.measure(path, data, blob_key, offsets, length)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        self.stdout.write(f"{options['size_mb']} MB blob, {len(offsets)} range reads of {options['range_kb']} KB, "
+                          f"{CHUNK_SIZE // 1024} KB chunks")
+        plain = results['plaintext']
+        for test, unit in (('write', 'MB/s'), ('read', 'MB/s'), ('ranges', 'reads/s')):
+            encrypted = results['encrypted'][test]
+            self.stdout.write(
+                f"{test:>7}: plaintext {plain[test]:10.1f} {unit}, encrypted {encrypted:10.1f} {unit} "
+                f"({(1 - encrypted / plain[test]) * 100:.1f}% slower)"
+            )
+
+    def measure(self, path, data, key, offsets, length):
+        megabytes = len(data) / 1024 ** 2
+        view = memoryview(data)
+        start = time.perf_counter()
+        with open(path, 'wb') as out:
+            with encrypting(out, key) if key else nullcontext(out) as sink:
+                for offset in range(0, len(data), 1024 ** 2):
+                    sink.write(view[offset:offset + 1024 ** 2])
+            out.flush()
+            os.fsync(out.fileno())
+        write = megabytes / (time.perf_counter() - start)
+
+        # Reads come from the page cache, so they measure decryption
+        # rather than the disk
+        start = time.perf_counter()
+        with open_blob(path, key) as source:
+            while source.read(1024 ** 2):
+                pass
+        read = megabytes / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with open_blob(path, key) as source:
+            for offset in offsets:
+                source.seek(offset)
+                if source.read(length) != data[offset:offset + length]:
+                    raise CommandError("A range read returned the wrong bytes.")
+        ranges = len(offsets) / (time.perf_counter() - start)
+        return {'write': write, 'read': read, 'ranges': ranges}
+
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from files.garbage import GRACE_PERIOD, collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Delete stored files, archives and previews that no File refers to."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=GRACE_PERIOD.total_seconds() / 3600,
+                            help="Leave anything modified more recently than this alone.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Names checked against the database per query.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted without deleting it.")
+
+    def handle(self, *args, **options):
+        reclaimed = collect_garbage(
+            grace=timedelta(hours=options['grace_hours']),
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+        )
+        verb = "Would reclaim" if options['dry_run'] else "Reclaimed"
+        for kind in ('hot', 'archive', 'preview'):
+            self.stdout.write(
+                f"{verb} {reclaimed[kind]} {kind} item(s), {reclaimed[kind + '_bytes'] / 1024 ** 2:.1f} MB"
+            )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from files.models import File
+from files.pipeline import index_file
+
+
+class Command(BaseCommand):
+    help = "Extract text from uploaded files and (re)build their search documents."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true', help="Only index files that have no search document yet.")
+
+    def handle(self, *args, **options):
+        files = File.objects.order_by('pk')
+        if options['missing']:
+            files = files.filter(document__isnull=True)
+
+        indexed = 0
+        for file_id in files.values_list('pk', flat=True).iterator():
+            index_file(file_id)
+            indexed += 1
+        self.stdout.write(f"Indexed {indexed} file(s).")
@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from files.tiering import archive_file, cold_files, tier_stats
+
+
+class Command(BaseCommand):
+    help = "Move files that haven't been downloaded recently to the archive tier."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cold-days', type=int, default=settings.TIER_COLD_DAYS,
+                            help="Archive files untouched for this many days.")
+        parser.add_argument('--limit', type=int, default=1000, help="Maximum files to archive in this run.")
+        parser.add_argument('--max-rate', type=float, default=20,
+                            help="Throttle to this many MB/s read from the hot volume (0 for no limit).")
+        parser.add_argument('--dry-run', action='store_true', help="List what would be archived.")
+        parser.add_argument('--stats', action='store_true', help="Only print per-tier file counts and sizes.")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for tier, stats in tier_stats().items():
+                self.stdout.write(f"{tier}: {stats['files']} file(s), {stats['bytes'] / 1024 ** 2:.1f} MB")
+            return
+
+        files = cold_files(options['cold_days']).order_by('pk')[:options['limit']]
+        max_rate = options['max_rate'] * 1024 ** 2
+        archived = freed = 0
+        start = time.monotonic()
+        for file in files.iterator():
+            if options['dry_run']:
+                self.stdout.write(f"Would archive {file.pk} {file.uploaded_file.name}")
+                continue
+            try:
+                freed += archive_file(file)
+            except OSError as e:
+                self.stderr.write(f"Could not archive file {file.pk}: {e}")
+                continue
+            archived += 1
+            if max_rate:
+                # Sleep until the average read rate is back under the limit
+                ahead = freed / max_rate - (time.monotonic() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+        if not options['dry_run']:
+            self.stdout.write(f"Archived {archived} file(s), freeing {freed / 1024 ** 2:.1f} MB on the hot tier.")
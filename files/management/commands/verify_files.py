@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from files.integrity import find_orphans, verify_files
+
+
+class Command(BaseCommand):
+    help = "Re-hash stored files and report any that are missing, corrupt or orphaned."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help="Hashing processes, run at low priority (0 to hash in this process).")
+        parser.add_argument('--max-rate', type=float, default=20,
+                            help="Throttle to this many MB/s read from storage (0 for no limit).")
+        parser.add_argument('--reverify-days', type=int, default=30,
+                            help="Re-hash unchanged files last verified longer ago than this.")
+        parser.add_argument('--full', action='store_true', help="Re-hash every file, changed or not.")
+        parser.add_argument('--chain', action='store_true',
+                            help="Also compare recorded digests with those anchored in the audit trail on chain.")
+        parser.add_argument('--skip-orphans', action='store_true', help="Don't look for blobs without a File.")
+
+    def handle(self, *args, **options):
+        if options['chain']:
+            from access_log.solana_utils import SOLANA_AVAILABLE
+            if not SOLANA_AVAILABLE:
+                raise CommandError("--chain needs the Solana packages installed.")
+
+        def report(problem):
+            file = f"file {problem.file_id}" if problem.file_id else problem.path
+            self.stderr.write(f"{problem.kind.upper()}: {file}: {problem.detail}")
+
+        counts = verify_files(
+            processes=options['processes'],
+            max_rate=options['max_rate'] * 1024 ** 2,
+            full=options['full'],
+            reverify_days=options['reverify_days'],
+            chain=options['chain'],
+            report=report,
+        )
+        if not options['skip_orphans']:
+            for problem in find_orphans():
+                counts[problem.kind] += 1
+                report(problem)
+
+        self.stdout.write(', '.join(f"{count} {kind}" for kind, count in sorted(counts.items())) or "No files.")
+        problems = sum(counts[kind] for kind in ('missing', 'corrupt', 'orphaned', 'chain-mismatch'))
+        if problems:
+            raise CommandError(f"{problems} problem(s) found.")
@@ -0,0 +1,29 @@
+from django.db.models import Count, Sum
+
+from monitoring.metrics import PROMETHEUS_AVAILABLE
+
+if PROMETHEUS_AVAILABLE:
+    from prometheus_client.core import GaugeMetricFamily
+
+
+class StorageTierCollector:
+    """Reports files per storage tier, and the archive's size, at scrape time."""
+
+    def collect(self):
+        from .models import File
+
+        files = GaugeMetricFamily(
+            'sealevel_storage_tier_files',
+            'Uploaded files by storage tier.',
+            labels=['tier'],
+        )
+        rows = File.objects.values_list('tier').annotate(Count('id'), Sum('archived_size')).order_by()
+        counts = {tier: (count, size) for tier, count, size in rows}
+        for tier, _ in File.TIER_CHOICES:
+            files.add_metric([tier], counts.get(tier, (0, 0))[0])
+        yield files
+        yield GaugeMetricFamily(
+            'sealevel_storage_archive_bytes',
+            'Compressed bytes held in the archive tier.',
+            value=counts.get('archive', (0, 0))[1] or 0,
+        )
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:20
+
+from django.db import migrations, models
+
+
+# Admin search runs UPPER(col::text) LIKE UPPER('%term%'); on Postgres a
+# trigram GIN index over that exact expression serves it. Other databases
+# keep scanning, which is fine at their sizes.
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS files_file_uploaded_file_trgm "
+        "ON files_file USING gin (UPPER(uploaded_file::text) gin_trgm_ops)"
+    )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS files_file_uploaded_file_trgm")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('files', '0010_file_uploaded_by'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='uploaded_date',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='fileaccess',
+            name='access_granted_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
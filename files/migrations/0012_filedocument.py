@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# The full-text index lives outside the ORM. SQLite gets an FTS5 table over
+# files_filedocument kept in sync by triggers; Postgres gets a generated
+# tsvector column with a GIN index. Names are split on punctuation first so
+# "lab_results.pdf" is found by "lab" and "results".
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE files_search USING fts5(
+        name, meta, body,
+        content='files_filedocument', content_rowid='file_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER files_search_ai AFTER INSERT ON files_filedocument BEGIN
+        INSERT INTO files_search(rowid, name, meta, body) VALUES (new.file_id, new.name, new.meta, new.body);
+    END""",
+    """CREATE TRIGGER files_search_ad AFTER DELETE ON files_filedocument BEGIN
+        INSERT INTO files_search(files_search, rowid, name, meta, body) VALUES ('delete', old.file_id, old.name, old.meta, old.body);
+    END""",
+    """CREATE TRIGGER files_search_au AFTER UPDATE ON files_filedocument BEGIN
+        INSERT INTO files_search(files_search, rowid, name, meta, body) VALUES ('delete', old.file_id, old.name, old.meta, old.body);
+        INSERT INTO files_search(rowid, name, meta, body) VALUES (new.file_id, new.name, new.meta, new.body);
+    END""",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS files_search_au",
+    "DROP TRIGGER IF EXISTS files_search_ad",
+    "DROP TRIGGER IF EXISTS files_search_ai",
+    "DROP TABLE IF EXISTS files_search",
+]
+POSTGRES_INDEX = [
+    """ALTER TABLE files_filedocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', regexp_replace(name, '[\\W_]+', ' ', 'g')), 'A') ||
+        setweight(to_tsvector('english', meta), 'B') ||
+        setweight(to_tsvector('english', body), 'C')
+    ) STORED""",
+    "CREATE INDEX files_filedocument_search ON files_filedocument USING gin (search_vector)",
+]
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS files_filedocument_search",
+    "ALTER TABLE files_filedocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_INDEX, 'postgresql': POSTGRES_INDEX}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0011_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileDocument',
+            fields=[
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='files.file')),
+                ('name', models.CharField(max_length=255)),
+                ('meta', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('indexed', 'Indexed'), ('unsupported', 'Unsupported format'), ('failed', 'Failed')], default='pending', max_length=12)),
+                ('error', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0012_filedocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='has_preview',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
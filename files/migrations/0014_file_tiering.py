@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0013_file_sha256_preview'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='archived_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='last_accessed',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='tier',
+            field=models.CharField(choices=[('hot', 'Hot'), ('archive', 'Archive')], db_index=True, default='hot', max_length=10),
+        ),
+    ]
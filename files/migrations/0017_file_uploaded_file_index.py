@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0016_file_verified_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='uploaded_file',
+            field=models.FileField(db_index=True, upload_to='user_files/'),
+        ),
+    ]
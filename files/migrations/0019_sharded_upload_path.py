@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:37
+
+import files.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0018_file_upload_metadata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='uploaded_file',
+            field=models.FileField(db_index=True, max_length=255, upload_to=files.models.sharded_upload_path),
+        ),
+    ]
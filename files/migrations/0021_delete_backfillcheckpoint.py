@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:06
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0020_sharelink'),
+        # Its checkpoints are copied over first
+        ('backfills', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='BackfillCheckpoint',
+        ),
+    ]
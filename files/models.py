@@ -1,20 +1,55 @@
 # files/models.py
 
+import os
+import uuid
+
 from django.db import models
 from django.conf import settings
 from users.models import User
 
+def sharded_upload_path(instance, filename):
+    """
+    user_files/<ab>/<cd>/<name>: two levels of hex fan-out keep every
+    directory small. Keyed by the content hash when the upload handler
+    recorded one, otherwise by a random key.
+    """
+    key = instance.sha256 or uuid.uuid4().hex
+    return f'user_files/{key[:2]}/{key[2:4]}/{filename}'
+
+
 class File(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='owned_files')
-    uploaded_file = models.FileField(upload_to='user_files/')
+    # Indexed for collect_garbage's lookups by blob name
+    uploaded_file = models.FileField(upload_to=sharded_upload_path, max_length=255, db_index=True)
     transaction_ids = models.JSONField(default=list)
     shared_with = models.ManyToManyField(User, related_name='shared_files')
-    uploaded_date = models.DateTimeField(auto_now_add=True)
+    uploaded_date = models.DateTimeField(auto_now_add=True, db_index=True)
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploaded_files', null=True, blank=True)
+    # Filled in by the upload pipeline (files.pipeline)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    has_preview = models.BooleanField(default=False)
+    # Storage tiering (files.tiering)
+    TIER_CHOICES = [
+        ('hot', 'Hot'),
+        ('archive', 'Archive'),
+    ]
+    tier = models.CharField(max_length=10, choices=TIER_CHOICES, default='hot', db_index=True)
+    last_accessed = models.DateTimeField(null=True, blank=True, db_index=True)
+    archived_size = models.BigIntegerField(null=True, blank=True)
+    # Last time verify_files found the stored bytes matching sha256
+    verified_at = models.DateTimeField(null=True, blank=True)
+    # Recorded at upload (files.uploads) so pages never stat the blob
+    original_name = models.CharField(max_length=255, blank=True)
+    size = models.BigIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
 
     def __str__(self):
         return self.uploaded_file.name
 
+    @property
+    def display_name(self):
+        return self.original_name or os.path.basename(self.uploaded_file.name)
+
 class FileAccess(models.Model):
     file = models.ForeignKey(
         File,
@@ -26,13 +61,56 @@ class FileAccess(models.Model):
         on_delete=models.CASCADE,
         related_name='file_access'
     )
-    access_granted_at = models.DateTimeField(auto_now_add=True)
+    access_granted_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     class Meta:
         unique_together = ('file', 'user')
 
     def __str__(self):
-        return f"{self.user.email} has viewer access to {self.uploaded_file.name}"
+        return f"{self.user.email} has viewer access to {self.file.uploaded_file.name}"
+
+class FileDocument(models.Model):
+    """
+    Searchable text for a File, filled in by the extraction pipeline
+    (files.pipeline). The full-text index over it is kept in sync by the
+    database itself; see files.search.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('indexed', 'Indexed'),
+        ('unsupported', 'Unsupported format'),
+        ('failed', 'Failed'),
+    ]
+
+    file = models.OneToOneField(File, on_delete=models.CASCADE, primary_key=True, related_name='document')
+    name = models.CharField(max_length=255)
+    # Owner and uploader emails, so documents can be found by who they involve
+    meta = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document for {self.name} ({self.status})"
+
+class ShareLink(models.Model):
+    """
+    A signed, expiring link to a file for someone without an account
+    (files.share_links). Links are checked from the token alone; the row
+    is only kept so the owner can list and revoke them.
+    """
+    token_id = models.CharField(max_length=16, unique=True)
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='share_links')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='share_links')
+    # Comma-separated, e.g. "download"
+    actions = models.CharField(max_length=50, default='download')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Share link {self.token_id} for {self.file.uploaded_file.name}"
 
 # class File(models.Model):
 #     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='files')
@@ -0,0 +1,131 @@
+"""
+Background processing of uploaded files.
+
+Uploads queue process_upload as a job (see files/jobs.py), run by
+``manage.py run_jobs`` once the upload commits, or inline with JOBS_EAGER.
+It hashes the file and anchors the digest in its audit trail, extracts
+text into the FileDocument that search indexes, and renders previews
+(files.previews, on a process pool).
+"""
+
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+
+from jobs.queue import enqueue
+from .models import File, FileDocument
+from .previews import generate_previews
+
+logger = logging.getLogger(__name__)
+
+# pypdf is optional; without it PDFs are indexed by name only
+try:
+    from pypdf import PdfReader
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+TEXT_EXTENSIONS = {'.txt', '.csv', '.md', '.json', '.xml', '.html', '.htm', '.hl7'}
+# Enough text to find a document by; the rest adds index size, not recall
+MAX_INDEXED_CHARS = 200_000
+
+
+def schedule(file_id):
+    """Queue process_upload for ``file_id``; it runs once the current transaction commits."""
+    enqueue('files.process_upload', file_id)
+
+
+def process_upload(file_id):
+    # Uploads through the site were hashed as they streamed in
+    sha256 = File.objects.filter(pk=file_id).values_list('sha256', flat=True).first()
+    if sha256 is None:
+        # Deleted before its job ran
+        return
+    anchor_digest(file_id, sha256 or hash_file(file_id))
+    index_file(file_id)
+    preview_file(file_id)
+
+
+def hash_file(file_id):
+    """Record the SHA-256 of a file's contents."""
+    file = File.objects.get(pk=file_id)
+    digest = hashlib.sha256()
+    with file.uploaded_file.open('rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(chunk)
+    File.objects.filter(pk=file_id).update(sha256=digest.hexdigest())
+    return digest.hexdigest()
+
+
+def anchor_digest(file_id, sha256):
+    """Put a file's SHA-256 in its audit trail, for verify_files --chain."""
+    if not getattr(settings, 'SOLANA_ENABLED', False):
+        return
+    from asgiref.sync import async_to_sync
+    from access_log.solana_utils import log_access
+
+    file = File.objects.select_related('owner', 'uploaded_by').get(pk=file_id)
+    async_to_sync(log_access)(file.uploaded_by or file.owner, 'hashed', file, digest=bytes.fromhex(sha256))
+
+
+def preview_file(file_id):
+    file = File.objects.get(pk=file_id)
+    sha256 = file.sha256 or hash_file(file_id)
+    if generate_previews(file.uploaded_file.path, file.uploaded_file.name, sha256):
+        File.objects.filter(pk=file_id).update(has_preview=True)
+
+
+def extract_text(file):
+    """
+    Text of ``file`` for indexing, at most MAX_INDEXED_CHARS, or None when
+    the format isn't one we can read.
+    """
+    extension = os.path.splitext(file.uploaded_file.name)[1].lower()
+    if extension in TEXT_EXTENSIONS:
+        with file.uploaded_file.open('rb') as handle:
+            # UTF-8 is at most 4 bytes per character
+            return handle.read(MAX_INDEXED_CHARS * 4).decode('utf-8', 'replace')[:MAX_INDEXED_CHARS]
+    if extension == '.pdf' and PYPDF_AVAILABLE:
+        parts, length = [], 0
+        with file.uploaded_file.open('rb') as handle:
+            for page in PdfReader(handle).pages:
+                text = page.extract_text() or ''
+                parts.append(text)
+                length += len(text)
+                if length >= MAX_INDEXED_CHARS:
+                    break
+        return '\n'.join(parts)[:MAX_INDEXED_CHARS]
+    return None
+
+
+def index_file(file_id):
+    """(Re)build the FileDocument for one file."""
+    try:
+        file = File.objects.select_related('owner', 'uploaded_by').get(pk=file_id)
+    except File.DoesNotExist:
+        return None
+
+    emails = [file.owner.email]
+    if file.uploaded_by and file.uploaded_by_id != file.owner_id:
+        emails.append(file.uploaded_by.email)
+    defaults = {
+        'name': os.path.basename(file.uploaded_file.name)[:255],
+        'meta': ' '.join(emails),
+        'body': '',
+        'status': 'indexed',
+        'error': '',
+    }
+    try:
+        text = extract_text(file)
+    except Exception as e:
+        logger.warning("Text extraction failed for file %s: %r", file_id, e)
+        defaults.update(status='failed', error=repr(e))
+    else:
+        if text is None:
+            defaults['status'] = 'unsupported'
+        else:
+            defaults['body'] = text
+    document, _ = FileDocument.objects.update_or_create(file=file, defaults=defaults)
+    return document
@@ -0,0 +1,124 @@
+"""
+Thumbnails and low-resolution previews of uploaded images and PDFs.
+
+Rendering is CPU-bound, so it runs in a process pool sized to the cores
+(PREVIEW_PROCESSES). Output is keyed by the file's SHA-256, which makes it
+immutable: identical uploads share one set of previews and they can be
+cached by browsers for a year.
+
+This module must not import models: worker processes import it to unpickle
+render_previews and never set Django up.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from .encryption import master_key, open_blob
+
+# Pillow renders images; pypdfium2 rasterises PDFs. Both optional, and a
+# format whose renderer is missing simply gets no preview.
+try:
+    from PIL import Image, ImageOps
+    PILLOW_AVAILABLE = True
+except ImportError:
+    PILLOW_AVAILABLE = False
+
+try:
+    import pypdfium2
+    PDFIUM_AVAILABLE = True
+except ImportError:
+    PDFIUM_AVAILABLE = False
+
+# Longest edge, in pixels, of each rendition
+PREVIEW_SIZES = {
+    'thumb': 256,
+    'preview': 1024,
+}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff'}
+
+_pool = None
+
+
+def preview_kind(name):
+    """'image', 'pdf' or None if files named ``name`` can't be previewed here."""
+    extension = os.path.splitext(name)[1].lower()
+    if extension in IMAGE_EXTENSIONS and PILLOW_AVAILABLE:
+        return 'image'
+    if extension == '.pdf' and PILLOW_AVAILABLE and PDFIUM_AVAILABLE:
+        return 'pdf'
+    return None
+
+
+def preview_dir(sha256):
+    return os.path.join(settings.PREVIEW_ROOT, sha256[:2], sha256)
+
+
+def preview_path(sha256, size):
+    return os.path.join(preview_dir(sha256), f'{size}.webp')
+
+
+def previews_exist(sha256):
+    return all(os.path.exists(preview_path(sha256, size)) for size in PREVIEW_SIZES)
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # Spawn rather than fork: the parent is a threaded web worker
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.PREVIEW_PROCESSES or os.cpu_count(),
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _pool
+
+
+def _first_page(source, kind):
+    if kind == 'pdf':
+        pdf = pypdfium2.PdfDocument(source)
+        try:
+            page = pdf[0]
+            scale = PREVIEW_SIZES['preview'] / max(page.get_size())
+            return page.render(scale=scale).to_pil()
+        finally:
+            pdf.close()
+    image = Image.open(source)
+    image.draft('RGB', (PREVIEW_SIZES['preview'], PREVIEW_SIZES['preview']))
+    return ImageOps.exif_transpose(image)
+
+
+def render_previews(source_path, kind, output_dir, key=None):
+    """
+    Write every PREVIEW_SIZES rendition of ``source_path`` into
+    ``output_dir`` as WebP. Runs in a pool process, so it is handed the
+    storage encryption key rather than reading settings.
+    """
+    with open_blob(source_path, key) as source:
+        image = _first_page(source, kind).convert('RGB')
+    os.makedirs(output_dir, exist_ok=True)
+    for size, edge in sorted(PREVIEW_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((edge, edge))
+        path = os.path.join(output_dir, f'{size}.webp')
+        # Write then rename, so a half-written preview is never served
+        image.save(path + '.tmp', 'WEBP', quality=80)
+        os.replace(path + '.tmp', path)
+
+
+def generate_previews(source_path, name, sha256):
+    """
+    Render previews for one file unless they already exist. Returns True
+    when previews are available afterwards.
+    """
+    kind = preview_kind(name)
+    if kind is None:
+        return False
+    if previews_exist(sha256):
+        return True
+    key = master_key()
+    if settings.JOBS_EAGER:
+        render_previews(source_path, kind, preview_dir(sha256), key)
+    else:
+        get_pool().submit(render_previews, source_path, kind, preview_dir(sha256), key).result()
+    return True
@@ -0,0 +1,94 @@
+"""
+Full-text search over file names, owner/uploader emails and extracted text.
+
+FileDocument rows are the only thing written; the index over them is kept
+by the database (see migration 0012): an FTS5 table on SQLite, a generated
+tsvector column with a GIN index on Postgres. Other databases fall back to
+icontains. Results are restricted to files the user may download.
+"""
+
+import re
+from collections import namedtuple
+
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+
+from .models import File, FileAccess, FileDocument
+
+# Longer queries are cut short; every term must match
+MAX_TERMS = 8
+PER_PAGE = 20
+
+SearchResults = namedtuple('SearchResults', 'files page has_previous has_next')
+
+
+def visible_files(user):
+    """Files ``user`` owns, uploaded, or was given access to."""
+    return File.objects.filter(
+        Q(owner=user) | Q(uploaded_by=user)
+        | Exists(FileAccess.objects.filter(file=OuterRef('pk'), user=user))
+    )
+
+
+def query_terms(query):
+    """Words in ``query``, lowercased; punctuation and underscores separate words."""
+    return re.findall(r'[^\W_]+', query.lower())[:MAX_TERMS]
+
+
+def _sqlite_ids(terms, visible_sql, visible_params, limit, offset):
+    match = ' AND '.join(f'"{term}"*' for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM files_search WHERE files_search MATCH %s AND rowid IN ({visible_sql}) "
+            "ORDER BY bm25(files_search, 10.0, 2.0, 1.0) LIMIT %s OFFSET %s",
+            [match, *visible_params, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _postgres_ids(terms, visible_sql, visible_params, limit, offset):
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT file_id FROM files_filedocument, to_tsquery('english', %s) query "
+            f"WHERE search_vector @@ query AND file_id IN ({visible_sql}) "
+            "ORDER BY ts_rank_cd(search_vector, query) DESC, file_id DESC LIMIT %s OFFSET %s",
+            [tsquery, *visible_params, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fallback_ids(terms, visible, limit, offset):
+    documents = FileDocument.objects.filter(file__in=visible)
+    for term in terms:
+        documents = documents.filter(Q(name__icontains=term) | Q(meta__icontains=term) | Q(body__icontains=term))
+    return list(documents.order_by('-file_id').values_list('file_id', flat=True)[offset:offset + limit])
+
+
+def search_files(user, query, page=1, per_page=PER_PAGE):
+    """
+    Page ``page`` (from 1) of the files visible to ``user`` matching every
+    word of ``query``, best match first. There is no total count: one extra
+    row is fetched to tell whether a next page exists.
+    """
+    terms = query_terms(query)
+    page = max(1, page)
+    if not terms:
+        return SearchResults([], page, False, False)
+
+    visible = visible_files(user).values('pk')
+    limit, offset = per_page + 1, (page - 1) * per_page
+    if connection.vendor == 'sqlite':
+        ids = _sqlite_ids(terms, *visible.query.sql_with_params(), limit, offset)
+    elif connection.vendor == 'postgresql':
+        ids = _postgres_ids(terms, *visible.query.sql_with_params(), limit, offset)
+    else:
+        ids = _fallback_ids(terms, visible, limit, offset)
+
+    files = File.objects.select_related('owner', 'uploaded_by').in_bulk(ids[:per_page])
+    return SearchResults(
+        [files[pk] for pk in ids[:per_page] if pk in files],
+        page,
+        page > 1,
+        len(ids) > per_page,
+    )
@@ -0,0 +1,92 @@
+"""
+Signed, expiring share links for people without an account.
+
+A token is the file id, the sharer's id, an expiry, the allowed actions and
+a random token id, signed with SECRET_KEY. Checking one needs no database:
+the signature, expiry and scope come from the token itself, and revoked
+token ids are held in memory per process, reloaded every
+SHARE_LINK_REVOCATION_REFRESH seconds (straight away in the process that
+revoked).
+"""
+
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ShareLink
+
+SALT = 'files.share-link'
+ACTIONS = ('download',)
+# Offered on the share page, in hours
+LIFETIMES = (1, 24, 72, 168)
+
+
+class InvalidShareLink(Exception):
+    pass
+
+
+class _RevocationList:
+    def __init__(self):
+        self.loaded_at = None
+        self.token_ids = frozenset()
+        self._lock = threading.Lock()
+
+    def __contains__(self, token_id):
+        with self._lock:
+            if self.loaded_at is None or time.monotonic() - self.loaded_at >= settings.SHARE_LINK_REVOCATION_REFRESH:
+                # Expired links fail on their own, so only unexpired ids are kept
+                self.token_ids = frozenset(
+                    ShareLink.objects.filter(revoked_at__isnull=False, expires_at__gt=timezone.now())
+                    .values_list('token_id', flat=True)
+                )
+                self.loaded_at = time.monotonic()
+            return token_id in self.token_ids
+
+    def invalidate(self):
+        with self._lock:
+            self.loaded_at = None
+
+
+_revoked = _RevocationList()
+
+
+def create_link(file, user, lifetime, actions=ACTIONS):
+    """Record a link to ``file`` shared by ``user``; returns ``(link, token)``."""
+    link = ShareLink.objects.create(
+        token_id=secrets.token_urlsafe(9), file=file, created_by=user,
+        actions=','.join(actions), expires_at=timezone.now() + lifetime,
+    )
+    payload = [file.pk, user.pk, int(link.expires_at.timestamp()), list(actions), link.token_id]
+    return link, signing.dumps(payload, salt=SALT)
+
+
+def check_token(token, action):
+    """
+    ``(file id, sharer id)`` for a token that currently allows ``action``.
+    Raises InvalidShareLink otherwise.
+    """
+    try:
+        file_id, user_id, expires, actions, token_id = signing.loads(token, salt=SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        raise InvalidShareLink("This link is not valid.")
+    if expires < time.time():
+        raise InvalidShareLink("This link has expired.")
+    if action not in actions:
+        raise InvalidShareLink("This link does not allow that.")
+    if token_id in _revoked:
+        raise InvalidShareLink("This link has been revoked.")
+    return file_id, user_id
+
+
+def revoke_link(link):
+    ShareLink.objects.filter(pk=link.pk).update(revoked_at=timezone.now())
+    transaction.on_commit(_revoked.invalidate)
+
+
+def active_links(file):
+    return file.share_links.filter(revoked_at__isnull=True, expires_at__gt=timezone.now()).order_by('-created_at')
@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import File
+
+
+@receiver(post_delete, sender=File)
+def remove_deleted_file_blobs(sender, instance, **kwargs):
+    # Only once the delete is durable; a rollback must leave the bytes
+    from .garbage import remove_blobs
+    from .tiering import archive_path
+
+    if not instance.uploaded_file:
+        return
+    args = (instance.uploaded_file.path, archive_path(instance), instance.uploaded_file.name, instance.sha256)
+    transaction.on_commit(lambda: remove_blobs(*args))
@@ -0,0 +1,55 @@
+"""
+Storage for uploaded files that encrypts them at rest (see encryption).
+
+Large uploads arrive already encrypted from EncryptingUploadHandler and are
+moved into place as they are; anything else is encrypted as it is written.
+Opening a file gives a seekable plaintext reader, so FileResponse and
+Range requests work exactly as they do on plaintext blobs.
+"""
+
+import io
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+from .encryption import EncryptingWriter, blob_size, master_key, open_blob
+
+
+class _EncryptedContent:
+    """``content``'s chunks, encrypted on their way to the disk."""
+
+    def __init__(self, content, key):
+        self.content = content
+        self.key = key
+
+    def chunks(self, chunk_size=None):
+        sink = io.BytesIO()
+        writer = EncryptingWriter(sink, self.key)
+        for chunk in self.content.chunks(chunk_size):
+            writer.write(chunk)
+            yield _drain(sink)
+        writer.close()
+        yield _drain(sink)
+
+
+def _drain(sink):
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+class EncryptedFileSystemStorage(FileSystemStorage):
+    def _save(self, name, content):
+        key = master_key()
+        if key is not None and not getattr(content, 'encrypted_at_rest', False):
+            content = _EncryptedContent(content, key)
+        return super()._save(name, content)
+
+    def _open(self, name, mode='rb'):
+        if 'b' not in mode or any(flag in mode for flag in 'wa+'):
+            return super()._open(name, mode)
+        return File(open_blob(self.path(name)), name)
+
+    def size(self, name):
+        return blob_size(self.path(name))
@@ -1,3 +1,718 @@
-from django.test import TestCase
+import base64
+import contextvars
+import hashlib
+import os
+import shutil
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from access_log.models import AuditEvent
+from backfills.runner import get_backfills, run_backfill
+from sealevel import db_router
+from sealevel.perf import DATA_SIZES, QueryBudgetMixin, TemporaryMediaMixin, mock_solana
+from users.models import User
+from .models import File, FileAccess, FileDocument
+from .pipeline import index_file, process_upload
+from .previews import preview_path
+from .encryption import CHUNK_SIZE, CRYPTOGRAPHY_AVAILABLE, MAGIC
+from .garbage import collect_garbage
+from .integrity import find_orphans, verify_files
+from . import tiering
+from .tiering import archive_file, archive_path, cold_files, restore_file, tier_stats
+from .search import search_files
+from . import share_links
+
+class FileViewPerformanceTests(TemporaryMediaMixin, QueryBudgetMixin, TestCase):
+    """Query budgets must hold at every data size, so N+1s fail the build."""
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.provider = User.objects.create_user('provider@example.com', None, role='provider')
+        self.other = User.objects.create_user('other@example.com', None)
+
+    def test_patient_file_list_budget(self):
+        self.client.force_login(self.patient)
+        for size in DATA_SIZES:
+            with self.subTest(size=size):
+                File.objects.all().delete()
+                self.make_files(size, self.patient, uploaded_by=self.provider)
+                for shared in self.make_files(size, self.other):
+                    FileAccess.objects.create(file=shared, user=self.patient)
+                with mock_solana() as solana, self.assertQueryBudget(3, f'file-list with {size} files'):
+                    response = self.client.get(reverse('file-list'))
+                self.assertEqual(response.status_code, 200)
+                solana.log_access.assert_not_called()
+
+    def test_provider_file_list_budget(self):
+        self.client.force_login(self.provider)
+        for size in DATA_SIZES:
+            with self.subTest(size=size):
+                File.objects.all().delete()
+                self.make_files(size, self.patient, uploaded_by=self.provider)
+                with mock_solana() as solana, self.assertQueryBudget(3, f'file-list with {size} files'):
+                    response = self.client.get(reverse('file-list'))
+                self.assertEqual(response.status_code, 200)
+                solana.log_access.assert_not_called()
+
+    def test_share_page_budget(self):
+        self.client.force_login(self.patient)
+        file = self.make_files(1, self.patient)[0]
+        recipients = [User.objects.create_user(f'recipient{index}@example.com', None) for index in range(max(DATA_SIZES))]
+        granted = 0
+        for size in DATA_SIZES:
+            with self.subTest(size=size):
+                for user in recipients[granted:size]:
+                    FileAccess.objects.create(file=file, user=user)
+                granted = size
+                # The fifth query lists the file's active share links
+                with mock_solana() as solana, self.assertQueryBudget(5, f'file-share with {size} recipients'):
+                    response = self.client.get(reverse('file-share', args=[file.pk]))
+                self.assertEqual(response.status_code, 200)
+                solana.log_access.assert_not_called()
+
+    def test_access_log_budget(self):
+        self.client.force_login(self.patient)
+        file = self.make_files(1, self.patient)[0]
+        with mock_solana() as solana, self.assertQueryBudget(3, 'file-access-log'):
+            response = self.client.get(reverse('file-access-log', args=[file.pk]))
+        self.assertEqual(response.status_code, 200)
+        solana.retrieve_access_logs.assert_awaited_once()
+        solana.log_access.assert_not_called()
+
+    def test_download_streams_without_buffering(self):
+        self.client.force_login(self.patient)
+        size = 8 * 1024 * 1024
+        file = self.make_files(1, self.patient, content=b'x' * size)[0]
+        with mock_solana() as solana, self.assertPeakMemory(1024 * 1024, 'file-download'):
+            response = self.client.get(reverse('file-download', args=[file.pk]))
+            streamed = sum(len(chunk) for chunk in response.streaming_content)
+        response.close()
+        self.assertEqual(streamed, size)
+        solana.log_access.assert_awaited_once()
+
+    def test_download_is_recorded_with_the_chain_off(self):
+        file = self.make_files(1, self.patient, uploaded_by=self.provider)[0]
+        self.client.force_login(self.provider)
+        response = self.client.get(reverse('file-download', args=[file.pk]))
+        response.close()
+        event = AuditEvent.objects.get()
+        self.assertEqual((event.owner, event.status), (self.patient, 'local'))
+
+    def test_download_budget(self):
+        self.client.force_login(self.other)
+        file = self.make_files(1, self.patient)[0]
+        FileAccess.objects.create(file=file, user=self.other)
+        # The fifth query records last_accessed for storage tiering
+        with mock_solana(), self.assertQueryBudget(5, 'file-download'):
+            response = self.client.get(reverse('file-download', args=[file.pk]))
+        response.close()
+        self.assertEqual(response.status_code, 200)
+
+
+class AdminPerformanceTests(TemporaryMediaMixin, QueryBudgetMixin, TestCase):
+    """Changelists must not grow a query per row, and never run a second full count."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin@example.com', None)
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.client.force_login(self.admin)
+
+    def test_changelist_budgets(self):
+        created = 0
+        for size in DATA_SIZES:
+            for index in range(created, size):
+                file = File.objects.create(
+                    owner=self.patient, uploaded_by=self.admin, uploaded_file=f'user_files/doc{index}.txt',
+                )
+                FileAccess.objects.create(file=file, user=self.admin)
+            created = size
+            for url in ('admin:files_file_changelist', 'admin:files_fileaccess_changelist'):
+                with self.subTest(size=size, url=url), self.assertQueryBudget(6, f'{url} with {size} rows'):
+                    response = self.client.get(reverse(url), {'q': 'doc'})
+                self.assertEqual(response.status_code, 200)
+
+    def test_file_access_str(self):
+        file = File.objects.create(owner=self.patient, uploaded_by=self.patient, uploaded_file='user_files/doc.txt')
+        access = FileAccess.objects.create(file=file, user=self.admin)
+        self.assertEqual(str(access), 'admin@example.com has viewer access to user_files/doc.txt')
+
+
+@override_settings(JOBS_EAGER=True)
+class SearchTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.other = User.objects.create_user('other@example.com', None)
+
+    def make_file(self, owner, name, content):
+        file = File.objects.create(owner=owner, uploaded_by=owner, uploaded_file=ContentFile(content, name=name))
+        index_file(file.pk)
+        return file
+
+    def test_ranked_and_restricted_to_visible_files(self):
+        in_body = self.make_file(self.patient, 'notes.txt', b'Follow-up on cholesterol results.')
+        in_name = self.make_file(self.patient, 'cholesterol_panel.txt', b'LDL 120 mg/dL')
+        hidden = self.make_file(self.other, 'cholesterol.txt', b'cholesterol')
+        results = search_files(self.patient, 'Cholest')
+        self.assertEqual(results.files, [in_name, in_body])
+
+        FileAccess.objects.create(file=hidden, user=self.patient)
+        self.assertIn(hidden, search_files(self.patient, 'cholesterol').files)
+        self.assertEqual(search_files(self.other, 'LDL').files, [])
+
+    def test_pages_without_counting(self):
+        for index in range(3):
+            self.make_file(self.patient, f'scan{index}.txt', b'x-ray report')
+        first = search_files(self.patient, 'x-ray', per_page=2)
+        second = search_files(self.patient, 'x-ray', page=2, per_page=2)
+        self.assertEqual((len(first.files), first.has_next), (2, True))
+        self.assertEqual((len(second.files), second.has_next, second.has_previous), (1, False, True))
+
+    def test_deleted_files_leave_the_index(self):
+        file = self.make_file(self.patient, 'allergy.txt', b'penicillin')
+        file.delete()
+        self.assertFalse(FileDocument.objects.exists())
+        self.assertEqual(search_files(self.patient, 'penicillin').files, [])
+
+    def test_upload_is_indexed_after_commit(self):
+        self.client.force_login(self.patient)
+        upload = ContentFile(b'blood pressure diary', name='bp.txt')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('file-upload'), {'uploaded_file': upload})
+        response = self.client.get(reverse('file-search'), {'q': 'pressure "diary'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([file.owner for file in response.context['results'].files], [self.patient])
+
+
+@override_settings(JOBS_EAGER=True)
+class PreviewTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.other = User.objects.create_user('other@example.com', None)
+        self.file = File.objects.create(
+            owner=self.patient, uploaded_by=self.patient, uploaded_file=ContentFile(b'not an image', name='scan.txt'),
+        )
+
+    def test_pipeline_records_content_hash(self):
+        process_upload(self.file.pk)
+        self.file.refresh_from_db()
+        self.assertEqual(self.file.sha256, hashlib.sha256(b'not an image').hexdigest())
+        self.assertFalse(self.file.has_preview)
+
+    def test_preview_is_served_privately_with_long_cache(self):
+        sha256 = 'ab' * 32
+        os.makedirs(os.path.dirname(preview_path(sha256, 'thumb')), exist_ok=True)
+        with open(preview_path(sha256, 'thumb'), 'wb') as handle:
+            handle.write(b'webp')
+        File.objects.filter(pk=self.file.pk).update(sha256=sha256, has_preview=True)
+
+        self.client.force_login(self.patient)
+        response = self.client.get(reverse('file-preview', args=[self.file.pk, 'thumb']))
+        self.assertEqual(b''.join(response.streaming_content), b'webp')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        self.assertEqual(self.client.get(reverse('file-preview', args=[self.file.pk, 'huge'])).status_code, 404)
+
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(reverse('file-preview', args=[self.file.pk, 'thumb'])).status_code, 403)
+
+
+@override_settings(JOBS_EAGER=True)
+class TieringTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.content = b'lab results ' * 1000
+        self.file = File.objects.create(
+            owner=self.patient, uploaded_by=self.patient, uploaded_file=ContentFile(self.content, name='labs.txt'),
+        )
+
+    def test_download_marks_file_warm(self):
+        File.objects.filter(pk=self.file.pk).update(uploaded_date='2020-01-01T00:00Z')
+        self.assertEqual(list(cold_files(30)), [self.file])
+        self.client.force_login(self.patient)
+        with mock_solana():
+            self.client.get(reverse('file-download', args=[self.file.pk])).close()
+        self.assertEqual(list(cold_files(30)), [])
+
+    def test_archived_file_downloads_and_is_restored(self):
+        hot_path = self.file.uploaded_file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            freed = archive_file(self.file)
+        self.assertEqual(freed, len(self.content))
+        self.assertFalse(os.path.exists(hot_path))
+        self.file.refresh_from_db()
+        self.assertEqual(self.file.tier, 'archive')
+        self.assertEqual(tier_stats()['archive']['files'], 1)
+
+        self.client.force_login(self.patient)
+        with mock_solana(), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('file-download', args=[self.file.pk]))
+            self.assertEqual(int(response['Content-Length']), len(self.content))
+            self.assertEqual(b''.join(response.streaming_content), self.content)
+            response.close()
+
+        self.file.refresh_from_db()
+        self.assertEqual(self.file.tier, 'hot')
+        self.assertTrue(os.path.exists(hot_path))
+        self.assertFalse(os.path.exists(archive_path(self.file)))
+
+    @override_settings(JOBS_EAGER=False)
+    def test_downloads_queue_one_restore(self):
+        from jobs.models import Job
+
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_file(self.file)
+        self.client.force_login(self.patient)
+        for _ in range(3):
+            with mock_solana():
+                self.client.get(reverse('file-download', args=[self.file.pk])).close()
+        self.assertEqual(Job.objects.filter(name='files.restore_file').count(), 1)
+
+    def test_concurrent_restores_leave_one_intact_copy(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_file(self.file)
+        write_temporary = tiering._write_temporary
+
+        def racing(path, write):
+            # Another restore finishes while this one is decompressing
+            tmp_path = write_temporary(path, write)
+            if not racing.raced:
+                racing.raced = True
+                restore_file(self.file.pk)
+            return tmp_path
+        racing.raced = False
+
+        with mock.patch('files.tiering._write_temporary', racing), self.captureOnCommitCallbacks(execute=True):
+            restore_file(self.file.pk)
+        self.file.refresh_from_db()
+        self.assertEqual(self.file.tier, 'hot')
+        with self.file.uploaded_file.open('rb') as restored:
+            self.assertEqual(restored.read(), self.content)
+        directory = os.path.dirname(self.file.uploaded_file.path)
+        self.assertFalse([name for name in os.listdir(directory) if name.endswith('.tmp')])
+
+    def test_restore_tolerates_an_archive_already_removed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_file(self.file)
+        with self.captureOnCommitCallbacks() as callbacks:
+            restore_file(self.file.pk)
+        os.remove(archive_path(self.file))
+        for callback in callbacks:
+            callback()
+        self.file.refresh_from_db()
+        self.assertEqual(self.file.tier, 'hot')
+
+
+class AccessLogPagingTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.file = File.objects.create(owner=self.patient, uploaded_by=self.patient,
+                                        uploaded_file=ContentFile(b'notes', name='notes.txt'))
+        self.client.force_login(self.patient)
+        self.url = reverse('file-access-log', args=[self.file.pk])
+
+    def test_cursor_is_validated_before_reaching_the_chain(self):
+        with mock_solana() as solana:
+            response = self.client.get(self.url, {'before': 'junk'})
+        self.assertEqual(response.status_code, 400)
+        solana.retrieve_access_logs.assert_not_awaited()
+
+    def test_pages_follow_the_cursor(self):
+        cursor = '1' * 64
+        next_cursor = '2' * 64
+        with mock_solana() as solana:
+            entry = {'timestamp': timezone.now(), 'user': self.patient, 'action': 'downloaded',
+                     'signature': cursor, 'status': 'finalized'}
+            solana.retrieve_access_logs.return_value = ([entry], next_cursor)
+            first = self.client.get(self.url)
+            older = self.client.get(self.url, {'before': cursor})
+        self.assertEqual([call.kwargs['before'] for call in solana.retrieve_access_logs.await_args_list], [None, cursor])
+        self.assertContains(first, f'?before={next_cursor}')
+        self.assertEqual(older.status_code, 200)
+
+
+class BackfillTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.files = [
+            File.objects.create(
+                owner=self.patient, uploaded_by=self.patient, uploaded_file=ContentFile(b'%d' % index, name='f.txt'),
+            )
+            for index in range(5)
+        ]
+
+    def test_resumes_from_checkpoint(self):
+        backfill = get_backfills()['file-sha256']()
+        checkpoint = run_backfill(backfill, batch_size=2, max_batches=1)
+        self.assertEqual((checkpoint.last_pk, checkpoint.rows_updated), (self.files[1].pk, 2))
+        self.assertIsNone(checkpoint.completed_at)
+        self.assertEqual(File.objects.filter(sha256='').count(), 3)
+
+        checkpoint = run_backfill(backfill, batch_size=2)
+        self.assertIsNotNone(checkpoint.completed_at)
+        self.assertEqual(checkpoint.rows_updated, 5)
+        self.assertEqual(File.objects.get(pk=self.files[0].pk).sha256, hashlib.sha256(b'0').hexdigest())
+
+
+@override_settings(REPLICA_DATABASES=['replica1'], REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    # The router only names aliases, so no replica connection is needed
+
+    def setUp(self):
+        patcher = mock.patch.object(db_router._lag_cache, 'healthy_replicas', return_value=['replica1'])
+        self.healthy_replicas = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = db_router.PrimaryReplicaRouter()
+
+    def in_request(self, func):
+        # A fresh context, as each request (or task) gets
+        return contextvars.Context().run(func)
+
+    def test_reads_go_to_a_replica_until_the_request_writes(self):
+        def request():
+            before = self.router.db_for_read(File)
+            self.assertEqual(self.router.db_for_write(File), 'default')
+            return before, self.router.db_for_read(File)
+
+        self.assertEqual(self.in_request(request), ('replica1', 'default'))
+
+    def test_lagging_replicas_are_skipped(self):
+        self.healthy_replicas.return_value = []
+        self.assertEqual(self.in_request(lambda: self.router.db_for_read(File)), 'default')
+
+    def test_writes_pin_the_browser_to_the_primary(self):
+        factory = RequestFactory()
+        reads = []
+
+        def writing_view(request):
+            self.router.db_for_write(File)
+            return HttpResponse()
+
+        def reading_view(request):
+            reads.append(self.router.db_for_read(File))
+            return HttpResponse()
+
+        response = self.in_request(lambda: db_router.ReplicaStickinessMiddleware(writing_view)(factory.post('/')))
+        cookie = response.cookies[db_router.STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], 10)
+
+        response = self.in_request(lambda: db_router.ReplicaStickinessMiddleware(reading_view)(factory.get('/')))
+        self.assertNotIn(db_router.STICKY_COOKIE, response.cookies)
+        request = factory.get('/')
+        request.COOKIES[db_router.STICKY_COOKIE] = '1'
+        self.in_request(lambda: db_router.ReplicaStickinessMiddleware(reading_view)(request))
+        self.assertEqual(reads, ['replica1', 'default'])
+
+
+class IntegrityTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        patient = User.objects.create_user('patient@example.com', None)
+        self.files = {}
+        for name in ('intact', 'corrupt', 'missing', 'archived'):
+            content = name.encode() * 100
+            self.files[name] = File.objects.create(
+                owner=patient, uploaded_by=patient, uploaded_file=ContentFile(content, name=f'{name}.txt'),
+                sha256=hashlib.sha256(content).hexdigest(),
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_file(self.files['archived'])
+        with open(self.files['corrupt'].uploaded_file.path, 'r+b') as blob:
+            blob.write(b'X')
+        os.remove(self.files['missing'].uploaded_file.path)
+        stray_path = os.path.join(self.media_root, 'user_files', 'stray.txt')
+        with open(stray_path, 'wb') as stray:
+            stray.write(b'stray')
+        # Past collect_garbage's grace period, unlike an upload in flight
+        then = time.time() - 2 * 24 * 3600
+        os.utime(stray_path, (then, then))
+        with open(os.path.join(self.media_root, 'user_files', 'uploading.txt'), 'wb') as uploading:
+            uploading.write(b'uploading')
+
+    def test_reports_problems_and_skips_verified_files(self):
+        problems = []
+        counts = verify_files(processes=0, report=problems.append)
+        self.assertEqual((counts['ok'], counts['corrupt'], counts['missing']), (2, 1, 1))
+        self.assertEqual(
+            sorted((problem.kind, problem.file_id) for problem in problems),
+            [('corrupt', self.files['corrupt'].pk), ('missing', self.files['missing'].pk)],
+        )
+        self.assertEqual([problem.path.rsplit(os.sep, 1)[-1] for problem in find_orphans()], ['stray.txt'])
+
+        verified = set(File.objects.filter(verified_at__isnull=False).values_list('pk', flat=True))
+        self.assertEqual(verified, {self.files['intact'].pk, self.files['archived'].pk})
+        # Only the files that failed are hashed again
+        counts = verify_files(processes=0)
+        self.assertEqual((counts['ok'], counts['skipped'], counts['corrupt']), (0, 2, 1))
+
+    def test_hashes_on_process_pool(self):
+        counts = verify_files(processes=1, full=True)
+        self.assertEqual((counts['ok'], counts['corrupt']), (2, 1))
+
+
+class GarbageCollectionTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.file = File.objects.create(
+            owner=self.patient, uploaded_by=self.patient, uploaded_file=ContentFile(b'kept', name='kept.txt'), sha256='a' * 64,
+        )
+
+    def write(self, *parts, age_hours=48):
+        path = os.path.join(self.media_root, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            out.write(b'orphaned')
+        then = time.time() - age_hours * 3600
+        os.utime(path, (then, then))
+        return path
+
+    def test_removes_old_unreferenced_blobs_only(self):
+        orphan = self.write('user_files', 'orphan.txt')
+        fresh = self.write('user_files', 'uploading.txt', age_hours=1)
+        archived = self.write('archive', 'user_files', 'gone.txt.gz')
+        stale_tmp = self.write('archive', 'user_files', 'gone.txt.gz.tmp')
+        kept_preview = self.write('previews', 'aa', 'a' * 64, 'thumb.webp')
+        stale_preview = self.write('previews', 'bb', 'b' * 64, 'thumb.webp')
+
+        reclaimed = collect_garbage(batch_size=2)
+
+        self.assertEqual((reclaimed['hot'], reclaimed['archive'], reclaimed['preview']), (1, 2, 1))
+        self.assertEqual(reclaimed['hot_bytes'], len(b'orphaned'))
+        for path in (orphan, archived, stale_tmp, stale_preview):
+            self.assertFalse(os.path.exists(path), path)
+        for path in (fresh, kept_preview, self.file.uploaded_file.path):
+            self.assertTrue(os.path.exists(path), path)
+
+    def test_deleting_a_file_removes_its_blob_on_commit(self):
+        path = self.file.uploaded_file.path
+        preview = self.write('previews', 'aa', 'a' * 64, 'thumb.webp')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(os.path.dirname(preview)))
+
+
+@override_settings(JOBS_EAGER=True)
+class UploadMetadataTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+
+    def test_upload_records_metadata_as_it_streams(self):
+        content = b'%PDF-1.4 discharge summary'
+        self.client.force_login(self.patient)
+        with mock_solana(), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('file-upload'), {'uploaded_file': ContentFile(content, name='Discharge Summary.pdf')})
+        file = File.objects.get()
+        self.assertEqual(
+            (file.original_name, file.size, file.content_type, file.sha256),
+            ('Discharge Summary.pdf', len(content), 'application/pdf', hashlib.sha256(content).hexdigest()),
+        )
+
+        # Pages and downloads use the row, not the disk
+        os.remove(file.uploaded_file.path)
+        response = self.client.get(reverse('file-access-log', args=[file.pk]))
+        self.assertContains(response, 'Discharge Summary.pdf')
+        self.assertEqual(response.context['file_size'], len(content))
+
+    def test_backfill_fills_existing_rows(self):
+        file = File.objects.create(owner=self.patient, uploaded_by=self.patient,
+                                   uploaded_file=ContentFile(b'1,2,3', name='labs.csv'))
+        run_backfill(get_backfills()['file-metadata']())
+        file.refresh_from_db()
+        self.assertEqual((file.size, file.content_type, file.display_name), (5, 'text/csv', 'labs.csv'))
+
+
+@override_settings(JOBS_EAGER=True)
+class ShardedLayoutTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+
+    def test_uploads_are_sharded_by_content_hash(self):
+        self.client.force_login(self.patient)
+        with mock_solana():
+            self.client.post(reverse('file-upload'), {'uploaded_file': ContentFile(b'ecg', name='ecg.txt')})
+        sha256 = hashlib.sha256(b'ecg').hexdigest()
+        self.assertEqual(File.objects.get().uploaded_file.name, f'user_files/{sha256[:2]}/{sha256[2:4]}/ecg.txt')
+
+    def test_backfill_moves_flat_files_and_downloads_keep_working(self):
+        flat_path = os.path.join(self.media_root, 'user_files', 'flat.txt')
+        os.makedirs(os.path.dirname(flat_path), exist_ok=True)
+        with open(flat_path, 'wb') as out:
+            out.write(b'old layout')
+        file = File.objects.create(owner=self.patient, uploaded_by=self.patient,
+                                   uploaded_file='user_files/flat.txt', sha256='c0ffee' + '0' * 58)
+
+        # The blob is years old; its old name's grace starts at the move
+        then = time.time() - 365 * 24 * 3600
+        os.utime(flat_path, (then, then))
+
+        run_backfill(get_backfills()['shard-files']())
+
+        file.refresh_from_db()
+        self.assertEqual(file.uploaded_file.name, 'user_files/c0/ff/flat.txt')
+        self.client.force_login(self.patient)
+        with mock_solana():
+            response = self.client.get(reverse('file-download', args=[file.pk]))
+        self.assertEqual(b''.join(response.streaming_content), b'old layout')
+
+        # Readers that still hold the old name have the grace period
+        self.assertEqual(list(find_orphans()), [])
+        self.assertEqual(collect_garbage()['hot'], 0)
+        self.assertTrue(os.path.exists(flat_path))
+        self.assertEqual(collect_garbage(grace=timedelta(0))['hot'], 1)
+        self.assertFalse(os.path.exists(flat_path))
+        self.assertTrue(os.path.exists(file.uploaded_file.path))
+
+
+class ShareLinkTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.file = File.objects.create(owner=self.patient, uploaded_by=self.patient,
+                                        uploaded_file=ContentFile(b'x-ray', name='xray.txt'))
+        share_links._revoked.invalidate()
+
+    def test_owner_creates_link_that_works_without_login(self):
+        self.client.force_login(self.patient)
+        with mock_solana() as solana:
+            response = self.client.post(reverse('share-link-create', args=[self.file.pk]), {'hours': 24}, follow=True)
+        solana.log_access.assert_awaited_once_with(self.patient, 'link_created', self.file)
+        url = next(str(message) for message in response.context['messages']).rsplit(' ', 1)[-1]
+
+        self.client.logout()
+        with mock_solana() as solana:
+            response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'x-ray')
+        user, action, file = solana.log_access.await_args.args
+        self.assertEqual((user.pk, action, file), (self.patient.pk, 'link_downloaded', self.file))
+
+    def test_expired_tampered_and_out_of_scope_tokens_are_rejected(self):
+        _, expired = share_links.create_link(self.file, self.patient, timedelta(seconds=-1))
+        _, token = share_links.create_link(self.file, self.patient, timedelta(hours=1))
+        for bad in (expired, token[:-1] + ('A' if token[-1] != 'A' else 'B')):
+            with self.subTest(token=bad):
+                self.assertEqual(self.client.get(reverse('share-link-download', args=[bad])).status_code, 403)
+        with self.assertRaises(share_links.InvalidShareLink):
+            share_links.check_token(token, 'upload')
+
+    def test_revoked_link_stops_working(self):
+        link, token = share_links.create_link(self.file, self.patient, timedelta(hours=1))
+        self.assertEqual(share_links.check_token(token, 'download'), (self.file.pk, self.patient.pk))
+        self.client.force_login(self.patient)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('share-link-revoke', args=[self.file.pk, link.pk]))
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('share-link-download', args=[token])).status_code, 403)
+        self.assertFalse(share_links.active_links(self.file).exists())
+
+
+STORAGE_KEY = base64.urlsafe_b64encode(b'k' * 32).decode()
+
+
+@override_settings(JOBS_EAGER=True)
+class EncryptionTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.patient = User.objects.create_user('patient@example.com', None)
+        # Spans several chunks, the last one short
+        self.content = os.urandom(3 * CHUNK_SIZE + 100)
+        self.client.force_login(self.patient)
+
+    def upload(self):
+        with mock_solana(), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('file-upload'), {'uploaded_file': ContentFile(self.content, name='scan.dcm')})
+        return File.objects.get(original_name='scan.dcm')
+
+    def download(self, file, **headers):
+        with mock_solana():
+            response = self.client.get(reverse('file-download', args=[file.pk]), headers=headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, content
+
+    def test_range_requests(self):
+        file = self.upload()
+        start = CHUNK_SIZE - 10
+        for header, expected in (
+            (f'bytes={start}-{start + 99}', self.content[start:start + 100]),
+            (f'bytes={start}-', self.content[start:]),
+            ('bytes=-50', self.content[-50:]),
+        ):
+            with self.subTest(range=header):
+                response, content = self.download(file, range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(content, expected)
+                self.assertEqual(int(response['Content-Length']), len(expected))
+                self.assertTrue(response['Content-Range'].endswith(f'/{len(self.content)}'))
+
+        response, _ = self.download(file, range=f'bytes={len(self.content)}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.content)}'))
+        # Multiple ranges are answered with the whole file
+        response, content = self.download(file, range='bytes=0-1,5-6')
+        self.assertEqual((response.status_code, content), (200, self.content))
+
+    @skipUnless(CRYPTOGRAPHY_AVAILABLE, "cryptography is not installed")
+    def test_uploads_are_stored_encrypted_and_read_back(self):
+        for memory_size in (len(self.content) * 2, 0):
+            # Kept in memory then encrypted by the storage, or encrypted as
+            # it streams to a temporary file
+            with self.subTest(memory_size=memory_size), \
+                    self.settings(STORAGE_ENCRYPTION_KEY=STORAGE_KEY, FILE_UPLOAD_MAX_MEMORY_SIZE=memory_size):
+                file = self.upload()
+                with open(file.uploaded_file.path, 'rb') as raw:
+                    stored = raw.read()
+                self.assertTrue(stored.startswith(MAGIC))
+                self.assertNotIn(self.content[:64], stored)
+                self.assertEqual((file.size, file.uploaded_file.size), (len(self.content), len(self.content)))
+                self.assertEqual(file.sha256, hashlib.sha256(self.content).hexdigest())
+
+                response, content = self.download(file)
+                self.assertEqual((int(response['Content-Length']), content), (len(self.content), self.content))
+                start = 2 * CHUNK_SIZE - 5
+                response, content = self.download(file, range=f'bytes={start}-{start + 9}')
+                self.assertEqual((response.status_code, content), (206, self.content[start:start + 10]))
+                file.delete()
+
+    @skipUnless(CRYPTOGRAPHY_AVAILABLE, "cryptography is not installed")
+    def test_archive_round_trip_and_tampering(self):
+        # Stored before encryption was turned on
+        legacy = File.objects.create(owner=self.patient, uploaded_by=self.patient,
+                                     uploaded_file=ContentFile(b'old notes', name='old.txt'),
+                                     sha256=hashlib.sha256(b'old notes').hexdigest())
+        with self.settings(STORAGE_ENCRYPTION_KEY=STORAGE_KEY):
+            file = self.upload()
+            with self.captureOnCommitCallbacks(execute=True):
+                archive_file(file)
+            with open(archive_path(file), 'rb') as raw:
+                self.assertTrue(raw.read().startswith(MAGIC))
+            self.assertEqual(verify_files(processes=0)['ok'], 2)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                response, content = self.download(file)
+            self.assertEqual(content, self.content)
+            file.refresh_from_db()
+            self.assertEqual(file.tier, 'hot')
+            self.assertEqual(self.download(legacy)[1], b'old notes')
+
+            with open(file.uploaded_file.path, 'r+b') as blob:
+                blob.seek(CHUNK_SIZE)
+                blob.write(b'X')
+            problems = []
+            verify_files(processes=1, full=True, report=problems.append)
+            self.assertEqual([(problem.kind, problem.file_id) for problem in problems], [('corrupt', file.pk)])
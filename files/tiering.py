@@ -0,0 +1,206 @@
+"""
+Hot and archive storage tiers for uploaded files.
+
+Downloads record File.last_accessed. The tier_files command gzips files
+that have gone cold into ARCHIVE_ROOT (a cheaper volume) and removes the
+hot copy. Opening an archived file streams it decompressed and queues a
+restore to the hot tier, since a file that is read once tends to be read
+again soon. Archives are encrypted like hot blobs when encryption is on;
+the gzip stream is what gets encrypted, since ciphertext doesn't compress.
+"""
+
+import gzip
+import io
+import logging
+import os
+import shutil
+import struct
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .encryption import blob_size, encrypting, open_blob
+from .models import File
+
+logger = logging.getLogger(__name__)
+
+HOT = 'hot'
+ARCHIVE = 'archive'
+# last_accessed is only written when it is older than this, so busy files
+# don't cost a write per download
+TOUCH_INTERVAL = timedelta(hours=1)
+CHUNK_SIZE = 1024 * 1024
+
+
+def touch(file):
+    """Record an access to ``file``."""
+    now = timezone.now()
+    if file.last_accessed is None or now - file.last_accessed >= TOUCH_INTERVAL:
+        File.objects.filter(pk=file.pk).update(last_accessed=now)
+        file.last_accessed = now
+
+
+def archive_path(file):
+    return os.path.join(settings.ARCHIVE_ROOT, file.uploaded_file.name + '.gz')
+
+
+def cold_files(cold_days):
+    """Hot files not downloaded (or, if never downloaded, uploaded) in ``cold_days`` days."""
+    cutoff = timezone.now() - timedelta(days=cold_days)
+    return File.objects.filter(tier=HOT).filter(
+        Q(last_accessed__lt=cutoff) | Q(last_accessed__isnull=True, uploaded_date__lt=cutoff)
+    )
+
+
+def _write_temporary(path, write):
+    """
+    Write a new copy of ``path`` with ``write`` into a temporary file of
+    its own beside it, and return the temporary file's path. Concurrent
+    writers of the same path never share a file.
+    """
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=name + '.', suffix='.tmp')
+    try:
+        with open(fd, 'wb') as out:
+            write(out)
+            out.flush()
+            os.fsync(out.fileno())
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def _remove(path):
+    # Run after commit, when another run (or collect_garbage) may have got there first
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_atomically(path, write):
+    os.replace(_write_temporary(path, write), path)
+
+
+def archive_file(file):
+    """
+    Move ``file`` to the archive tier. Returns the number of hot bytes
+    freed. The hot copy is only deleted once the row says it is archived.
+    """
+    hot_path = file.uploaded_file.path
+    size = blob_size(hot_path)
+
+    def compress(out):
+        with (
+            open_blob(hot_path) as source,
+            encrypting(out) as sealed,
+            gzip.GzipFile(fileobj=sealed, mode='wb', compresslevel=6, mtime=0) as target,
+        ):
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+    _write_atomically(archive_path(file), compress)
+    with transaction.atomic():
+        updated = File.objects.filter(pk=file.pk, tier=HOT).update(
+            tier=ARCHIVE, archived_size=os.path.getsize(archive_path(file)),
+        )
+        if updated:
+            transaction.on_commit(lambda: _remove(hot_path))
+    return size if updated else 0
+
+
+def restore_file(file_id):
+    """
+    Bring an archived file back to the hot tier. Safe to run concurrently:
+    each run decompresses into its own temporary file, and only the one
+    whose conditional UPDATE claims the row from the archive tier moves it
+    into place.
+    """
+    file = File.objects.filter(pk=file_id).first()
+    if file is None or file.tier != ARCHIVE:
+        return
+
+    def decompress(out):
+        with ArchiveReader(archive_path(file)) as source, encrypting(out) as sealed:
+            shutil.copyfileobj(source, sealed, CHUNK_SIZE)
+
+    hot_path = file.uploaded_file.path
+    tmp_path = _write_temporary(hot_path, decompress)
+    try:
+        with transaction.atomic():
+            # select_for_update is a no-op on SQLite; the UPDATE itself is the claim
+            claimed = File.objects.filter(pk=file.pk, tier=ARCHIVE).update(tier=HOT, archived_size=None)
+            if not claimed:
+                # Restored by another run meanwhile, or deleted
+                return
+            os.replace(tmp_path, hot_path)
+            path = archive_path(file)
+            transaction.on_commit(lambda: _remove(path))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ArchiveReader(io.RawIOBase):
+    """
+    Decompressing reader for an archived file. Deliberately not seekable:
+    FileResponse would otherwise decompress everything to measure it.
+    ``size`` comes from the gzip trailer instead.
+    """
+
+    def __init__(self, path):
+        self._blob = open_blob(path)
+        try:
+            self._blob.seek(-4, os.SEEK_END)
+            # ISIZE: uncompressed length mod 2**32
+            self.size = struct.unpack('<I', self._blob.read(4))[0]
+            self._blob.seek(0)
+        except BaseException:
+            self._blob.close()
+            raise
+        self._gzip = gzip.GzipFile(fileobj=self._blob, mode='rb')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._gzip.readinto(buffer)
+
+    def close(self):
+        self._gzip.close()
+        self._blob.close()
+        super().close()
+
+
+def open_file(file):
+    """
+    A binary reader for ``file``'s contents in whichever tier it is in.
+    Archived files are streamed from the archive and queued for restore.
+    """
+    if file.tier == ARCHIVE:
+        from jobs.queue import enqueue
+
+        reader = ArchiveReader(archive_path(file))
+        enqueue('files.restore_file', file.pk, unique=True)
+        return reader
+    return file.uploaded_file.open('rb')
+
+
+def tier_stats():
+    """Per-tier file counts and bytes on disk."""
+    stats = {}
+    for tier, path_of in ((HOT, lambda file: file.uploaded_file.path), (ARCHIVE, archive_path)):
+        count = size = 0
+        for file in File.objects.filter(tier=tier).only('uploaded_file').iterator():
+            count += 1
+            try:
+                size += os.path.getsize(path_of(file))
+            except OSError:
+                logger.warning("File %s is missing from the %s tier", file.pk, tier)
+        stats[tier] = {'files': count, 'bytes': size}
+    return stats
@@ -0,0 +1,72 @@
+"""
+Metadata for uploads, recorded on the File row as the upload arrives so
+that pages and downloads never have to stat or read the stored blob.
+"""
+
+import hashlib
+import mimetypes
+
+from django.core.files.uploadhandler import FileUploadHandler, TemporaryFileUploadHandler
+
+from .encryption import EncryptingWriter, master_key
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """
+    Runs ahead of Django's own upload handlers (FILE_UPLOAD_HANDLERS),
+    hashing each file's chunks as they stream past. Results are left in
+    ``request.upload_digests`` as {field name: (sha256, size)}.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request.upload_digests = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        self.size += len(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.request.upload_digests[self.field_name] = (self.digest.hexdigest(), self.size)
+        # The next handler builds the actual UploadedFile
+        return None
+
+
+class EncryptingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Django's TemporaryFileUploadHandler, but encrypting uploads as they
+    stream to the temporary file when STORAGE_ENCRYPTION_KEY is set, so
+    large uploads never touch the disk in the clear. The storage moves the
+    finished file into place without encrypting it again.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        key = master_key()
+        self.writer = EncryptingWriter(self.file.file, key) if key else None
+        self.file.encrypted_at_rest = key is not None
+
+    def receive_data_chunk(self, raw_data, start):
+        (self.writer or self.file).write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.writer:
+            self.writer.close()
+        return super().file_complete(file_size)
+
+
+def upload_metadata(request, field_name, upload):
+    """File field values describing ``upload``, the UploadedFile in ``field_name``."""
+    sha256, size = getattr(request, 'upload_digests', {}).get(field_name, ('', upload.size))
+    content_type, _ = mimetypes.guess_type(upload.name)
+    return {
+        'original_name': upload.name[:255],
+        'size': size,
+        'content_type': content_type or 'application/octet-stream',
+        'sha256': sha256,
+    }
@@ -2,19 +2,35 @@ from django.urls import path
 from .views import (
     file_upload_view,
     file_list_view,
+    file_search_view,
     file_download_view,
+    file_preview_view,
     share_file_view,
     revoke_access_view,
     file_access_log_view,
+    file_access_log_stream_view,
+    access_timeline_view,
+    audit_export_view,
+    create_share_link_view,
+    revoke_share_link_view,
+    share_link_download_view,
     file_delete_view
 )
 
 urlpatterns = [
     path('upload/', file_upload_view, name='file-upload'),
     path('list/', file_list_view, name='file-list'),
+    path('search/', file_search_view, name='file-search'),
     path('download/<int:pk>/', file_download_view, name='file-download'),
+    path('preview/<int:pk>/<str:size>/', file_preview_view, name='file-preview'),
     path('share/<int:pk>/', share_file_view, name='file-share'),
     path('revoke/<int:file_id>/<int:user_id>/', revoke_access_view, name='revoke-access'),
     path('access-log/<int:pk>/', file_access_log_view, name='file-access-log'),
+    path('access-log/<int:pk>/stream/', file_access_log_stream_view, name='file-access-log-stream'),
+    path('timeline/', access_timeline_view, name='access-timeline'),
+    path('audit-export/', audit_export_view, name='audit-export'),
+    path('share/<int:pk>/links/', create_share_link_view, name='share-link-create'),
+    path('share/<int:pk>/links/<int:link_id>/revoke/', revoke_share_link_view, name='share-link-revoke'),
+    path('s/<str:token>/', share_link_download_view, name='share-link-download'),
     path('delete/<int:pk>/', file_delete_view, name='file-delete'),
 ]
\ No newline at end of file
@@ -1,24 +1,42 @@
 # files/views.py
 
-import mimetypes
+import io
+import os
+import re
+from datetime import date, datetime, time, timedelta
 from django.contrib import messages
-from django.http import HttpResponse, HttpResponseForbidden
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
+from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.decorators import login_required
-from django.core.files.storage import FileSystemStorage
-from asgiref.sync import async_to_sync
-from .models import File, FileAccess
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import async_to_sync, sync_to_async
+from monitoring.metrics import DOWNLOAD_BYTES
+from .models import File, FileAccess, ShareLink
 from .forms import FileUploadForm
+from .pipeline import schedule
+from .previews import PREVIEW_SIZES, preview_path
+from .search import search_files
+from .share_links import LIFETIMES as LINK_LIFETIMES, InvalidShareLink, active_links, check_token, create_link, revoke_link
+from .tiering import open_file, touch
+from .uploads import upload_metadata
 # Conditional Solana imports
 try:
-    from access_log.solana_utils import log_access, retrieve_access_logs
+    from access_log.solana_utils import log_access, parse_signature, retrieve_access_logs
+    from access_log.resilience import RpcUnavailable
     SOLANA_AVAILABLE = True
 except ImportError:
     SOLANA_AVAILABLE = False
-    def log_access(*args, **kwargs):
-        pass  # No-op when Solana is disabled
+    class RpcUnavailable(Exception):
+        pass
+    async def log_access(user, action, file, target=None, digest=None):
+        # Without the chain the access is still recorded for the timeline
+        from access_log.audit import record_access
+        return await sync_to_async(record_access)(user, action, file, target, digest, queued=False)
     def retrieve_access_logs(*args, **kwargs):
-        return []
+        return [], None
+from users.autocomplete import mark_stale
 from users.models import User
 
 
@@ -28,6 +46,8 @@ def file_upload_view(request):
         form = FileUploadForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
             file_instance = form.save(commit=False)
+            for field, value in upload_metadata(request, 'uploaded_file', form.cleaned_data['uploaded_file']).items():
+                setattr(file_instance, field, value)
             if request.user.is_provider:
                 # Providers upload files on behalf of patients
                 owner_email = form.cleaned_data.get('owner_email')
@@ -45,11 +65,12 @@ def file_upload_view(request):
 
             # Save the file instance to get the ID
             file_instance.save()
+            # Extract and index its text in the background
+            schedule(file_instance.pk)
+            mark_stale(file_instance.owner, request.user)
 
-            # Log the upload action asynchronously (if Solana is enabled)
-            from django.conf import settings
-            if getattr(settings, 'SOLANA_ENABLED', False) and SOLANA_AVAILABLE:
-                async_to_sync(log_access)(request.user, 'uploaded', file_instance)
+            # Record the upload (and send it to Solana if enabled)
+            async_to_sync(log_access)(request.user, 'uploaded', file_instance)
 
             return redirect('file-list')
     else:
@@ -70,79 +91,289 @@ def file_list_view(request):
     return render(request, 'files/file_list.html', {'files': files})
 
 
+@login_required
+def file_search_view(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
+    results = search_files(request.user, query, page=page) if query else None
+    return render(request, 'files/file_search.html', {'query': query, 'results': results})
+
+
+class _RangeReader(io.RawIOBase):
+    """At most ``length`` bytes of ``reader`` from where it stands."""
+
+    def __init__(self, reader, length):
+        self._reader = reader
+        self._left = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._reader.read(min(len(buffer), self._left))
+        buffer[:len(data)] = data
+        self._left -= len(data)
+        return len(data)
+
+    def close(self):
+        self._reader.close()
+        super().close()
+
+
+def _byte_range(header, size):
+    """
+    Inclusive ``(start, end)`` of a single-range Range header, (None, None)
+    when it can't be satisfied, or None to send the whole file: no header,
+    or a form we don't support (multiple ranges), which HTTP lets us ignore.
+    """
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # The last n bytes
+        if not int(last):
+            return None, None
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return None, None
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _download_response(file, request):
+    # Stream the file in blocks rather than reading it into memory
+    touch(file)
+    reader = open_file(file)
+    size = None
+    seekable = reader.seekable()
+    if seekable:
+        # Hot files, encrypted or not; archived ones stream decompressed and
+        # are always sent whole
+        size = reader.seek(0, os.SEEK_END)
+        reader.seek(0)
+    byte_range = None
+    # Nothing sent carries a validator, so an If-Range can never match
+    if size is not None and 'If-Range' not in request.headers:
+        byte_range = _byte_range(request.headers.get('Range'), size)
+    if byte_range == (None, None):
+        reader.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        reader.seek(start)
+        reader = _RangeReader(reader, end - start + 1)
+    response = FileResponse(
+        reader,
+        status=206 if byte_range else 200,
+        as_attachment=True,
+        filename=file.display_name,
+        content_type=file.content_type or None,
+    )
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    elif not seekable:
+        # Archived files stream decompressed, so FileResponse can't measure them
+        size = file.size if file.size is not None else getattr(reader, 'size', None)
+        if size is not None:
+            response['Content-Length'] = size
+    if seekable:
+        response['Accept-Ranges'] = 'bytes'
+    response.streaming_content = _count_download_bytes(response.streaming_content)
+    return response
+
+
+def _count_download_bytes(chunks):
+    # Counted as sent, so aborted downloads only count what went out
+    for chunk in chunks:
+        DOWNLOAD_BYTES.inc(len(chunk))
+        yield chunk
+
+
 @login_required
 def file_download_view(request, pk):
     file = get_object_or_404(File, pk=pk)
     
-    # Check permissions
-    if (file.owner == request.user or
-        file.uploaded_by == request.user or
+    # Check permissions (compare ids so the related users aren't fetched)
+    if (file.owner_id == request.user.id or
+        file.uploaded_by_id == request.user.id or
         FileAccess.objects.filter(file=file, user=request.user).exists()):
 
         action = "downloaded"
-        # Log to Solana asynchronously (if Solana is enabled)
-        from django.conf import settings
-        if getattr(settings, 'SOLANA_ENABLED', False) and SOLANA_AVAILABLE:
-            async_to_sync(log_access)(request.user, action, file)
-
-        # Serve the file
-        file_path = file.uploaded_file.path
-        file_mimetype, _ = mimetypes.guess_type(file_path)
-        fs = FileSystemStorage()
-        with fs.open(file_path, 'rb') as f:
-            response = HttpResponse(f.read(), content_type=file_mimetype)
-            response['Content-Disposition'] = f'attachment; filename={file.uploaded_file.name}'
-            return response
+        # Record the access (and send it to Solana if enabled)
+        async_to_sync(log_access)(request.user, action, file)
+
+        return _download_response(file, request)
     else:
         return HttpResponseForbidden("You do not have permission to access this file.")
 
 
 @login_required
-def file_access_log_view(request, pk):
+def file_preview_view(request, pk, size):
     file = get_object_or_404(File, pk=pk)
-    
-    # Ensure the user has access to view logs
-    if not (file.owner == request.user or
-            file.uploaded_by == request.user or
+    if not (file.owner_id == request.user.id or
+            file.uploaded_by_id == request.user.id or
             FileAccess.objects.filter(file=file, user=request.user).exists()):
-        return HttpResponseForbidden("You do not have permission to view access logs for this file.")
+        return HttpResponseForbidden("You do not have permission to view this file.")
+    if size not in PREVIEW_SIZES or not file.has_preview:
+        raise Http404("No preview for this file.")
 
-    # Add file size info safely
-    file_size = None
     try:
-        if file.uploaded_file and hasattr(file.uploaded_file, 'size'):
-            file_size = file.uploaded_file.size
-    except (OSError, FileNotFoundError):
-        # File doesn't exist on disk
-        file_size = None
+        preview = open(preview_path(file.sha256, size), 'rb')
+    except FileNotFoundError:
+        raise Http404("No preview for this file.")
+    response = FileResponse(preview, content_type='image/webp')
+    # A file's contents never change, so neither do its previews
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response['ETag'] = f'"{file.sha256}-{size}"'
+    return response
+
+
+def _can_view_access_log(file, user):
+    return (file.owner_id == user.id or
+            file.uploaded_by_id == user.id or
+            FileAccess.objects.filter(file=file, user=user).exists())
+
+
+@login_required
+def file_access_log_view(request, pk):
+    file = get_object_or_404(File.objects.select_related('owner'), pk=pk)
+    
+    # Ensure the user has access to view logs
+    if not _can_view_access_log(file, request.user):
+        return HttpResponseForbidden("You do not have permission to view access logs for this file.")
 
     # Retrieve access logs asynchronously (if Solana is enabled)
     from django.conf import settings
+    # History is paged from the chain; ?before=<signature> selects older pages
+    access_logs, next_cursor = [], None
     if getattr(settings, 'SOLANA_ENABLED', False) and SOLANA_AVAILABLE:
-        access_logs = async_to_sync(retrieve_access_logs)(file)
-    else:
-        access_logs = []
+        before = request.GET.get('before') or None
+        if before is not None:
+            try:
+                before = parse_signature(before)
+            except ValueError:
+                return HttpResponseBadRequest("Invalid page cursor.")
+        try:
+            access_logs, next_cursor = async_to_sync(retrieve_access_logs)(file, before=before)
+        except RpcUnavailable:
+            messages.warning(request, "The blockchain audit trail is temporarily unavailable. Please try again shortly.")
 
     context = {
         'file': file,
-        'file_size': file_size,
-        'access_logs': access_logs
+        'file_size': file.size,
+        'access_logs': access_logs,
+        'next_cursor': next_cursor,
     }
     return render(request, 'files/file_access_log.html', context)
 
 
 @login_required
-def share_file_view(request, pk):
-    file = get_object_or_404(File, pk=pk, owner=request.user)
-    
-    # Add file size info safely
-    file_size = None
+async def file_access_log_stream_view(request, pk):
+    """
+    New and updated access log entries for a file, as Server-Sent Events.
+    Under ASGI the stream stays open; under WSGI it returns what is new
+    since Last-Event-ID and asks the browser to reconnect shortly.
+    """
+    from django.conf import settings
+    from access_log.live import catch_up, follow, format_key, latest_key, parse_key, sse_message
+
+    user = await request.auser()
+    file = await File.objects.filter(pk=pk).afirst()
+    if file is None:
+        raise Http404
+    if not await sync_to_async(_can_view_access_log)(file, user):
+        return HttpResponseForbidden("You do not have permission to view access logs for this file.")
+
+    key = parse_key(request.headers.get('Last-Event-ID') or request.GET.get('after'))
+    if key is None:
+        # A fresh page already shows the history; start from now
+        key = await latest_key(file.id)
+
+    # Sets the browser's Last-Event-ID even if nothing happens before a reconnect
+    opening = f'id: {format_key(key)}\n\n'
+    if isinstance(request, ASGIRequest):
+        async def events():
+            yield opening
+            async for change in follow(file, key):
+                yield sse_message(change)
+
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    else:
+        body = [opening] + [sse_message(change) async for change in catch_up(file, key)]
+        body.append(f'retry: {int(settings.ACCESS_LOG_LIVE_WSGI_RETRY * 1000)}\n\n')
+        response = HttpResponse(''.join(body), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+def access_timeline_view(request):
+    """Every recorded access to any of the user's files, newest first, a page at a time."""
+    from access_log.timeline import timeline_page
+
+    entries, next_cursor = timeline_page(request.user, before=request.GET.get('before'))
+    return render(request, 'files/access_timeline.html', {'entries': entries, 'next_cursor': next_cursor})
+
+
+@login_required
+def audit_export_view(request):
+    """
+    Every recorded access to the files a patient owns (or a provider
+    uploaded) between two dates, streamed as CSV or JSON Lines. Staff can
+    export for another user with ?user=<email>.
+    """
+    from access_log.export import render_csv, render_jsonl, stream_rows
+
+    subject = request.user
+    if request.GET.get('user') and request.GET['user'] != request.user.email:
+        if not request.user.is_staff:
+            return HttpResponseForbidden("Only staff can export another user's audit trail.")
+        subject = get_object_or_404(User, email=request.GET['user'])
+
     try:
-        if file.uploaded_file and hasattr(file.uploaded_file, 'size'):
-            file_size = file.uploaded_file.size
-    except (OSError, FileNotFoundError):
-        # File doesn't exist on disk
-        file_size = None
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else date(1970, 1, 1)
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+    except ValueError:
+        return HttpResponseBadRequest("Dates must be YYYY-MM-DD.")
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        return HttpResponseBadRequest("Format must be csv or jsonl.")
+
+    # Whole local days, end date included
+    tz = timezone.get_current_timezone()
+    start_ts = datetime.combine(start, time.min, tz).timestamp()
+    end_ts = datetime.combine(end + timedelta(days=1), time.min, tz).timestamp()
+    if subject.is_provider:
+        files = File.objects.filter(uploaded_by=subject)
+    else:
+        files = File.objects.filter(owner=subject)
+
+    # The export iterates the queryset itself; don't load every file here
+    rows = stream_rows(files, start_ts, end_ts)
+    if export_format == 'csv':
+        response = StreamingHttpResponse(render_csv(rows), content_type='text/csv')
+    else:
+        response = StreamingHttpResponse(render_jsonl(rows), content_type='application/x-ndjson')
+    filename = f"audit-{subject.pk}-{start}-{end}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def share_file_view(request, pk):
+    file = get_object_or_404(File.objects.select_related('owner'), pk=pk, owner=request.user)
     
     if request.method == 'POST':
         email = request.POST.get('email')
@@ -154,11 +385,9 @@ def share_file_view(request, pk):
                 access_entry, created = FileAccess.objects.get_or_create(file=file, user=user_to_share)
                 if created:
                     messages.success(request, f"File shared with {user_to_share.email}.")
-                    action = "shared with " + user_to_share.email
-                    # Log to Solana asynchronously (if Solana is enabled)
-                    from django.conf import settings
-                    if getattr(settings, 'SOLANA_ENABLED', False) and SOLANA_AVAILABLE:
-                        async_to_sync(log_access)(request.user, action, file)
+                    mark_stale(request.user)
+                    # Record the share (and send it to Solana if enabled)
+                    async_to_sync(log_access)(request.user, 'shared', file, target=user_to_share)
                 else:
                     messages.info(request, f"File is already shared with {user_to_share.email}.")
         except User.DoesNotExist:
@@ -167,7 +396,10 @@ def share_file_view(request, pk):
     else:
         context = {
             'file': file,
-            'file_size': file_size
+            'file_size': file.size,
+            'access_list': file.access_list.select_related('user'),
+            'share_links': active_links(file),
+            'link_lifetimes': LINK_LIFETIMES,
         }
         return render(request, 'files/file_share.html', context)
 
@@ -179,15 +411,55 @@ def revoke_access_view(request, file_id, user_id):
         access_entry = FileAccess.objects.get(file=file, user__id=user_id)
         access_entry.delete()
         messages.success(request, "Access revoked.")
-        action = "revoked access for " + access_entry.user.email
-        # Log to Solana asynchronously (if Solana is enabled)
-        from django.conf import settings
-        if getattr(settings, 'SOLANA_ENABLED', False) and SOLANA_AVAILABLE:
-            async_to_sync(log_access)(request.user, action, file)
+        mark_stale(request.user, rebuild=True)
+        # Record the revocation (and send it to Solana if enabled)
+        async_to_sync(log_access)(request.user, 'revoked', file, target=access_entry.user)
     except FileAccess.DoesNotExist:
         messages.error(request, "Access entry does not exist.")
     return redirect('file-share', pk=file.id)
 
+@login_required
+def create_share_link_view(request, pk):
+    file = get_object_or_404(File, pk=pk, owner=request.user)
+    if request.method == 'POST':
+        try:
+            hours = int(request.POST.get('hours', ''))
+        except ValueError:
+            hours = None
+        if hours not in LINK_LIFETIMES:
+            messages.error(request, "Choose how long the link should work for.")
+        else:
+            link, token = create_link(file, request.user, timedelta(hours=hours))
+            url = request.build_absolute_uri(reverse('share-link-download', args=[token]))
+            # The token isn't stored, so this is the only time it can be shown
+            messages.success(request, f"Share link, valid until {link.expires_at:%b %d, %Y %H:%M} UTC: {url}")
+            async_to_sync(log_access)(request.user, 'link_created', file)
+    return redirect('file-share', pk=file.id)
+
+
+@login_required
+def revoke_share_link_view(request, pk, link_id):
+    file = get_object_or_404(File, pk=pk, owner=request.user)
+    link = get_object_or_404(ShareLink, pk=link_id, file=file)
+    revoke_link(link)
+    messages.success(request, "Share link revoked.")
+    async_to_sync(log_access)(request.user, 'link_revoked', file)
+    return redirect('file-share', pk=file.id)
+
+
+def share_link_download_view(request, token):
+    """Download through a signed share link; no account or ACL lookup needed."""
+    try:
+        file_id, sharer_id = check_token(token, 'download')
+    except InvalidShareLink as e:
+        return HttpResponseForbidden(str(e))
+    file = get_object_or_404(File, pk=file_id)
+
+    # Only the sharer's id goes in the memo, so an unsaved User will do
+    async_to_sync(log_access)(User(pk=sharer_id), 'link_downloaded', file)
+    return _download_response(file, request)
+
+
 @login_required
 def file_delete_view(request, pk):
     file = get_object_or_404(File, pk=pk, owner=request.user)
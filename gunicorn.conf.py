@@ -0,0 +1,24 @@
+# gunicorn.conf.py
+# Picked up automatically by `gunicorn sealevel.wsgi:application`.
+
+import os
+import shutil
+
+# Each worker writes its metrics into this directory and /metrics aggregates
+# them, so a scrape sees the whole server rather than a single worker.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/sealevel-metrics')
+
+
+def on_starting(server):
+    # Stale files from a previous run would be summed into the new one
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
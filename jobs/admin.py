@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'priority', 'attempts', 'run_after', 'started_at', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name',)
+    ordering = ('-id',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'locked_by', 'locked_until')
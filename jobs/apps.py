@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class JobsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "jobs"
+
+    def ready(self):
+        from monitoring.metrics import PROMETHEUS_AVAILABLE, register_scrape_collector
+        if PROMETHEUS_AVAILABLE:
+            from .metrics import JobQueueCollector
+            register_scrape_collector(JobQueueCollector())
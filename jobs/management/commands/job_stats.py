@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from jobs.queue import queue_stats
+
+
+def _seconds(value):
+    return '-' if value is None else f'{value:.1f}s'
+
+
+class Command(BaseCommand):
+    help = "Show job queue depth and wait/run times, for sizing workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=60, help="Minutes of finished jobs to time.")
+
+    def handle(self, *args, **options):
+        stats = queue_stats(window=timedelta(minutes=options['window']))
+        if not stats:
+            self.stdout.write("No jobs.")
+            return
+        self.stdout.write(
+            f"{'job':<28} {'queued':>7} {'ready':>6} {'running':>7} {'failed':>6} {'oldest':>8} "
+            f"{'done':>6} {'wait p50':>9} {'wait p95':>9} {'run p50':>8} {'run p95':>8}"
+        )
+        for name, row in sorted(stats.items()):
+            self.stdout.write(
+                f"{name:<28} {row['queued']:>7} {row['ready']:>6} {row['running']:>7} {row['failed']:>6} "
+                f"{_seconds(row['oldest_wait'] if row['ready'] else None):>8} {row['done']:>6} "
+                f"{_seconds(row.get('wait_p50')):>9} {_seconds(row.get('wait_p95')):>9} "
+                f"{_seconds(row.get('run_p50')):>8} {_seconds(row.get('run_p95')):>8}"
+            )
@@ -0,0 +1,29 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs until stopped."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help="Jobs run at once.")
+        parser.add_argument('--processes', action='store_true',
+                            help="Run jobs in processes rather than threads (for CPU-bound jobs).")
+        parser.add_argument('--job', action='append', dest='names', help="Only run jobs with this name (repeatable).")
+        parser.add_argument('--poll-interval', type=float, default=1, help="Seconds between polls when idle.")
+        parser.add_argument('--burst', action='store_true', help="Exit once no job is ready.")
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=options['concurrency'],
+            processes=options['processes'],
+            names=options['names'],
+            poll_interval=options['poll_interval'],
+        )
+        # Finish the jobs in flight on shutdown rather than leaving them to their leases
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: worker.stop())
+        worker.run(burst=options['burst'])
@@ -0,0 +1,29 @@
+from monitoring.metrics import PROMETHEUS_AVAILABLE
+
+if PROMETHEUS_AVAILABLE:
+    from prometheus_client.core import GaugeMetricFamily
+
+
+class JobQueueCollector:
+    """Reports job queue depth and the wait of the oldest ready job at scrape time."""
+
+    def collect(self):
+        from .models import Job
+        from .queue import queue_stats
+
+        depth = GaugeMetricFamily(
+            'sealevel_job_queue_depth',
+            'Jobs by name and status (ready: queued and due now).',
+            labels=['job', 'status'],
+        )
+        oldest = GaugeMetricFamily(
+            'sealevel_job_oldest_ready_seconds',
+            'How long the oldest ready job has been waiting for a worker.',
+            labels=['job'],
+        )
+        for name, stats in sorted(queue_stats().items()):
+            for status in (Job.QUEUED, 'ready', Job.RUNNING, Job.FAILED):
+                depth.add_metric([name, status], stats[status])
+            oldest.add_metric([name], stats['oldest_wait'])
+        yield depth
+        yield oldest
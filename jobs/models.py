@@ -0,0 +1,47 @@
+from django.db import models
+
+
+class Job(models.Model):
+    """
+    One call of a registered job function (see jobs.registry), waiting in
+    the queue, running under a worker's lease, or finished.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    # Lower runs first
+    priority = models.SmallIntegerField(default=100)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # Not claimed before this; pushed back by the retry backoff
+    run_after = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    # A running job whose lease has expired belonged to a worker that died,
+    # and is claimed again
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Claiming: the next ready jobs in priority order
+            models.Index(fields=['status', 'priority', 'run_after', 'id'], name='job_claim'),
+            # Stats and pruning of finished jobs
+            models.Index(fields=['status', 'finished_at'], name='job_finished'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} {self.name} ({self.status})"
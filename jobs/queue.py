@@ -0,0 +1,181 @@
+"""
+A job queue in the database.
+
+enqueue writes a Job row inside the caller's transaction, so a job exists
+exactly when the work that needs it committed. Workers claim ready jobs
+in priority order with SELECT ... FOR UPDATE SKIP LOCKED, so several of
+them never wait on or take the same rows. Databases without SKIP LOCKED
+(SQLite) claim each job with a conditional UPDATE instead, which is safe
+because they only have one writer at a time. A claimed job is leased to
+its worker for JOBS_LEASE_SECONDS, renewed while it runs; a job whose
+lease runs out is claimed again. Failures are retried with exponential
+backoff until the job's max_attempts.
+"""
+
+import logging
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Job
+from .registry import get_jobs, run
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE = 10
+BACKOFF_CAP = 3600
+
+
+def enqueue(name, *args, priority=None, delay=None, max_attempts=None, unique=False):
+    """
+    Queue job ``name`` to be called with ``args``, after ``delay`` (a
+    timedelta) if given. With JOBS_EAGER it runs in this process instead,
+    once the current transaction commits. ``unique`` skips queueing when
+    the same call is already queued or running; it is a check, not a lock,
+    so the job itself must still tolerate running twice.
+    """
+    spec = get_jobs()[name]
+    if settings.JOBS_EAGER:
+        transaction.on_commit(lambda: _run_eagerly(name, args))
+        return None
+    if unique and Job.objects.filter(name=name, args=list(args), status__in=(Job.QUEUED, Job.RUNNING)).exists():
+        return None
+    return Job.objects.create(
+        name=name,
+        args=list(args),
+        priority=spec.priority if priority is None else priority,
+        max_attempts=max_attempts or spec.max_attempts,
+        run_after=timezone.now() + (delay or timedelta()),
+    )
+
+
+def _run_eagerly(name, args):
+    try:
+        run(name, args)
+    except Exception:
+        logger.exception("Job %s%r failed", name, tuple(args))
+
+
+def _ready(now, names):
+    jobs = Job.objects.filter(
+        Q(status=Job.QUEUED, run_after__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now)
+    )
+    if names:
+        jobs = jobs.filter(name__in=names)
+    return jobs.order_by('priority', 'run_after', 'id')
+
+
+def claim(worker_id, limit, names=None):
+    """Lease up to ``limit`` ready jobs to ``worker_id`` and return them."""
+    now = timezone.now()
+    lease = {
+        'status': Job.RUNNING, 'locked_by': worker_id, 'started_at': now,
+        'locked_until': now + timedelta(seconds=settings.JOBS_LEASE_SECONDS),
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            jobs = list(_ready(now, names).select_for_update(skip_locked=True)[:limit])
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(attempts=F('attempts') + 1, **lease)
+    else:
+        jobs = []
+        for job in _ready(now, names)[:limit]:
+            # Only one claimer can move the row from the state it read
+            if Job.objects.filter(pk=job.pk, status=job.status, locked_until=job.locked_until).update(
+                    attempts=F('attempts') + 1, **lease):
+                jobs.append(job)
+    for job in jobs:
+        job.attempts += 1
+        for field, value in lease.items():
+            setattr(job, field, value)
+    return jobs
+
+
+def renew(worker_id, job_ids):
+    """Extend the lease on jobs ``worker_id`` is still running."""
+    Job.objects.filter(pk__in=job_ids, locked_by=worker_id, status=Job.RUNNING).update(
+        locked_until=timezone.now() + timedelta(seconds=settings.JOBS_LEASE_SECONDS),
+    )
+
+
+def complete(job):
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        status=Job.DONE, finished_at=timezone.now(), locked_until=None, last_error='',
+    )
+
+
+def backoff(attempts):
+    """Seconds before retry number ``attempts``, with jitter so failures don't retry in step."""
+    return random.uniform(0.5, 1) * min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempts - 1))
+
+
+def fail(job, error):
+    """Record a failed attempt; queue a retry unless the job is out of attempts."""
+    now = timezone.now()
+    update = {'last_error': repr(error), 'locked_until': None}
+    if job.attempts < job.max_attempts:
+        update.update(status=Job.QUEUED, run_after=now + timedelta(seconds=backoff(job.attempts)))
+    else:
+        logger.error("Job %s %s%r failed for good: %r", job.pk, job.name, tuple(job.args), error)
+        update.update(status=Job.FAILED, finished_at=now)
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(**update)
+
+
+def prune(older_than=None):
+    """Delete jobs that finished successfully more than ``older_than`` ago."""
+    older_than = older_than or timedelta(hours=settings.JOBS_KEEP_DONE_HOURS)
+    deleted, _ = Job.objects.filter(status=Job.DONE, finished_at__lt=timezone.now() - older_than).delete()
+    return deleted
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def queue_stats(window=timedelta(hours=1)):
+    """
+    Per job name: jobs queued, ready, running and failed, how long the
+    oldest ready one has waited, and over jobs finished within ``window``,
+    the median and 95th percentile wait (ready to started) and run time.
+    """
+    now = timezone.now()
+    stats = {}
+
+    def entry(name):
+        return stats.setdefault(name, Counter())
+
+    for name, status, count in (
+        Job.objects.filter(status__in=(Job.QUEUED, Job.RUNNING, Job.FAILED))
+        .values_list('name', 'status').annotate(Count('id')).order_by()
+    ):
+        entry(name)[status] = count
+    for name, count, oldest in (
+        Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+        .values_list('name').annotate(Count('id'), Min('run_after')).order_by()
+    ):
+        entry(name)['ready'] = count
+        entry(name)['oldest_wait'] = (now - oldest).total_seconds()
+
+    finished = {}
+    for name, run_after, started_at, finished_at in (
+        Job.objects.filter(status=Job.DONE, finished_at__gte=now - window)
+        .values_list('name', 'run_after', 'started_at', 'finished_at')
+        .iterator()
+    ):
+        waits, runs = finished.setdefault(name, ([], []))
+        waits.append(max(0.0, (started_at - run_after).total_seconds()))
+        runs.append((finished_at - started_at).total_seconds())
+    for name, (waits, runs) in finished.items():
+        waits.sort()
+        runs.sort()
+        name_stats = entry(name)
+        name_stats['done'] = len(runs)
+        name_stats['wait_p50'], name_stats['wait_p95'] = _percentile(waits, 0.5), _percentile(waits, 0.95)
+        name_stats['run_p50'], name_stats['run_p95'] = _percentile(runs, 0.5), _percentile(runs, 0.95)
+    return stats
@@ -0,0 +1,62 @@
+"""
+Job functions, registered by name in ``<app>/jobs.py``::
+
+    @register('files.process_upload', priority=10)
+    def process_upload(file_id):
+        ...
+
+and queued with ``jobs.queue.enqueue('files.process_upload', file.pk)``.
+Arguments are stored as JSON, so pass ids rather than model instances.
+
+Worker processes import this module to run jobs, before Django is set up,
+so models are only imported inside functions.
+"""
+
+import logging
+from collections import namedtuple
+
+from django.db import connections
+from django.utils.module_loading import autodiscover_modules
+
+from sealevel.db_router import pin_to_primary
+
+logger = logging.getLogger(__name__)
+
+JobSpec = namedtuple('JobSpec', 'func priority max_attempts')
+
+JOBS = {}
+
+
+def register(name, priority=100, max_attempts=5):
+    """Register the decorated function as job ``name``; lower priorities run first."""
+    def decorator(func):
+        JOBS[name] = JobSpec(func, priority, max_attempts)
+        return func
+    return decorator
+
+
+def get_jobs():
+    autodiscover_modules('jobs')
+    return JOBS
+
+
+def run(name, args):
+    """Call job ``name`` with ``args``."""
+    # Jobs read rows committed moments ago, which replicas may not have yet
+    pin_to_primary()
+    return get_jobs()[name].func(*args)
+
+
+def execute(name, args):
+    """run(), as submitted to a worker's thread or process pool."""
+    try:
+        return run(name, args)
+    finally:
+        # Pool threads get their own connections; don't leak them
+        connections.close_all()
+
+
+def setup_process():
+    """Initializer for worker processes, which start without Django."""
+    import django
+    django.setup()
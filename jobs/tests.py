@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .queue import claim, enqueue, fail, queue_stats
+from .registry import register
+from .worker import Worker
+
+calls = []
+
+
+@register('tests.record', priority=100, max_attempts=2)
+def record(value):
+    if value == 'boom':
+        raise ValueError(value)
+    calls.append(value)
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_claims_ready_jobs_by_priority_once(self):
+        low = enqueue('tests.record', 'low')
+        high = enqueue('tests.record', 'high', priority=1)
+        enqueue('tests.record', 'later', delay=timedelta(hours=1))
+
+        self.assertEqual(claim('a', 10), [high, low])
+        self.assertEqual(claim('b', 10), [])
+
+        # A worker that died leaves its lease to run out
+        Job.objects.filter(pk=low.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        [reclaimed] = claim('b', 10)
+        self.assertEqual((reclaimed, reclaimed.attempts, reclaimed.locked_by), (low, 2, 'b'))
+
+    def test_failures_back_off_then_give_up(self):
+        job = enqueue('tests.record', 'boom')
+        [claimed] = claim('a', 1)
+        fail(claimed, ValueError('boom'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_after, timezone.now())
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        [claimed] = claim('a', 1)
+        fail(claimed, ValueError('boom'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_worker_runs_jobs_and_reports_stats(self):
+        for value in ('one', 'two', 'boom'):
+            enqueue('tests.record', value)
+        Worker(concurrency=2, poll_interval=0.01).run(burst=True)
+
+        self.assertCountEqual(calls, ['one', 'two'])
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 2)
+        stats = queue_stats()['tests.record']
+        self.assertEqual((stats['done'], stats['queued'], stats['ready']), (2, 1, 0))
+        self.assertIsNotNone(stats['run_p95'])
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_jobs_run_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            enqueue('tests.record', 'now')
+        self.assertEqual(calls, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual((calls, Job.objects.count()), (['now'], 0))
@@ -0,0 +1,92 @@
+"""
+The job worker behind ``manage.py run_jobs``: claims jobs as pool slots
+free up, runs them on a thread or (spawned) process pool, and records
+each outcome. Threads suit jobs that wait on I/O or the chain; processes
+suit CPU-bound ones, at the cost of a Django start per process.
+"""
+
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from monitoring.metrics import JOB_DURATION, JOB_WAIT
+from . import queue
+from .registry import execute, setup_process
+
+logger = logging.getLogger(__name__)
+
+PRUNE_INTERVAL = 3600
+
+
+class Worker:
+
+    def __init__(self, concurrency=4, processes=False, names=None, poll_interval=1.0):
+        self.concurrency = concurrency
+        self.processes = processes
+        self.names = names
+        self.poll_interval = poll_interval
+        self.id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.stopping = threading.Event()
+
+    def _pool(self):
+        if self.processes:
+            # Spawn rather than fork, as for previews
+            return ProcessPoolExecutor(
+                max_workers=self.concurrency, mp_context=multiprocessing.get_context('spawn'),
+                initializer=setup_process,
+            )
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job')
+
+    def run(self, burst=False):
+        """Work until stop() is called, or with ``burst`` until no job is ready."""
+        in_flight = {}
+        renewed = pruned = 0.0
+        logger.info("Job worker %s started", self.id)
+        with self._pool() as pool:
+            while True:
+                claimed = []
+                if not self.stopping.is_set() and len(in_flight) < self.concurrency:
+                    close_old_connections()
+                    claimed = queue.claim(self.id, self.concurrency - len(in_flight), self.names)
+                    for job in claimed:
+                        JOB_WAIT.labels(job.name).observe(max(0.0, (job.started_at - job.run_after).total_seconds()))
+                        in_flight[pool.submit(execute, job.name, job.args)] = (job, time.monotonic())
+                if not in_flight:
+                    if self.stopping.is_set() or (burst and not claimed):
+                        break
+                    self.stopping.wait(self.poll_interval)
+                    continue
+
+                # Claim again as soon as a slot frees up, or on the next poll
+                done, _ = wait(in_flight, timeout=0 if claimed else self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, started = in_flight.pop(future)
+                    error = future.exception()
+                    JOB_DURATION.labels(job.name, 'failed' if error else 'done').observe(time.monotonic() - started)
+                    if error is None:
+                        queue.complete(job)
+                    else:
+                        logger.warning("Job %s %s%r failed (attempt %d): %r",
+                                       job.pk, job.name, tuple(job.args), job.attempts, error)
+                        queue.fail(job, error)
+
+                now = time.monotonic()
+                if in_flight and now - renewed > settings.JOBS_LEASE_SECONDS / 3:
+                    queue.renew(self.id, [job.pk for job, _ in in_flight.values()])
+                    renewed = now
+                if now - pruned > PRUNE_INTERVAL:
+                    queue.prune()
+                    pruned = now
+        logger.info("Job worker %s stopped", self.id)
+
+    def stop(self):
+        """Stop claiming; run() returns once the jobs in flight finish."""
+        self.stopping.set()
@@ -0,0 +1,79 @@
+# monitoring/admin.py
+
+from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+
+from sealevel.paginator import EstimatedCountPaginator
+
+from .models import RequestProfile
+from .profiling import decompress_queries, decompress_stacks
+
+TOP_STACKS = 25
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'rpc_ms', 'trigger', 'download_link')
+    list_filter = ('trigger', 'method', 'created_at')
+    search_fields = ('^path', 'view_name')
+    date_hierarchy = 'created_at'
+    list_select_related = ('user',)
+    ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    exclude = ('stacks', 'queries')
+    readonly_fields = (
+        'created_at', 'method', 'path', 'view_name', 'status_code', 'user', 'trigger',
+        'duration_ms', 'query_count', 'query_ms', 'rpc_ms', 'sample_count',
+        'hot_stacks', 'sql', 'rpc_waits', 'download_link',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view), name='monitoring_requestprofile_download'),
+        ]
+        return urls + super().get_urls()
+
+    def download_view(self, request, pk):
+        """Serve the profile in folded-stack form for flamegraph tooling."""
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(decompress_stacks(profile.stacks), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename=profile-{profile.pk}.folded'
+        return response
+
+    @admin.display(description='Profile')
+    def download_link(self, obj):
+        url = reverse('admin:monitoring_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">Download</a>', url)
+
+    @admin.display(description='Hottest stacks')
+    def hot_stacks(self, obj):
+        lines = decompress_stacks(obj.stacks).splitlines()[:TOP_STACKS]
+        if not lines:
+            return '-'
+        rows = (line.rsplit(' ', 1) for line in lines)
+        return format_html(
+            '<table>{}</table>',
+            format_html_join('', '<tr><td>{}</td><td><code>{}</code></td></tr>', ((count, stack) for stack, count in rows)),
+        )
+
+    @admin.display(description='SQL')
+    def sql(self, obj):
+        queries = decompress_queries(obj.queries)
+        if not queries:
+            return '-'
+        return format_html(
+            '<table>{}</table>',
+            format_html_join('', '<tr><td>{}&nbsp;ms</td><td><code>{}</code></td></tr>', queries),
+        )
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class MonitoringConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "monitoring"
+
+    def ready(self):
+        from .metrics import PROMETHEUS_AVAILABLE, register_scrape_collector
+        if PROMETHEUS_AVAILABLE:
+            from .collectors import ReplicaLagCollector
+            register_scrape_collector(ReplicaLagCollector())
@@ -0,0 +1,20 @@
+from monitoring.metrics import PROMETHEUS_AVAILABLE
+
+if PROMETHEUS_AVAILABLE:
+    from prometheus_client.core import GaugeMetricFamily
+
+
+class ReplicaLagCollector:
+    """Reports each read replica's replay lag at scrape time."""
+
+    def collect(self):
+        from sealevel.db_router import replica_lags
+
+        gauge = GaugeMetricFamily(
+            'sealevel_db_replica_lag_seconds',
+            'Seconds each read replica is behind the primary.',
+            labels=['alias'],
+        )
+        for alias, lag in replica_lags().items():
+            gauge.add_metric([alias], lag)
+        yield gauge
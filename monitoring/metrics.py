@@ -0,0 +1,195 @@
+import os
+import time
+from contextlib import contextmanager
+
+from .profiling import current_trace
+
+# prometheus_client is optional so the app still boots without it;
+# every metric then degrades to a no-op.
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+        multiprocess,
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, *args, **kwargs):
+        pass
+
+    def inc(self, *args, **kwargs):
+        pass
+
+    def dec(self, *args, **kwargs):
+        pass
+
+    def set(self, *args, **kwargs):
+        pass
+
+
+def _histogram(name, documentation, labelnames=(), **kwargs):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    return Histogram(name, documentation, labelnames, **kwargs)
+
+
+def _counter(name, documentation, labelnames=()):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    return Counter(name, documentation, labelnames)
+
+
+def _gauge(name, documentation, labelnames=(), multiprocess_mode='livesum'):
+    if not PROMETHEUS_AVAILABLE:
+        return _NoopMetric()
+    return Gauge(name, documentation, labelnames, multiprocess_mode=multiprocess_mode)
+
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500)
+
+REQUEST_LATENCY = _histogram(
+    'sealevel_http_request_duration_seconds',
+    'Time spent handling a request, by view.',
+    ('view', 'method', 'status'),
+)
+REQUEST_DB_QUERIES = _histogram(
+    'sealevel_http_request_db_queries',
+    'Number of SQL queries issued per request, by view.',
+    ('view',),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = _histogram(
+    'sealevel_http_request_db_duration_seconds',
+    'Time spent in SQL per request, by view.',
+    ('view',),
+)
+DOWNLOAD_BYTES = _counter(
+    'sealevel_download_bytes_total',
+    'Bytes streamed to clients by file downloads.',
+)
+RPC_LATENCY = _histogram(
+    'sealevel_solana_rpc_duration_seconds',
+    'Solana RPC call latency, by method.',
+    ('method',),
+)
+RPC_ERRORS = _counter(
+    'sealevel_solana_rpc_errors_total',
+    'Solana RPC calls that raised, by method.',
+    ('method',),
+)
+RPC_RETRIES = _counter(
+    'sealevel_solana_rpc_retries_total',
+    'Solana RPC calls retried after a failure, by method.',
+    ('method',),
+)
+RPC_BREAKER_STATE = _gauge(
+    'sealevel_solana_rpc_breaker_state',
+    'Circuit breaker state (0 closed, 1 half-open, 2 open), worst worker.',
+    ('breaker',),
+    multiprocess_mode='livemax',
+)
+RPC_ENDPOINT_LATENCY = _gauge(
+    'sealevel_solana_rpc_endpoint_latency_seconds',
+    'Moving average latency of each Solana RPC endpoint, worst worker.',
+    ('endpoint',),
+    multiprocess_mode='livemax',
+)
+RPC_ENDPOINT_EJECTIONS = _counter(
+    'sealevel_solana_rpc_endpoint_ejections_total',
+    'Times a Solana RPC endpoint was taken out of rotation for rate limiting us.',
+    ('endpoint',),
+)
+AUDIT_BACKLOG = _gauge(
+    'sealevel_audit_backlog',
+    'Audit events accepted but not yet written to the chain.',
+)
+JOB_WAIT = _histogram(
+    'sealevel_job_wait_seconds',
+    'Time from a job being ready to a worker starting it, by job.',
+    ('job',),
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600),
+)
+JOB_DURATION = _histogram(
+    'sealevel_job_duration_seconds',
+    'Time spent running a job, by job and outcome.',
+    ('job', 'outcome'),
+)
+
+# Collectors queried at scrape time, for numbers that live in the database
+# rather than in any one worker (see register_scrape_collector)
+_scrape_collectors = []
+
+
+def register_scrape_collector(collector):
+    """Add an object with a prometheus_client-style collect() to /metrics."""
+    _scrape_collectors.append(collector)
+
+
+@contextmanager
+def observe_rpc(method):
+    """Time a Solana RPC call and count it as an error if it raises."""
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        RPC_ERRORS.labels(method).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        RPC_LATENCY.labels(method).observe(elapsed)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.record_rpc(method, elapsed, error)
+
+
+class QueryStats:
+    """
+    Execute wrapper (see ``connection.execute_wrapper``) that counts the
+    queries issued while it is installed and the time spent in them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def render_metrics():
+    """
+    Return the exposition body for this process, or for all gunicorn workers
+    when PROMETHEUS_MULTIPROC_DIR is set.
+    """
+    if not PROMETHEUS_AVAILABLE:
+        return b''
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    scraped = CollectorRegistry(auto_describe=False)
+    for collector in _scrape_collectors:
+        scraped.register(collector)
+    return generate_latest(registry) + generate_latest(scraped)
@@ -0,0 +1,128 @@
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+
+from .metrics import QueryStats, REQUEST_DB_QUERIES, REQUEST_DB_TIME, REQUEST_LATENCY
+from .profiling import RequestTrace, compress_queries, compress_stacks, current_trace, get_sampler
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """Install ``wrapper`` on every database connection (replicas included)."""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper))
+        yield
+
+
+class MetricsMiddleware:
+    """Record latency and SQL usage for every request, labelled by view name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryStats()
+        start = time.perf_counter()
+        with wrap_queries(queries):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        # Label by route name rather than path so the series stay bounded;
+        # view_name is the dotted view path for unnamed routes
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+
+        REQUEST_LATENCY.labels(view, request.method, str(response.status_code)).observe(duration)
+        REQUEST_DB_QUERIES.labels(view).observe(queries.count)
+        REQUEST_DB_TIME.labels(view).observe(queries.duration)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in request profiler. A random PROFILING_SAMPLE_RATE fraction of
+    requests has its call stack and SQL captured from the start; when
+    PROFILING_SLOW_MS is set, every other request is watched and captured
+    only once it has run that long. Sampled or slow requests are saved as
+    RequestProfile rows along with their SQL and Solana RPC waits. No query
+    wrapper is installed on a request until it is sampled or slow.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.slow_threshold = settings.PROFILING_SLOW_MS / 1000
+        self.interval = settings.PROFILING_INTERVAL_MS / 1000
+
+    def __call__(self, request):
+        sampled = random.random() < self.sample_rate
+        if not sampled and not self.slow_threshold:
+            return self.get_response(request)
+
+        sampler = get_sampler(self.interval)
+        ident = threading.get_ident()
+        trace = RequestTrace()
+        wrapper = trace.record_query
+        # Connections are per thread, so take this thread's now for the
+        # sampler to install the wrapper on if the request turns slow
+        databases = [connections[alias] for alias in connections]
+
+        def capture():
+            for connection in databases:
+                connection.execute_wrappers.append(wrapper)
+
+        start = time.perf_counter()
+        if sampled:
+            capture()
+        token = current_trace.set(trace)
+        sampler.watch(ident, start if sampled else start + self.slow_threshold, None if sampled else capture)
+        try:
+            response = self.get_response(request)
+        finally:
+            stacks = sampler.unwatch(ident)
+            current_trace.reset(token)
+            for connection in databases:
+                if wrapper in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(wrapper)
+        duration = time.perf_counter() - start
+
+        if sampled or duration >= self.slow_threshold:
+            self.save_profile(request, response, 'sampled' if sampled else 'slow', duration, trace, stacks)
+        return response
+
+    def save_profile(self, request, response, trigger, duration, trace, stacks):
+        from .models import RequestProfile
+
+        match = getattr(request, 'resolver_match', None)
+        user = getattr(request, 'user', None)
+        try:
+            RequestProfile.objects.create(
+                method=request.method,
+                path=request.path[:512],
+                view_name=(match.view_name or '') if match else '',
+                status_code=response.status_code,
+                user=user if user is not None and user.is_authenticated else None,
+                trigger=trigger,
+                duration_ms=duration * 1000,
+                query_count=trace.query_count,
+                query_ms=trace.query_time * 1000,
+                rpc_ms=trace.rpc_time * 1000,
+                sample_count=sum(stacks.values()),
+                stacks=compress_stacks(stacks),
+                queries=compress_queries(trace.queries),
+                rpc_waits=trace.rpc_waits,
+            )
+        except DatabaseError:
+            # Never fail a request because its profile couldn't be stored
+            logger.exception("Could not save request profile for %s", request.path)
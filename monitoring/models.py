@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import models
+
+
+class RequestProfile(models.Model):
+    TRIGGER_CHOICES = [
+        ('sampled', 'Sampled'),
+        ('slow', 'Slow request'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=512)
+    view_name = models.CharField(max_length=200, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField(default=0)
+    query_ms = models.FloatField(default=0)
+    rpc_ms = models.FloatField(default=0)
+    sample_count = models.PositiveIntegerField(default=0)
+    # zlib-compressed folded stacks ("a;b;c 12" per line) and [ms, sql] pairs
+    stacks = models.BinaryField(blank=True)
+    queries = models.BinaryField(blank=True)
+    rpc_waits = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
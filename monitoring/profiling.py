@@ -0,0 +1,152 @@
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from contextvars import ContextVar
+
+# Set while a profiled request is running so that RPC helpers can report
+# how long they waited (see metrics.observe_rpc).
+current_trace = ContextVar('current_trace', default=None)
+
+MAX_STACK_DEPTH = 128
+MAX_RECORDED_QUERIES = 500
+MAX_SQL_LENGTH = 2000
+
+
+class RequestTrace:
+    """
+    SQL and RPC waits collected for a single profiled request. Its
+    record_query wrapper is only installed once the request is sampled or
+    turns slow, so the queries it counts are the ones from then on.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.query_count = 0
+        self.query_time = 0.0
+        self.rpc_waits = []
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.query_count += 1
+            self.query_time += elapsed
+            if len(self.queries) < MAX_RECORDED_QUERIES:
+                self.queries.append([round(elapsed * 1000, 3), sql[:MAX_SQL_LENGTH]])
+
+    def record_rpc(self, method, elapsed, error=False):
+        self.rpc_waits.append([method, round(elapsed * 1000, 3), error])
+
+    @property
+    def rpc_time(self):
+        return sum(wait[1] for wait in self.rpc_waits) / 1000
+
+
+def _fold(frame):
+    """Render a frame's call stack root-first in flamegraph "folded" form."""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler(threading.Thread):
+    """
+    Background thread that periodically samples the stacks of the request
+    threads registered with watch(). It sleeps on an event while nothing is
+    being watched, and until the earliest watched request is due, so
+    unprofiled traffic pays only for a dict insert/remove.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='request-profiler', daemon=True)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._watched = {}
+        self._wakeup = threading.Event()
+
+    def watch(self, ident, start_at, on_due=None):
+        """
+        Sample thread ``ident`` from ``start_at`` (a perf_counter time) on.
+        ``on_due`` is called once, from the sampler thread, when it is due.
+        """
+        with self._lock:
+            self._watched[ident] = [start_at, Counter(), on_due]
+        self._wakeup.set()
+
+    def unwatch(self, ident):
+        with self._lock:
+            _, stacks, _ = self._watched.pop(ident, (None, Counter(), None))
+        return stacks
+
+    def _wait(self, timeout=None):
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def run(self):
+        while True:
+            with self._lock:
+                next_due = min((watch[0] for watch in self._watched.values()), default=None)
+            if next_due is None:
+                self._wait()
+                continue
+            now = time.perf_counter()
+            if now < next_due:
+                # Woken early by a new watch(), which may be due sooner
+                self._wait(next_due - now)
+                continue
+
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, watch in self._watched.items():
+                    start_at, stacks, on_due = watch
+                    if now < start_at:
+                        continue
+                    if on_due is not None:
+                        # Under the lock, so it can't run after unwatch()
+                        watch[2] = None
+                        on_due()
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[_fold(frame)] += 1
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler(interval):
+    # Started lazily so each gunicorn worker gets its own thread after fork
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None or not _sampler.is_alive():
+            _sampler = StackSampler(interval)
+            _sampler.start()
+    return _sampler
+
+
+def compress_stacks(stacks):
+    folded = '\n'.join(f"{stack} {count}" for stack, count in stacks.most_common())
+    return zlib.compress(folded.encode('utf-8'), 9)
+
+
+def decompress_stacks(data):
+    return zlib.decompress(bytes(data)).decode('utf-8') if data else ''
+
+
+def compress_queries(queries):
+    return zlib.compress(json.dumps(queries).encode('utf-8'), 9)
+
+
+def decompress_queries(data):
+    return json.loads(zlib.decompress(bytes(data))) if data else []
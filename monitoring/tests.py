@@ -0,0 +1,162 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import time
+from contextlib import nullcontext
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.http import FileResponse, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from files.models import File
+from sealevel.perf import TemporaryMediaMixin, mock_solana
+from users.models import User
+from .metrics import PROMETHEUS_AVAILABLE
+from .middleware import MetricsMiddleware, ProfilingMiddleware
+from .models import RequestProfile
+from .profiling import RequestTrace, decompress_queries
+
+if PROMETHEUS_AVAILABLE:
+    from prometheus_client import REGISTRY
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@skipUnless(PROMETHEUS_AVAILABLE, "prometheus_client is not installed")
+class MetricsTests(TemporaryMediaMixin, TestCase):
+
+    def test_requests_are_recorded_by_view(self):
+        labels = {'view': 'login', 'method': 'GET', 'status': '200'}
+        before = sample('sealevel_http_request_duration_seconds_count', **labels)
+        self.client.get(reverse('login'))
+        self.assertEqual(sample('sealevel_http_request_duration_seconds_count', **labels), before + 1)
+
+    def test_queries_are_counted_on_every_database(self):
+        installed = []
+
+        def connection(alias):
+            database = mock.Mock()
+            database.execute_wrapper.side_effect = lambda wrapper: installed.append((alias, wrapper)) or nullcontext()
+            return database
+
+        databases = {'default': connection('default'), 'replica1': connection('replica1')}
+
+        def view(request):
+            # Queries on either connection go through the same counter
+            for _, wrapper in installed:
+                wrapper(lambda *args: None, 'SELECT 1', (), False, {})
+            return HttpResponse()
+
+        before = sample('sealevel_http_request_db_queries_sum', view='unmatched')
+        with mock.patch('monitoring.middleware.connections', databases):
+            MetricsMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual([alias for alias, _ in installed], ['default', 'replica1'])
+        self.assertEqual(sample('sealevel_http_request_db_queries_sum', view='unmatched'), before + 2)
+
+    def test_download_bytes_count_what_was_sent(self):
+        patient = User.objects.create_user('patient@example.com', None)
+        content = b'x' * (FileResponse.block_size * 3)
+        file = File.objects.create(owner=patient, uploaded_by=patient,
+                                   uploaded_file=ContentFile(content, name='scan.bin'))
+        self.client.force_login(patient)
+
+        before = sample('sealevel_download_bytes_total')
+        with mock_solana():
+            response = self.client.get(reverse('file-download', args=[file.pk]))
+            self.assertEqual(sample('sealevel_download_bytes_total'), before)
+            # The client goes away after the first block
+            next(iter(response.streaming_content))
+            response.close()
+        self.assertEqual(sample('sealevel_download_bytes_total'), before + FileResponse.block_size)
+
+    def test_metrics_endpoint_requires_the_token(self):
+        with override_settings(METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            self.assertEqual(self.client.get(reverse('metrics'), headers={'authorization': 'Bearer wrong'}).status_code, 403)
+            response = self.client.get(reverse('metrics'), headers={'authorization': 'Bearer s3cret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'sealevel_http_request_duration_seconds', response.content)
+
+
+@skipUnless(PROMETHEUS_AVAILABLE, "prometheus_client is not installed")
+class GunicornHookTests(SimpleTestCase):
+
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir, ignore_errors=True)
+        # The config sets the variable with setdefault; keep it out of this process
+        environ = mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': self.metrics_dir})
+        environ.start()
+        self.addCleanup(environ.stop)
+        spec = importlib.util.spec_from_file_location('gunicorn_conf', os.path.join(settings.BASE_DIR, 'gunicorn.conf.py'))
+        self.config = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.config)
+
+    def test_starting_clears_metrics_from_the_last_run(self):
+        stale = os.path.join(self.metrics_dir, 'counter_123.db')
+        open(stale, 'wb').close()
+        self.config.on_starting(server=None)
+        self.assertTrue(os.path.isdir(self.metrics_dir))
+        self.assertFalse(os.path.exists(stale))
+
+    def test_exited_workers_are_marked_dead(self):
+        with mock.patch('prometheus_client.multiprocess.mark_process_dead') as mark_process_dead:
+            self.config.child_exit(server=None, worker=mock.Mock(pid=4321))
+        mark_process_dead.assert_called_once_with(4321)
+
+
+class ProfilingTests(TestCase):
+
+    def profile(self, view, **overrides):
+        options = {'PROFILING_ENABLED': True, 'PROFILING_SAMPLE_RATE': 0, 'PROFILING_SLOW_MS': 0,
+                   'PROFILING_INTERVAL_MS': 1, **overrides}
+        with override_settings(**options):
+            middleware = ProfilingMiddleware(view)
+        return middleware(RequestFactory().get('/profiled/'))
+
+    def query_view(self, sleep=0):
+        def view(request):
+            User.objects.count()
+            if sleep:
+                time.sleep(sleep)
+                User.objects.exists()
+            return HttpResponse()
+        return view
+
+    def test_sampled_request_is_saved_with_its_sql(self):
+        self.profile(self.query_view(), PROFILING_SAMPLE_RATE=1)
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.trigger, profile.query_count), ('sampled', 1))
+        self.assertIn('COUNT', decompress_queries(profile.queries)[0][1])
+
+    def test_fast_unsampled_request_keeps_no_sql(self):
+        traces = []
+
+        def trace(*args):
+            traces.append(RequestTrace(*args))
+            return traces[-1]
+
+        with mock.patch('monitoring.middleware.RequestTrace', trace):
+            self.profile(self.query_view(), PROFILING_SLOW_MS=10000)
+        self.assertFalse(RequestProfile.objects.exists())
+        # Its queries never went through the trace
+        self.assertEqual((traces[0].query_count, traces[0].queries), (0, []))
+
+    def test_slow_request_keeps_sql_from_the_threshold(self):
+        self.profile(self.query_view(sleep=0.05), PROFILING_SLOW_MS=20)
+        profile = RequestProfile.objects.get()
+        # Only the query after the request turned slow
+        self.assertEqual((profile.trigger, profile.query_count), ('slow', 1))
+        self.assertIn('LIMIT', decompress_queries(profile.queries)[0][1])
+        self.assertEqual(connection.execute_wrappers, [])
+
+    def test_disabled_without_setting(self):
+        with self.assertRaises(MiddlewareNotUsed), override_settings(PROFILING_ENABLED=False):
+            ProfilingMiddleware(self.query_view())
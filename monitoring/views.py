@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .metrics import CONTENT_TYPE_LATEST, render_metrics
+
+
+def metrics_view(request):
+    # Scrapers authenticate with a bearer token when METRICS_TOKEN is set
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        header = request.headers.get('Authorization', '')
+        if not constant_time_compare(header, f'Bearer {token}'):
+            return HttpResponseForbidden("Invalid metrics token.")
+
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
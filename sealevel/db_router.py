@@ -0,0 +1,121 @@
+"""
+Primary/replica database routing.
+
+Writes go to ``default``. Reads go to a random healthy replica (any alias
+listed in REPLICA_DATABASES) unless the current request must see its own
+writes: once a request writes, the rest of it reads from the primary, and
+ReplicaStickinessMiddleware sets a cookie that keeps the same browser on
+the primary for REPLICA_STICKY_SECONDS. Replicas lagging more than
+REPLICA_MAX_LAG seconds are skipped.
+"""
+
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+# True once the current request has written, or when it arrived pinned
+_pinned = ContextVar('pinned_to_primary', default=False)
+_wrote = ContextVar('wrote_to_primary', default=False)
+
+STICKY_COOKIE = 'sealevel_primary'
+# How often each process re-measures replica lag
+LAG_CHECK_INTERVAL = 5
+
+
+def replica_lags():
+    """Replay lag in seconds per replica alias (0 for non-Postgres replicas)."""
+    lags = {}
+    for alias in settings.REPLICA_DATABASES:
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            lags[alias] = 0.0
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+                "WHERE pg_is_in_recovery()"
+            )
+            row = cursor.fetchone()
+        lags[alias] = float(row[0]) if row else 0.0
+    return lags
+
+
+class _LagCache:
+    def __init__(self):
+        self.checked_at = 0.0
+        self.healthy = None
+        self._lock = threading.Lock()
+
+    def healthy_replicas(self):
+        with self._lock:
+            if self.healthy is None or time.monotonic() - self.checked_at >= LAG_CHECK_INTERVAL:
+                self.checked_at = time.monotonic()
+                try:
+                    lags = replica_lags()
+                except Exception:
+                    # A replica we can't even measure is not one to read from
+                    lags = {alias: float('inf') for alias in settings.REPLICA_DATABASES}
+                self.healthy = [alias for alias, lag in lags.items() if lag <= settings.REPLICA_MAX_LAG]
+            return self.healthy
+
+
+_lag_cache = _LagCache()
+
+
+def pin_to_primary():
+    """Read from the primary for the rest of this request (or task)."""
+    _pinned.set(True)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _pinned.get() or not settings.REPLICA_DATABASES:
+            return 'default'
+        # Reads inside a transaction on the primary must see its writes
+        if connections['default'].in_atomic_block:
+            return 'default'
+        replicas = _lag_cache.healthy_replicas()
+        return random.choice(replicas) if replicas else 'default'
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        return db not in settings.REPLICA_DATABASES
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pins requests to the primary for REPLICA_STICKY_SECONDS after the same
+    browser wrote, so a user always sees their own uploads and shares.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned_token = _pinned.set(request.COOKIES.get(STICKY_COOKIE) is not None)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get():
+                response.set_cookie(
+                    STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                    httponly=True, samesite='Lax', secure=request.is_secure(),
+                )
+            return response
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
@@ -0,0 +1,42 @@
+"""
+Paginator for admin changelists over tables too large to COUNT(*).
+"""
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the Postgres planner's row estimate (pg_class.reltuples) instead of
+    COUNT(*) when the queryset is unfiltered and the table is large, where
+    an exact count means a full scan. Filtered querysets, small tables and
+    other databases get the exact count.
+    """
+
+    # Below this many estimated rows the exact count is cheap enough
+    estimate_threshold = 100_000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimated_count()
+        if estimate is not None and estimate >= self.estimate_threshold:
+            return estimate
+        return super().count
+
+    def estimated_count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where or query.distinct:
+            return None
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(self.object_list.model._meta.db_table)],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 until the table has been analyzed
+        return row[0] if row and row[0] >= 0 else None
@@ -0,0 +1,93 @@
+"""
+Helpers for the tests: query budgets, peak memory, a temporary media
+directory and a mocked Solana layer.
+"""
+
+import os
+import shutil
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from files.models import File
+
+# Data sizes each budget is checked at; a budget that only holds for small
+# sizes is an N+1.
+DATA_SIZES = (1, 10, 50)
+
+
+class QueryBudgetMixin:
+    """TestCase mixin adding assertQueryBudget() and assertPeakMemory()."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget, label=''):
+        with CaptureQueriesContext(connection) as captured:
+            yield captured
+        if len(captured) > budget:
+            queries = '\n'.join(
+                f"{index}. {query['sql']}" for index, query in enumerate(captured.captured_queries, start=1)
+            )
+            self.fail(f"{label or 'Block'} ran {len(captured)} queries, budget is {budget}:\n{queries}")
+
+    @contextmanager
+    def assertPeakMemory(self, limit, label=''):
+        tracemalloc.start()
+        try:
+            yield
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        if peak > limit:
+            self.fail(f"{label or 'Block'} peaked at {peak} bytes of Python memory, limit is {limit}")
+
+
+class TemporaryMediaMixin:
+    """
+    TestCase mixin that keeps uploads, archives and previews in a temporary
+    directory (``media_root``) for the test class, removed once it has run,
+    and adds make_files().
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        media = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            ARCHIVE_ROOT=os.path.join(cls.media_root, 'archive'),
+            PREVIEW_ROOT=os.path.join(cls.media_root, 'previews'),
+        )
+        media.enable()
+        cls.addClassCleanup(media.disable)
+        super().setUpClass()
+
+    def make_files(self, count, owner, uploaded_by=None, content=b'data'):
+        return [
+            File.objects.create(
+                owner=owner,
+                uploaded_by=uploaded_by or owner,
+                uploaded_file=ContentFile(content, name=f'doc{index}.txt'),
+            )
+            for index in range(count)
+        ]
+
+
+@contextmanager
+def mock_solana():
+    """
+    Enable Solana logging in the views but replace the chain calls with
+    mocks, so tests can assert exactly which requests reach the network.
+    """
+    log_access = mock.AsyncMock()
+    retrieve_access_logs = mock.AsyncMock(return_value=([], None))
+    with override_settings(SOLANA_ENABLED=True), \
+            mock.patch('files.views.SOLANA_AVAILABLE', True), \
+            mock.patch('files.views.log_access', log_access), \
+            mock.patch('files.views.retrieve_access_logs', retrieve_access_logs):
+        yield mock.Mock(log_access=log_access, retrieve_access_logs=retrieve_access_logs)
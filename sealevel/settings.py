@@ -35,13 +35,102 @@ ALLOWED_HOSTS = get_env_var('DJANGO_ALLOWED_HOSTS', 'localhost,127.0.0.1,health.
 
 # Solana Settings (disabled for demo)
 SOLANA_ENABLED = get_env_var('SOLANA_ENABLED', 'False').lower() == 'true'
-SOLANA_RPC_ENDPOINT = get_env_var('SOLANA_RPC_ENDPOINT', 'https://api.devnet.solana.com')
+# Comma-separated; calls are routed to the fastest healthy endpoint
+SOLANA_RPC_ENDPOINTS = [
+    url.strip() for url in get_env_var('SOLANA_RPC_ENDPOINT', 'https://api.devnet.solana.com').split(',') if url.strip()
+]
 SOLANA_KEYPAIR = get_env_var('SOLANA_KEYPAIR', 'demo-keypair')
 SOLANA_PROGRAM_ID = get_env_var('SOLANA_PROGRAM_ID', 'demo-program-id')
 
+# Solana RPC resilience: per-call timeout and overall deadline (seconds),
+# retries for idempotent calls, and the circuit breaker that diverts audit
+# events to the local queue when the RPC keeps failing
+SOLANA_RPC_TIMEOUT = float(get_env_var('SOLANA_RPC_TIMEOUT', '3'))
+SOLANA_RPC_DEADLINE = float(get_env_var('SOLANA_RPC_DEADLINE', '6'))
+SOLANA_RPC_RETRIES = int(get_env_var('SOLANA_RPC_RETRIES', '2'))
+SOLANA_RPC_BACKOFF_BASE = float(get_env_var('SOLANA_RPC_BACKOFF_BASE', '0.2'))
+SOLANA_RPC_BACKOFF_CAP = float(get_env_var('SOLANA_RPC_BACKOFF_CAP', '2'))
+SOLANA_AUDIT_DEADLINE = float(get_env_var('SOLANA_AUDIT_DEADLINE', '8'))
+SOLANA_BREAKER_THRESHOLD = int(get_env_var('SOLANA_BREAKER_THRESHOLD', '5'))
+SOLANA_BREAKER_RESET = float(get_env_var('SOLANA_BREAKER_RESET', '30'))
+# Seconds a rate-limiting endpoint is ejected for when it sends no Retry-After,
+# and how many endpoints each transaction is sent to
+SOLANA_RPC_EJECT_SECONDS = float(get_env_var('SOLANA_RPC_EJECT_SECONDS', '30'))
+SOLANA_RPC_WRITE_FANOUT = int(get_env_var('SOLANA_RPC_WRITE_FANOUT', '2'))
+
+# Live Access Log Settings
+# Seconds between polls of a watched file's audit events (one poll per file per process)
+ACCESS_LOG_LIVE_POLL_INTERVAL = float(get_env_var('ACCESS_LOG_LIVE_POLL_INTERVAL', '2'))
+# Under WSGI the stream can't stay open; browsers reconnect after this many seconds
+ACCESS_LOG_LIVE_WSGI_RETRY = float(get_env_var('ACCESS_LOG_LIVE_WSGI_RETRY', '10'))
+
+# Metrics Settings
+# When set, /metrics requires an "Authorization: Bearer <token>" header
+METRICS_TOKEN = get_env_var('METRICS_TOKEN', '')
+
+# Profiling Settings
+# Sample PROFILING_SAMPLE_RATE of requests, plus any request slower than
+# PROFILING_SLOW_MS (0 disables the slow-request trigger). With the slow
+# trigger on, every request is registered with the sampler thread (a dict
+# insert/remove under a lock); its SQL is only wrapped and its stack only
+# sampled once it passes the threshold, so fast requests pay little more.
+PROFILING_ENABLED = get_env_var('PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILING_SAMPLE_RATE = float(get_env_var('PROFILING_SAMPLE_RATE', '0.01'))
+PROFILING_SLOW_MS = int(get_env_var('PROFILING_SLOW_MS', '0'))
+PROFILING_INTERVAL_MS = int(get_env_var('PROFILING_INTERVAL_MS', '5'))
+
+# Background Job Settings
+# Jobs (post-upload processing, restores) are run by `manage.py run_jobs`;
+# JOBS_EAGER runs them in the web process instead, once the request's
+# transaction commits, for development without a worker
+JOBS_EAGER = get_env_var('JOBS_EAGER', 'False').lower() == 'true'
+# A running job not renewed for this long is assumed lost and run again
+JOBS_LEASE_SECONDS = int(get_env_var('JOBS_LEASE_SECONDS', '300'))
+# Finished jobs kept for job_stats before the worker deletes them
+JOBS_KEEP_DONE_HOURS = int(get_env_var('JOBS_KEEP_DONE_HOURS', '24'))
+
+# File Pipeline Settings
+# Processes rendering thumbnails and previews (0 means one per core), and
+# where they are cached, keyed by content hash. Previews show patient data,
+# so they live outside MEDIA_ROOT and are only served by the preview view.
+PREVIEW_PROCESSES = int(get_env_var('PREVIEW_PROCESSES', '0'))
+PREVIEW_ROOT = get_env_var('PREVIEW_ROOT', os.path.join(BASE_DIR, 'previews'))
+
+# Storage Tiering Settings
+# Files not downloaded for TIER_COLD_DAYS are gzipped into ARCHIVE_ROOT,
+# which should sit on a cheaper volume than MEDIA_ROOT
+ARCHIVE_ROOT = get_env_var('ARCHIVE_ROOT', os.path.join(BASE_DIR, 'archive'))
+TIER_COLD_DAYS = int(get_env_var('TIER_COLD_DAYS', '30'))
+
+# Encryption at Rest Settings
+# 32 random bytes, urlsafe-base64 encoded, e.g. from
+# python -c "import base64, os; print(base64.urlsafe_b64encode(os.urandom(32)).decode())"
+# Uploads and archives are stored encrypted while it is set; files stored
+# without it stay readable. Losing it loses every file stored with it.
+STORAGE_ENCRYPTION_KEY = get_env_var('STORAGE_ENCRYPTION_KEY', '')
+
+# Share Link Settings
+# How long a revoked share link may keep working in other processes
+SHARE_LINK_REVOCATION_REFRESH = int(get_env_var('SHARE_LINK_REVOCATION_REFRESH', '30'))
+
+# Autocomplete Settings
+# How stale a user's cached contact index may get before new contacts are read
+AUTOCOMPLETE_REFRESH_SECONDS = int(get_env_var('AUTOCOMPLETE_REFRESH_SECONDS', '30'))
+
 # Media files configuration
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Uploads are hashed as they stream in, ahead of Django's own handlers, and
+# large ones encrypted on their way to the temporary file
+FILE_UPLOAD_HANDLERS = [
+    'files.uploads.HashingUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'files.uploads.EncryptingUploadHandler',
+]
+STORAGES = {
+    'default': {'BACKEND': 'files.storage.EncryptedFileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
 
 # Application definition
 INSTALLED_APPS = [
@@ -54,19 +143,14 @@ INSTALLED_APPS = [
     "rest_framework",
     "users",
     "files",
+    "monitoring",
+    "jobs",
+    "backfills",
+    # Always installed: it owns the local audit queue. The chain calls
+    # themselves stay behind SOLANA_ENABLED and the optional solana packages.
+    "access_log",
 ]
 
-# Conditionally add Solana-related apps only when enabled
-if SOLANA_ENABLED:
-    try:
-        import solana  # Test if solana package is available
-        INSTALLED_APPS.extend([
-            "access_log",
-            # "solana",  # Only add if this app actually exists
-        ])
-    except ImportError:
-        pass  # Solana packages not available, skip solana apps
-
 AUTH_USER_MODEL = 'users.User'
 
 LOGIN_URL = 'account/login'
@@ -74,12 +158,15 @@ LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'login'
 
 MIDDLEWARE = [
+    "monitoring.middleware.MetricsMiddleware",
+    "sealevel.db_router.ReplicaStickinessMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "monitoring.middleware.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -115,6 +202,22 @@ DATABASES = {
     )
 }
 
+# Read replicas: comma-separated database URLs, routed to by
+# sealevel.db_router. Locally a copy of db.sqlite3 works as a replica.
+REPLICA_DATABASES = []
+for index, url in enumerate(filter(None, get_env_var('DATABASE_REPLICA_URLS', '').split(',')), start=1):
+    alias = f"replica{index}"
+    DATABASES[alias] = dj_database_url.parse(url.strip(), conn_max_age=600, conn_health_checks=True)
+    # Tests see the primary's test database through every replica alias
+    DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ["sealevel.db_router.PrimaryReplicaRouter"]
+# After writing, a browser reads from the primary for this long
+REPLICA_STICKY_SECONDS = int(get_env_var('REPLICA_STICKY_SECONDS', '10'))
+# Replicas further behind than this are not read from
+REPLICA_MAX_LAG = float(get_env_var('REPLICA_MAX_LAG', '5'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -25,6 +25,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('users.urls')),
     path('files/', include('files.urls')),
+    path('', include('monitoring.urls')),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,36 @@
+// Suggests contacts for inputs marked data-autocomplete="<endpoint url>",
+// filling a <datalist> as the user types.
+document.querySelectorAll('input[data-autocomplete]').forEach(function (input) {
+    var list = document.createElement('datalist');
+    list.id = input.id + '-suggestions';
+    input.setAttribute('list', list.id);
+    input.after(list);
+
+    var timer = null;
+    var controller = null;
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            var query = input.value.trim();
+            if (!query) {
+                list.replaceChildren();
+                return;
+            }
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+            fetch(input.dataset.autocomplete + '?q=' + encodeURIComponent(query), {signal: controller.signal})
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    list.replaceChildren.apply(list, data.results.map(function (user) {
+                        var option = document.createElement('option');
+                        option.value = user.email;
+                        option.label = user.name;
+                        return option;
+                    }));
+                })
+                .catch(function () {});
+        }, 120);
+    });
+});
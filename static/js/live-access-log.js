@@ -0,0 +1,52 @@
+// Adds access log entries to elements marked data-live-log="<stream url>"
+// as they are recorded, and updates their status as the chain confirms them.
+var STATUS_LABELS = {
+    local: '📝 Recorded (not on blockchain)',
+    queued: '🕓 Queued for blockchain',
+    pending: '⏳ Awaiting confirmation',
+    failed: '⚠️ Not recorded',
+    confirmed: '⛓️ Verified on Solana',
+    finalized: '⛓️ Verified on Solana'
+};
+
+document.querySelectorAll('[data-live-log]').forEach(function (container) {
+    var source = new EventSource(container.dataset.liveLog);
+    source.addEventListener('access', function (message) {
+        var change = JSON.parse(message.data);
+        // Entries already on the page are matched by event, or by signature
+        // for those rendered with it
+        var selector = '[data-event="' + change.event + '"]';
+        if (change.signature) {
+            selector += ', [data-signature="' + change.signature + '"]';
+        }
+        var existing = document.querySelectorAll(':is(' + selector + ') .blockchain-badge');
+        if (existing.length) {
+            existing.forEach(function (badge) { badge.textContent = STATUS_LABELS[change.status]; });
+            return;
+        }
+        change.entries.forEach(function (entry) {
+            var row = document.createElement('div');
+            row.className = 'access-log-content mb-lg';
+            row.dataset.event = change.event;
+            row.dataset.signature = change.signature;
+            var header = document.createElement('div');
+            header.className = 'access-log-header';
+            var action = document.createElement('h3');
+            action.className = 'access-log-action';
+            action.textContent = entry.action;
+            var time = document.createElement('span');
+            time.className = 'access-log-time';
+            time.textContent = new Date(entry.timestamp).toLocaleString();
+            header.append(action, time);
+            var user = document.createElement('p');
+            user.className = 'access-log-user';
+            user.textContent = entry.user;
+            var badge = document.createElement('span');
+            badge.className = 'blockchain-badge';
+            badge.textContent = STATUS_LABELS[change.status];
+            row.append(header, user, badge);
+            container.prepend(row);
+        });
+        container.hidden = false;
+    });
+});
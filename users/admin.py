@@ -1,5 +1,14 @@
 from django.contrib import admin
+from sealevel.paginator import EstimatedCountPaginator
 from .models import User
 
-# Register your models here.
-admin.site.register(User)
\ No newline at end of file
+
+@admin.register(User)
+class UserAdmin(admin.ModelAdmin):
+    list_display = ('email', 'role', 'is_staff', 'date_joined')
+    list_filter = ('role', 'is_staff')
+    # Backed by a trigram index on Postgres (see migration 0003)
+    search_fields = ('email',)
+    ordering = ('-date_joined',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
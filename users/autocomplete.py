@@ -0,0 +1,143 @@
+"""
+Email and name autocomplete over a user's contacts.
+
+A provider's contacts are the patients they have uploaded for; a patient's
+are the people they have shared files with and the providers who uploaded
+for them. Each user's contacts are kept in memory in every process that
+serves them, as a sorted list of lowercase prefix keys, so a lookup is a
+bisect plus a short walk. The index is refreshed incrementally: it
+remembers the highest File and FileAccess ids it has seen and only reads
+newer rows, at most every AUTOCOMPLETE_REFRESH_SECONDS or as soon as
+mark_stale() bumps the user's version. Revocations bump a second counter,
+the generation, which makes every process rebuild from scratch. Both are
+columns on the User row, so each worker reads them with the request's own
+user and no extra query.
+"""
+
+import bisect
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F, Max
+
+from .models import User
+
+MAX_RESULTS = 10
+# Full rebuilds pick up renamed users
+INDEX_TTL = 60 * 60
+# Users whose indexes each process keeps, least recently used dropped first
+MAX_INDEXES = 1000
+
+
+class ContactIndex:
+    def __init__(self, generation=None):
+        # Sorted (key, user id) pairs; each contact appears under its email,
+        # its full name and its last name
+        self.keys = []
+        self.users = {}
+        self.file_mark = 0
+        self.access_mark = 0
+        self.generation = generation
+        self.version = None
+        self.built_at = time.monotonic()
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def add(self, contacts):
+        """Add (id, email, first name, last name) tuples."""
+        keys = []
+        for user_id, email, first_name, last_name in contacts:
+            if user_id in self.users:
+                continue
+            name = f'{first_name} {last_name}'.strip()
+            self.users[user_id] = (email, name)
+            keys.extend((key, user_id) for key in {email.lower(), name.lower(), last_name.lower()} if key)
+        # A new list rather than sorting in place, so searches running in
+        # other threads never see it half sorted. Timsort merges the
+        # appended run in linear time.
+        self.keys = sorted(self.keys + keys)
+
+    def search(self, prefix, limit=MAX_RESULTS):
+        prefix = prefix.lower()
+        keys = self.keys
+        results, seen = [], set()
+        for index in range(bisect.bisect_left(keys, (prefix,)), len(keys)):
+            key, user_id = keys[index]
+            if not key.startswith(prefix) or len(results) >= limit:
+                break
+            if user_id not in seen:
+                seen.add(user_id)
+                email, name = self.users[user_id]
+                results.append({'email': email, 'name': name})
+        return results
+
+
+def _new_contact_ids(user, index):
+    """Ids of contacts from File and FileAccess rows newer than the index's marks."""
+    from files.models import File, FileAccess
+
+    marks = File.objects.filter(uploaded_by=user).aggregate(uploaded=Max('pk'))
+    marks.update(File.objects.filter(owner=user).aggregate(owned=Max('pk')))
+    marks.update(FileAccess.objects.filter(file__owner=user).aggregate(shared=Max('pk')))
+    file_mark = max(marks['uploaded'] or 0, marks['owned'] or 0)
+    access_mark = marks['shared'] or 0
+
+    ids = set()
+    if file_mark > index.file_mark:
+        new_files = File.objects.filter(pk__gt=index.file_mark, pk__lte=file_mark)
+        if user.is_provider:
+            ids.update(new_files.filter(uploaded_by=user).values_list('owner_id', flat=True).distinct())
+        ids.update(new_files.filter(owner=user).values_list('uploaded_by_id', flat=True).distinct())
+    if access_mark > index.access_mark:
+        ids.update(
+            FileAccess.objects.filter(file__owner=user, pk__gt=index.access_mark, pk__lte=access_mark)
+            .values_list('user_id', flat=True).distinct()
+        )
+    ids.discard(None)
+    ids.discard(user.pk)
+    index.file_mark, index.access_mark = file_mark, access_mark
+    return ids
+
+
+_indexes = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_index(user):
+    """``user``'s index, brought up to date with the counters on ``user`` as loaded."""
+    version, generation = user.contacts_version, user.contacts_generation
+    now = time.monotonic()
+    with _lock:
+        index = _indexes.get(user.pk)
+        if index is None or index.generation != generation or now - index.built_at >= INDEX_TTL:
+            index = _indexes[user.pk] = ContactIndex(generation)
+            while len(_indexes) > MAX_INDEXES:
+                _indexes.popitem(last=False)
+        _indexes.move_to_end(user.pk)
+
+    with index.lock:
+        if (index.checked_at is None or index.version != version
+                or now - index.checked_at >= settings.AUTOCOMPLETE_REFRESH_SECONDS):
+            new_ids = _new_contact_ids(user, index) - index.users.keys()
+            if new_ids:
+                index.add(User.objects.filter(pk__in=new_ids).values_list('pk', 'email', 'first_name', 'last_name'))
+            index.version, index.checked_at = version, now
+    return index
+
+
+def mark_stale(*users, rebuild=False):
+    """
+    Make the next lookup for ``users``, in any process, pick up their
+    newest contacts; with ``rebuild``, drop contacts they no longer have.
+    """
+    field = 'contacts_generation' if rebuild else 'contacts_version'
+    User.objects.filter(pk__in={user.pk for user in users}).update(**{field: F(field) + 1})
+
+
+def suggest(user, prefix, limit=MAX_RESULTS):
+    prefix = prefix.strip()
+    if not prefix:
+        return []
+    return get_index(user).search(prefix, limit)
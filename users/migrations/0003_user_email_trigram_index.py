@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+# Admin search on email (from the user, file and file access changelists)
+# runs UPPER(email::text) LIKE UPPER('%term%'); a trigram GIN index over
+# that expression serves it on Postgres. A no-op elsewhere.
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_user_email_trgm "
+        "ON users_user USING gin (UPPER(email::text) gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS users_user_email_trgm")
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("users", "0002_user_role"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
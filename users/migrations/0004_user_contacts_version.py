@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_email_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='contacts_generation',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='contacts_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
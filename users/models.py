@@ -35,6 +35,10 @@ class User(AbstractBaseUser, PermissionsMixin):
         ('provider', 'Provider'),
     ]
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='patient')
+    # Bumped by users.autocomplete.mark_stale. They live on the row every
+    # request loads anyway, so every worker sees a bump on its next lookup.
+    contacts_version = models.PositiveIntegerField(default=0, editable=False)
+    contacts_generation = models.PositiveIntegerField(default=0, editable=False)
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
@@ -1,3 +1,97 @@
+from django.db.models import F
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from files.models import File, FileAccess
+from sealevel.perf import DATA_SIZES, QueryBudgetMixin, TemporaryMediaMixin, mock_solana
+from . import autocomplete
+from .autocomplete import mark_stale
+from .models import User
+
+
+class HomePerformanceTests(TemporaryMediaMixin, QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user('patient@example.com', None)
+        self.provider = User.objects.create_user('provider@example.com', None, role='provider')
+
+    def make_accessed_files(self, count):
+        File.objects.all().delete()
+        for file in self.make_files(count, self.patient, uploaded_by=self.provider):
+            FileAccess.objects.create(file=file, user=self.provider)
+
+    def test_patient_home_budget(self):
+        self.client.force_login(self.patient)
+        for size in DATA_SIZES:
+            with self.subTest(size=size):
+                self.make_accessed_files(size)
+                with mock_solana() as solana, self.assertQueryBudget(8, f'home with {size} files'):
+                    response = self.client.get(reverse('home'))
+                self.assertEqual(response.status_code, 200)
+                solana.log_access.assert_not_called()
+
+    def test_provider_home_budget(self):
+        self.client.force_login(self.provider)
+        for size in DATA_SIZES:
+            with self.subTest(size=size):
+                self.make_accessed_files(size)
+                with mock_solana() as solana, self.assertQueryBudget(6, f'home with {size} files'):
+                    response = self.client.get(reverse('home'))
+                self.assertEqual(response.status_code, 200)
+                solana.log_access.assert_not_called()
+
+
+class AutocompleteTests(QueryBudgetMixin, TestCase):
+
+    def setUp(self):
+        autocomplete._indexes.clear()
+        self.provider = User.objects.create_user('provider@example.com', None, role='provider')
+        self.patients = [
+            User.objects.create_user(f'patient{index}@example.com', None, first_name='Ann', last_name=f'Lee{index}')
+            for index in range(3)
+        ]
+        self.stranger = User.objects.create_user('patient-stranger@example.com', None)
+        for patient in self.patients[:2]:
+            File.objects.create(owner=patient, uploaded_by=self.provider, uploaded_file='user_files/doc.txt')
+        self.client.force_login(self.provider)
+
+    def suggest(self, query):
+        response = self.client.get(reverse('user-autocomplete'), {'q': query})
+        return [result['email'] for result in response.json()['results']]
+
+    def test_scoped_to_patients_served(self):
+        self.assertEqual(self.suggest('PATIENT'), ['patient0@example.com', 'patient1@example.com'])
+        self.assertEqual(self.suggest('lee1'), ['patient1@example.com'])
+        self.assertEqual(self.suggest('ann lee0'), ['patient0@example.com'])
+
+    def test_cached_between_requests_and_refreshed_incrementally(self):
+        self.suggest('p')
+        with self.assertQueryBudget(2, 'cached autocomplete'):
+            self.suggest('pa')
+
+        File.objects.create(owner=self.patients[2], uploaded_by=self.provider, uploaded_file='user_files/new.txt')
+        mark_stale(self.provider)
+        self.assertIn('patient2@example.com', self.suggest('patient'))
+
+    def test_bump_from_another_worker_is_seen(self):
+        self.suggest('p')
+        File.objects.create(owner=self.patients[2], uploaded_by=self.provider, uploaded_file='user_files/new.txt')
+        # Another worker's mark_stale() only touches the row
+        User.objects.filter(pk=self.provider.pk).update(contacts_version=F('contacts_version') + 1)
+        self.assertIn('patient2@example.com', self.suggest('patient'))
+
+    def test_revoked_contacts_disappear(self):
+        patient = self.patients[0]
+        file = File.objects.get(owner=patient)
+        FileAccess.objects.create(file=file, user=self.stranger)
+        self.client.force_login(patient)
+        self.assertEqual(self.suggest('patient-stranger'), ['patient-stranger@example.com'])
+
+        self.client.get(reverse('revoke-access', args=[file.pk, self.stranger.pk]))
+        self.assertEqual(self.suggest('patient-stranger'), [])
+
+    def test_search_starts_at_the_prefix(self):
+        index = autocomplete.ContactIndex()
+        index.add((user_id, f'user{user_id:06}@example.com', '', '') for user_id in range(1, 100001))
+        self.assertEqual([result['email'] for result in index.search('user09999', limit=3)],
+                         [f'user0{n}@example.com' for n in (99990, 99991, 99992)])
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import SignUp, home, landing
+from .views import SignUp, home, landing, user_autocomplete
 from django.contrib.auth import views as auth_views
 
 urlpatterns = [
@@ -8,4 +8,5 @@ urlpatterns = [
     path('login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login'),
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('home/', home, name='home'),
+    path('users/autocomplete/', user_autocomplete, name='user-autocomplete'),
 ]
\ No newline at end of file
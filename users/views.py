@@ -1,11 +1,13 @@
 # users/views.py
 
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login
 from .forms import UserCreationForm
 from django.contrib.auth.decorators import login_required
 from django.views.generic.edit import CreateView
 from django.urls import reverse_lazy
+from .autocomplete import suggest
 
 class SignUp(CreateView):
     form_class = UserCreationForm
@@ -43,7 +45,7 @@ def home(request):
     
     # Recent files
     if user.is_provider:
-        recent_files = File.objects.filter(uploaded_by=user).order_by('-uploaded_date')[:3]
+        recent_files = File.objects.filter(uploaded_by=user).select_related('owner').order_by('-uploaded_date')[:3]
     else:
         recent_files = File.objects.filter(owner=user).order_by('-uploaded_date')[:3]
     
@@ -67,6 +69,11 @@ def home(request):
     
     return render(request, 'users/home.html', context)
 
+@login_required
+def user_autocomplete(request):
+    """Contacts of the current user whose email or name starts with ?q."""
+    return JsonResponse({'results': suggest(request.user, request.GET.get('q', ''))})
+
 def landing(request):
     return render(request, '../templates/users/landing.html')
 